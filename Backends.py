@@ -0,0 +1,123 @@
+import importlib
+from Framebuffer import Framebuffer
+
+# Front end backends. A Machine talks to three of them, and only through these methods:
+#
+#   display  .framebuffer, which the machine draws into directly, render_screen() once a
+#            frame to present the rows it marked dirty, and quit()
+#   audio    play() / stop() as the sound timer starts and runs out
+#   input    get_events() once a frame, returning {'quit': bool, 'keydown': bool} plus
+#            key: True for every key pressed since the last call, and is_pressed(key) for
+#            a held key or is_pressed() for the next key released this frame (Fx0A)
+#
+# Backends are registered by module and class name and only imported when selected, so
+# a headless worker never pays for importing or initialising pygame or SDL:
+#
+#   display, audio, keyboard = Backends.select('null')
+#
+# Backends are duck typed: any object with those methods will do.
+
+
+# The part every display shares: the framebuffer, and the sprite and clear calls that
+# just forward to it. Renderers only add render_screen() and quit().
+class Display:
+    LWIDTH = Framebuffer.LWIDTH
+    LHEIGHT = Framebuffer.LHEIGHT
+
+    # colours as RGB, by palette index (see Framebuffer.get_pixel). 2 and 3 are the
+    # XO-CHIP colours, pixels on in plane 1 only and in both planes.
+    WHITE = (255, 204, 2)
+    BLACK = (153, 103, 0)
+    SHADE = (204, 102, 0)
+    BRIGHT = (255, 255, 204)
+    PALETTE = [BLACK, WHITE, SHADE, BRIGHT]
+
+    def __init__(self):
+        self.framebuffer = Framebuffer(self.LWIDTH, self.LHEIGHT)
+
+
+    # x,y - the coordinates of the top left corner of the sprite
+    # sprite - the sprite data to write (bytearray of up to 16 bytes)
+    # returns True if any pixel was flipped from 1 to 0
+    def update_screen(self, x:int, y:int, sprite:bytearray) -> bool:
+        # For N rows:
+        #     Get the Nth byte of sprite data, counting from the memory address in the I register (I is not incremented)
+        #     For each of the 8 pixels/bits in this sprite row (from left to right, ie. from most to least significant bit):
+        #         If the current pixel in the sprite row is on and the pixel at coordinates X,Y on the screen is also on, turn off the pixel and set VF to 1
+        #         Or if the current pixel in the sprite row is on and the screen pixel is not, draw the pixel at the X and Y coordinates
+        #         If you reach the right edge of the screen, stop drawing this row
+        #         Increment X (VX is not incremented)
+        #     Increment Y (VY is not incremented)
+        #     Stop if you reach the bottom edge of the screen
+
+        return self.framebuffer.draw(x, y, sprite)
+
+
+    def clear_screen(self):
+        self.framebuffer.clear()
+
+
+    def render_screen(self):
+        pass
+
+
+    # stable digest of the current screen contents
+    def screen_hash(self) -> str:
+        import hashlib
+        return hashlib.sha1(self.framebuffer.to_bytes()).hexdigest()
+
+
+    def quit(self):
+        pass
+
+
+# kind -> backend name -> 'module:class'
+REGISTRY = {
+    'display': {
+        'pygame': 'PygameDisplay:Display',
+        'sdl': 'SDLDisplay:Display',
+        'null': 'Headless:NullDisplay',
+        'memory': 'Headless:MemoryDisplay',
+    },
+    'audio': {
+        'pygame': 'Beeper:Beeper',
+        'sdl': 'Headless:NullBeeper', # no SDL mixer binding, SDL front ends run silent
+        'null': 'Headless:NullBeeper',
+        'memory': 'Headless:MemoryBeeper',
+    },
+    'input': {
+        'pygame': 'Keyboard:Keyboard',
+        'sdl': 'SDLKeyboard:Keyboard',
+        'null': 'Headless:ScriptedKeyboard',
+        'memory': 'Headless:MemoryKeyboard',
+    },
+}
+
+
+def register(kind:str, name:str, path:str):
+    if kind not in REGISTRY:
+        raise ValueError(f"Unknown backend kind: {kind}")
+    REGISTRY[kind][name] = path
+
+
+def names(kind:str) -> list:
+    return sorted(REGISTRY[kind])
+
+
+# the backend class, importing its module now
+def load(kind:str, name:str):
+    if name not in REGISTRY.get(kind, {}):
+        raise ValueError(f"Unknown {kind} backend: {name}")
+    module, _, cls = REGISTRY[kind][name].partition(':')
+    return getattr(importlib.import_module(module), cls)
+
+
+def create(kind:str, name:str, *args, **kwargs):
+    return load(kind, name)(*args, **kwargs)
+
+
+# display, audio and input instances, each from 'name' unless picked separately
+def select(name:str, sound_file:str = None, display:str = None, audio:str = None, input:str = None):
+    return (create('display', display or name),
+            create('audio', audio or name, sound_file),
+            create('input', input or name))
@@ -1,13 +1,19 @@
 import pygame
 
+# The mixer is only opened, and the sound file decoded, the first time a sound plays:
+# most roms never beep, and opening the audio device is the slowest part of startup.
 class Beeper():
 
     def __init__(self,sound_file:str):
-        pygame.mixer.init()
-        self.beep = pygame.mixer.Sound(sound_file)
+        self.sound_file = sound_file
+        self.beep = None
 
     def play(self):
+        if self.beep is None:
+            pygame.mixer.init()
+            self.beep = pygame.mixer.Sound(self.sound_file)
         self.beep.play(10) # loop 10x
     
     def stop(self):
-        self.beep.stop()
+        if self.beep is not None:
+            self.beep.stop()
@@ -0,0 +1,288 @@
+import zlib
+import struct
+import operator
+from Backends import Display
+
+# Headless video capture: frames go straight to an encoder as they are produced.
+#
+# CaptureDisplay is a display backend whose render_screen() hands the framebuffer to a
+# Capture once a frame. The Capture scales the screen up to the output size, coloured
+# with Display.PALETTE (WHITE/BLACK, plus the XO-CHIP colours), folds identical
+# consecutive frames into one longer frame, and writes each frame out as soon as the next
+# different one arrives. Only the pending frame and the last written one are held, so
+# memory stays the same however long the clip runs.
+#
+# Writers:
+#   GifWriter   animated GIF, frames cropped to the band of rows that changed
+#   ApngWriter  animated PNG, the same cropping (the output file has to be seekable, the
+#               frame count in its header is filled in on close)
+#   RawWriter   raw RGB24 frames at a constant 60 fps for an external encoder, e.g.
+#               ffmpeg -f rawvideo -pix_fmt rgb24 -s 256x128 -r 60 -i - out.mp4
+#               Raw video has no frame durations, so repeated frames are written again.
+#
+#   python Headless.py game.ch8 --cycles 60000 --capture preview.gif
+
+FRAME_RATE = 60
+SCALE = 4
+
+
+class GifWriter:
+
+    def __init__(self, file, width:int, height:int, palette:list):
+        self.file = file
+        self.time = 0 # frames written so far, for rounding delays to centiseconds
+        colours = b''.join(bytes(colour) for colour in palette)
+        bits = max((len(palette) - 1).bit_length(), 1)
+        colours = colours.ljust(3 << bits, b'\0')
+        self.min_code_size = max(bits, 2)
+        file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0x80 | (bits - 1), 0, 0) + colours)
+        # loop forever
+        file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+
+    # pixels: palette indices of rows y .. y + height, 'frames' 60 Hz frames long
+    def write(self, pixels:bytes, width:int, y:int, height:int, frames:int):
+        start = self.time
+        self.time += frames
+        delay = round(self.time * 100 / FRAME_RATE) - round(start * 100 / FRAME_RATE)
+        data = lzw_encode(pixels, self.min_code_size)
+        blocks = [data[i:i + 255] for i in range(0, len(data), 255)]
+        image = (struct.pack('<BHHHHB', 0x2c, 0, y, width, height, 0) + bytes((self.min_code_size,))
+                 + b''.join(bytes((len(block),)) + block for block in blocks) + b'\0')
+        # a delay over the 16 bit limit (11 minutes) shows the same image again
+        while True:
+            part = min(delay, 0xffff)
+            # graphic control: keep the previous frame under this one (disposal 1)
+            self.file.write(struct.pack('<BBBBHBB', 0x21, 0xf9, 4, 0x04, part, 0, 0) + image)
+            delay -= part
+            if not delay:
+                break
+
+
+    def close(self):
+        self.file.write(b'\x3b')
+
+
+# GIF LZW, with the code table kept as (prefix code << 8 | byte) -> code
+def lzw_encode(pixels:bytes, min_code_size:int) -> bytes:
+    clear = 1 << min_code_size
+    end = clear + 1
+    out = bytearray()
+    bits = 0
+    count = 0
+
+    code_size = min_code_size + 1
+    table = {}
+    next_code = end + 1
+    bits |= clear << count
+    count += code_size
+
+    prefix = pixels[0]
+    for byte in pixels[1:]:
+        key = (prefix << 8) | byte
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        bits |= prefix << count
+        count += code_size
+        while count >= 8:
+            out.append(bits & 0xff)
+            bits >>= 8
+            count -= 8
+
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            if next_code > (1 << code_size) and code_size < 12:
+                code_size += 1
+        else:
+            bits |= clear << count
+            count += code_size
+            table = {}
+            next_code = end + 1
+            code_size = min_code_size + 1
+        prefix = byte
+
+    bits |= prefix << count
+    count += code_size
+    bits |= end << count
+    count += code_size
+    while count > 0:
+        out.append(bits & 0xff)
+        bits >>= 8
+        count -= 8
+    return bytes(out)
+
+
+class ApngWriter:
+
+    def __init__(self, file, width:int, height:int, palette:list):
+        self.file = file
+        self.width = width
+        self.sequence = 0
+        self.frames = 0
+        file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+        self.actl = file.tell()
+        self._chunk(b'acTL', struct.pack('>II', 0, 0))
+        self._chunk(b'PLTE', b''.join(bytes(colour) for colour in palette))
+
+
+    def _chunk(self, kind:bytes, data:bytes):
+        self.file.write(struct.pack('>I', len(data)) + kind + data
+                        + struct.pack('>I', zlib.crc32(kind + data)))
+
+
+    def write(self, pixels:bytes, width:int, y:int, height:int, frames:int):
+        # the delay is a 16 bit fraction: past that, whole seconds
+        delay = (frames, FRAME_RATE) if frames <= 0xffff else (min(round(frames / FRAME_RATE), 0xffff), 1)
+        self._chunk(b'fcTL', struct.pack('>IIIIIHHBB', self.sequence, width, height, 0, y, *delay, 0, 0))
+        self.sequence += 1
+        # each scanline starts with filter type 0
+        data = zlib.compress(b''.join(b'\0' + pixels[row:row + width]
+                                      for row in range(0, len(pixels), width)), 9)
+        if self.frames == 0:
+            self._chunk(b'IDAT', data)
+        else:
+            self._chunk(b'fdAT', struct.pack('>I', self.sequence) + data)
+            self.sequence += 1
+        self.frames += 1
+
+
+    def close(self):
+        self._chunk(b'IEND', b'')
+        end = self.file.tell()
+        self.file.seek(self.actl)
+        self._chunk(b'acTL', struct.pack('>II', self.frames, 0))
+        self.file.seek(end)
+
+
+class RawWriter:
+
+    def __init__(self, stream, width:int, height:int, palette:list):
+        self.stream = stream
+        self.width = width
+        self.height = height
+        # palette index -> RGB, applied with bytes.translate per channel
+        self.channels = [bytes(palette[index][channel] if index < len(palette) else 0 for index in range(256))
+                         for channel in range(3)]
+        self.frame = None # last full frame as RGB
+
+
+    def write(self, pixels:bytes, width:int, y:int, height:int, frames:int):
+        red, green, blue = (pixels.translate(table) for table in self.channels)
+        rgb = bytearray(len(pixels) * 3)
+        rgb[0::3] = red
+        rgb[1::3] = green
+        rgb[2::3] = blue
+        if self.frame is None:
+            self.frame = rgb
+        else:
+            start = y * self.width * 3
+            self.frame[start:start + len(rgb)] = rgb
+        for _ in range(frames):
+            self.stream.write(self.frame)
+
+
+    def close(self):
+        self.stream.flush()
+
+
+class Capture:
+
+    def __init__(self, writer_class, file, scale:int = SCALE, palette:list = None, close_file:bool = False):
+        self.file = file
+        self.close_file = close_file
+        self.width = Display.LWIDTH * scale
+        self.height = Display.LHEIGHT * scale
+        self.writer = writer_class(file, self.width, self.height, palette or Display.PALETTE)
+        self.screen = None   # framebuffer contents of the pending frame
+        self.pending = None  # its pixels, as palette indices
+        self.frames = 0      # how long it has been showing
+        self.written = None  # pixels of the last written frame
+        self.columns = {}    # framebuffer width -> itemgetter picking source pixels per output column
+
+
+    # record one 60 Hz frame
+    def add(self, framebuffer):
+        screen = framebuffer.to_bytes()
+        if screen == self.screen:
+            self.frames += 1
+            return
+        self._flush()
+        self.screen = screen
+        self.pending = self._pixels(framebuffer)
+        self.frames = 1
+
+
+    # nearest neighbour scaling to the output size, so hi-res screens keep the same size
+    def _pixels(self, framebuffer) -> bytes:
+        width = framebuffer.width
+        height = framebuffer.height
+        columns = self.columns.get(width)
+        if columns is None:
+            columns = self.columns[width] = operator.itemgetter(*(x * width // self.width for x in range(self.width)))
+        rows = [bytes(columns(framebuffer.index_row(y))) for y in range(height)]
+        return b''.join(rows[y * height // self.height] for y in range(self.height))
+
+
+    def _flush(self):
+        pending = self.pending
+        if pending is None:
+            return
+        width = self.width
+        written = self.written
+        if written is None:
+            top, bottom = 0, self.height
+        else:
+            # the band of output rows that differ from the last written frame
+            row_bytes = width
+            top = 0
+            while top < self.height and pending[top * row_bytes:(top + 1) * row_bytes] == written[top * row_bytes:(top + 1) * row_bytes]:
+                top += 1
+            bottom = self.height
+            while bottom > top and pending[(bottom - 1) * row_bytes:bottom * row_bytes] == written[(bottom - 1) * row_bytes:bottom * row_bytes]:
+                bottom -= 1
+            if top == bottom:
+                # the screen went back to what was written, or changed in ways that
+                # scaled out: still one row, so the time passes
+                top, bottom = 0, 1
+        self.writer.write(pending[top * width:bottom * width], width, top, bottom - top, self.frames)
+        self.written = pending
+        self.pending = None
+
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+        if self.close_file:
+            self.file.close()
+
+
+class CaptureDisplay(Display):
+
+    def __init__(self, capture:Capture):
+        super().__init__()
+        self.capture = capture
+
+    def render_screen(self):
+        self.capture.add(self.framebuffer)
+
+    def quit(self):
+        self.capture.close()
+
+
+WRITERS = {'.gif': GifWriter, '.png': ApngWriter, '.apng': ApngWriter}
+
+
+# a Capture writing to 'filename' in the format its extension names, or raw RGB frames
+# to 'stream'
+def open_capture(filename:str = None, stream = None, scale:int = SCALE) -> Capture:
+    if stream is not None:
+        return Capture(RawWriter, stream, scale)
+    extension = filename[filename.rfind('.'):].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Unknown capture format: {extension} (use {', '.join(sorted(WRITERS))})")
+    return Capture(WRITERS[extension], open(filename, 'wb'), scale, close_file=True)
@@ -0,0 +1,325 @@
+import sys
+import json
+import hashlib
+from State import State
+import Quirks
+from debug_utils import describe
+from Idle import is_idle_loop
+
+# Static disassembler and control-flow analyzer.
+#
+# Starting from the entry point, analyze() follows every path the code can take: jumps,
+# calls (and the return after them), and both sides of a skip. What is reached is code;
+# the rest of the rom is data, with the addresses loaded into I (Annn) labelled as
+# sprites. Code is split into basic blocks, and loops are found from the back edges of
+# a depth first walk of the block graph.
+#
+# The result is a plain dict that is written as JSON (the index) and can be handed to
+# Machine.prewarm, which decodes all the code and compiles the loops before the first
+# instruction runs:
+#
+#   python Disasm.py game.ch8 --index game.json > game.asm
+#
+# Bnnn targets depend on a register, so the walk stops there.
+#
+# The quirk profile's instruction set decides the memory size and which opcodes are
+# code. For XO-CHIP, F000 nnnn is one 4 byte instruction (with nnnn a sprite address)
+# and skips step over all of it.
+
+INDEX_VERSION = 1
+
+
+def opcode_at(ram, address:int) -> int:
+    return (ram[address] << 8) | ram[address + 1]
+
+
+def is_skip(opcode:int) -> bool:
+    n1 = opcode >> 12
+    nn = opcode & 0xff
+    return (n1 in (0x3, 0x4) or (n1 in (0x5, 0x9) and opcode & 0xf == 0)
+            or (n1 == 0xe and nn in (0x9e, 0xa1)))
+
+
+# bytes taken by an instruction: XO-CHIP F000 nnnn is the only 4 byte one
+def size(opcode:int, xochip:bool = False) -> int:
+    return 4 if xochip and opcode == 0xf000 else 2
+
+
+# (successors, ends block) of the instruction at 'address'; None means it is not an
+# instruction. 'ram' is needed for XO-CHIP, where a skip's distance depends on the
+# instruction after it.
+def successors(opcode:int, address:int, xochip:bool = False, ram = None):
+    n1 = opcode >> 12
+    nn = opcode & 0xff
+    nnn = opcode & 0xfff
+    following = address + size(opcode, xochip)
+    if xochip and (opcode == 0xf000 or opcode & 0xfff0 == 0x00d0 or (n1 == 0x5 and opcode & 0xf in (2, 3))
+                   or (n1 == 0xf and (nn in (0x01, 0x3a) or opcode == 0xf002))):
+        return [following], False
+    if opcode == 0x00e0:
+        return [following], False
+    if opcode == 0x00ee or opcode == 0x00fd or n1 == 0xb:
+        return [], True
+    if opcode & 0xfff0 == 0x00c0 or opcode in (0x00fb, 0x00fc, 0x00fe, 0x00ff):
+        return [following], False      # SUPER-CHIP scrolling and resolution
+    if n1 == 0x0:
+        return None
+    if n1 == 0x1:
+        return [nnn], True
+    if n1 == 0x2:
+        return [nnn, following], True
+    if is_skip(opcode):
+        skipped = size(opcode_at(ram, following), xochip) if xochip and following + 1 < len(ram) else 2
+        return [following, following + skipped], True
+    if n1 in (0x5, 0x9) or (n1 == 0x8 and opcode & 0xf not in (0, 1, 2, 3, 4, 5, 6, 7, 0xe)):
+        return None
+    if n1 == 0xe:
+        return None
+    if n1 == 0xf and opcode & 0xff not in (0x07, 0x0a, 0x15, 0x18, 0x1e, 0x29, 0x30, 0x33, 0x55, 0x65,
+                                           0x75, 0x85):
+        return None
+    return [following], False
+
+
+def analyze(rom:bytes, base:int = State.ROMSTART, quirks=None) -> dict:
+    quirks = Quirks.resolve(quirks)
+    xochip = quirks.instructions == 'xochip'
+    ram = bytearray(quirks.memory)
+    end = base + len(rom)
+    if end > len(ram):
+        raise ValueError(f"Rom too large for {quirks.instructions}: {len(rom)} bytes at {base:#x}")
+    ram[base:end] = rom
+
+    # walk every reachable instruction
+    code = {}                   # address -> opcode
+    leaders = {base}
+    calls = set()
+    jumps = set()
+    sprites = set()
+    invalid = set()
+    work = [base]
+    while work:
+        address = work.pop()
+        if address in code or address in invalid or not base <= address < end - 1:
+            continue
+        opcode = opcode_at(ram, address)
+        result = successors(opcode, address, xochip, ram)
+        if result is None:
+            invalid.add(address)
+            continue
+        code[address] = opcode
+        targets, ends = result
+
+        n1 = opcode >> 12
+        if n1 == 0x2:
+            calls.add(opcode & 0xfff)
+        elif n1 == 0x1:
+            jumps.add(opcode & 0xfff)
+        elif n1 == 0xa:
+            sprites.add(opcode & 0xfff)
+        elif xochip and opcode == 0xf000 and address + 3 < end:
+            sprites.add(opcode_at(ram, address + 2))
+        if ends:
+            leaders.update(targets)
+        work += targets
+
+    # basic blocks
+    blocks = []
+    for start in sorted(leaders & code.keys()):
+        address = start
+        while True:
+            ends = successors(code[address], address, xochip, ram)[1]
+            following = address + size(code[address], xochip)
+            if ends or following not in code or following in leaders:
+                break
+            address = following
+        last = address
+        exits, ends = successors(code[last], last, xochip, ram)
+        following = last + size(code[last], xochip)
+        if not ends:
+            exits = [following]
+        blocks.append({
+            'start': start,
+            'end': following,
+            'successors': sorted(target for target in set(exits) if target in code),
+        })
+    by_start = {block['start']: block for block in blocks}
+
+    loops = find_loops(by_start, base)
+    for loop in loops:
+        loop['idle'] = any(
+            code.get(address, 0) >> 12 == 1 and is_idle_loop(ram, address, code[address] & 0xfff)
+            for start in loop['blocks'] for address in range(start, by_start[start]['end'], 2))
+
+    code_bytes = set()
+    for address, opcode in code.items():
+        code_bytes.update(range(address, address + size(opcode, xochip)))
+    data = []
+    for address in range(base, end):
+        if address in code_bytes:
+            continue
+        if data and data[-1][1] == address:
+            data[-1][1] = address + 1
+        else:
+            data.append([address, address + 1])
+
+    return {
+        'version': INDEX_VERSION,
+        'sha1': hashlib.sha1(rom).hexdigest(),
+        'base': base,
+        'size': len(rom),
+        'instructions': quirks.instructions,
+        'entry': base,
+        'code': sorted(code),
+        'blocks': blocks,
+        'subroutines': sorted(target for target in calls if target in code),
+        'jump_targets': sorted(target for target in jumps if target in code),
+        'sprites': sorted(target for target in sprites if target not in code_bytes),
+        'loops': loops,
+        'data': data,
+        'invalid': sorted(invalid),
+    }
+
+
+# natural loops: for every back edge tail -> header found by a depth first walk, the
+# blocks that reach the tail without passing through the header
+def find_loops(by_start:dict, entry:int) -> list:
+    predecessors = {start: [] for start in by_start}
+    for block in by_start.values():
+        for target in block['successors']:
+            if target in predecessors:
+                predecessors[target].append(block['start'])
+
+    back_edges = []
+    state = {}                  # start -> 1 on the walk stack, 2 done
+    roots = [entry] + sorted(by_start)
+    for root in roots:
+        if root not in by_start or root in state:
+            continue
+        stack = [(root, iter(by_start[root]['successors']))]
+        state[root] = 1
+        while stack:
+            start, children = stack[-1]
+            for child in children:
+                if child not in by_start:
+                    continue
+                if state.get(child) == 1:
+                    back_edges.append((start, child))
+                elif child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(by_start[child]['successors'])))
+                    break
+            else:
+                state[start] = 2
+                stack.pop()
+
+    loops = []
+    for tail, header in back_edges:
+        body = {header, tail}
+        work = [tail]
+        while work:
+            start = work.pop()
+            if start == header:
+                continue
+            for predecessor in predecessors[start]:
+                if predecessor not in body:
+                    body.add(predecessor)
+                    work.append(predecessor)
+        loops.append({'header': header, 'tail': tail, 'blocks': sorted(body)})
+    return sorted(loops, key=lambda loop: (loop['header'], loop['tail']))
+
+
+def labels(index:dict) -> dict:
+    names = {index['entry']: 'start'}
+    for address in index['jump_targets']:
+        names[address] = f'L_{address:03X}'
+    for loop in index['loops']:
+        names[loop['header']] = f'loop_{loop["header"]:03X}'
+    for address in index['subroutines']:
+        names[address] = f'sub_{address:03X}'
+    for address in index['sprites']:
+        names[address] = f'sprite_{address:03X}'
+    return names
+
+
+def listing(rom:bytes, index:dict) -> str:
+    base = index['base']
+    names = labels(index)
+    code = set(index['code'])
+    xochip = index.get('instructions') == 'xochip'
+    lines = []
+
+    def target_name(opcode):
+        return names.get(opcode & 0xfff)
+
+    address = base
+    end = base + len(rom)
+    while address < end:
+        if address in names:
+            lines.append('')
+            lines.append(f'{names[address]}:')
+        if address in code:
+            opcode = (rom[address - base] << 8) | rom[address - base + 1]
+            text = describe(opcode)
+            name = target_name(opcode) if opcode >> 12 in (0x1, 0x2, 0xa) else None
+            if xochip and opcode == 0xf000:
+                # the 16 bit address is the second half of the instruction
+                target = (rom[address - base + 2] << 8) | rom[address - base + 3]
+                text += f' = {target:04X}'
+                if target in names:
+                    text += f'  ; {names[target]}'
+                lines.append(f'    {address:03X}: {opcode:04X} {target:04X}  {text}')
+                address += 4
+                continue
+            if name:
+                text += f'  ; {name}'
+            lines.append(f'    {address:03X}: {opcode:04X}  {text}')
+            address += 2
+            continue
+
+        # data runs until the next label or instruction, shown a byte per line so
+        # sprites can be read off the bit patterns
+        byte = rom[address - base]
+        pattern = f'{byte:08b}'.replace('0', '.').replace('1', '#')
+        lines.append(f'    {address:03X}: {byte:02X}    .byte {pattern}')
+        address += 1
+
+    return '\n'.join(lines).lstrip('\n') + '\n'
+
+
+def save_index(index:dict, filename:str):
+    with open(filename, 'w') as file:
+        json.dump(index, file, indent=1)
+
+
+def load_index(filename:str) -> dict:
+    with open(filename) as file:
+        index = json.load(file)
+    if index.get('version') != INDEX_VERSION:
+        raise ValueError(f"Unsupported index version: {index.get('version')}")
+    return index
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Disassemble a CHIP-8 rom and index its control flow.")
+    parser.add_argument("rom")
+    parser.add_argument("--index", help="write the block/loop index as JSON to this file")
+    parser.add_argument("--quirks", choices=sorted(Quirks.PROFILES), default=Quirks.DEFAULT,
+                        help="quirk profile, its instruction set decides what is code")
+    args = parser.parse_args(argv)
+
+    with open(args.rom, 'rb') as file:
+        rom = file.read()
+    index = analyze(rom, quirks=args.quirks)
+    if args.index:
+        save_index(index, args.index)
+    sys.stdout.write(listing(rom, index))
+    print(f"{len(index['code'])} instructions in {len(index['blocks'])} blocks, "
+          f"{len(index['subroutines'])} subroutines, {len(index['loops'])} loops, "
+          f"{sum(end - start for start, end in index['data'])} data bytes", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
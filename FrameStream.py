@@ -0,0 +1,232 @@
+import sys
+from Framebuffer import Framebuffer
+
+# Compressed frame stream for remote viewers.
+#
+# The Encoder turns the framebuffer, once a frame, into a packet holding only the rows
+# that changed, as XOR deltas against the previous frame, run-length encoded. Every
+# KEYFRAME_INTERVAL frames, on a resolution or bitplane change, and whenever asked (a new
+# viewer joining) it sends a keyframe with the whole screen instead. The Decoder applies
+# packets to its own Framebuffer, which any display backend can present.
+#
+# Packet:
+#   type       1 byte, DELTA or KEYFRAME
+#   sequence   1 byte, counts packets mod 256 so a decoder can spot a lost one
+#   keyframe:  bytes per row, height, bitplanes (1 byte each), then RLE of every row
+#   delta:     changed row mask (LEB128 varint, bit plane * height + y), then RLE of the
+#              XOR of each changed row with its previous contents
+#
+# RLE is PackBits: a control byte n < 128 is followed by n + 1 literal bytes, n >= 128 by
+# one byte repeated n - 126 times. An unchanged 64x32 screen is a 3 byte packet, one
+# sprite moving typically 10-20 bytes, against 256 bytes for the raw screen.
+
+DELTA = 0
+KEYFRAME = 1
+KEYFRAME_INTERVAL = 60 # frames, one a second
+
+
+def rle_encode(data:bytes) -> bytes:
+    out = bytearray()
+    size = len(data)
+    i = 0
+    literal = 0 # start of the pending literal run
+    while i < size:
+        # length of the run of equal bytes starting at i
+        byte = data[i]
+        run = 1
+        while i + run < size and run < 129 and data[i + run] == byte:
+            run += 1
+        if run >= 3 or (run == 2 and literal == i):
+            _flush_literal(out, data, literal, i)
+            out += bytes((run + 126, byte))
+            i += run
+            literal = i
+        else:
+            i += run
+    _flush_literal(out, data, literal, size)
+    return bytes(out)
+
+
+def _flush_literal(out:bytearray, data:bytes, start:int, end:int):
+    while start < end:
+        count = min(end - start, 128)
+        out.append(count - 1)
+        out += data[start:start + count]
+        start += count
+
+
+def rle_decode(data:bytes, offset:int = 0) -> bytes:
+    out = bytearray()
+    size = len(data)
+    while offset < size:
+        control = data[offset]
+        if control < 128:
+            out += data[offset + 1:offset + control + 2]
+            offset += control + 2
+        else:
+            out += bytes((data[offset + 1],)) * (control - 126)
+            offset += 2
+    return bytes(out)
+
+
+def _write_varint(out:bytearray, value:int):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data:bytes, offset:int):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, offset
+
+
+class Encoder:
+
+    def __init__(self, keyframe_interval:int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.previous = None # rows of every plane, plane after plane, as sent last
+        self.shape = None    # (width, height, planes) of the last packet
+        self.since_keyframe = 0
+        self.sequence = 0
+
+
+    # make the next packet a keyframe, e.g. when a viewer joins
+    def force_keyframe(self):
+        self.previous = None
+
+
+    # the packet bringing a decoder from the last frame to the framebuffer's contents
+    def encode(self, framebuffer:Framebuffer) -> bytes:
+        width = framebuffer.width
+        height = framebuffer.height
+        planes = framebuffer.planes
+        shape = (width, height, len(planes))
+        rows = [row for plane in planes for row in plane]
+        row_bytes = (width + 7) // 8
+        sequence = self.sequence
+        self.sequence = (sequence + 1) & 0xff
+
+        previous = self.previous
+        if previous is None or shape != self.shape or self.since_keyframe >= self.keyframe_interval:
+            self.previous = rows
+            self.shape = shape
+            self.since_keyframe = 0
+            packet = bytearray((KEYFRAME, sequence, row_bytes, height, len(planes)))
+            packet += rle_encode(b''.join(row.to_bytes(row_bytes, 'big') for row in rows))
+            return bytes(packet)
+
+        self.previous = rows
+        self.since_keyframe += 1
+        mask = 0
+        changes = []
+        for y, (row, before) in enumerate(zip(rows, previous)):
+            if row != before:
+                mask |= 1 << y
+                changes.append((row ^ before).to_bytes(row_bytes, 'big'))
+        packet = bytearray((DELTA, sequence))
+        _write_varint(packet, mask)
+        if changes:
+            packet += rle_encode(b''.join(changes))
+        return bytes(packet)
+
+
+class Decoder:
+
+    def __init__(self, framebuffer:Framebuffer = None):
+        self.framebuffer = framebuffer if framebuffer is not None else Framebuffer()
+        self.sequence = None # expected sequence number, None until the first keyframe
+
+
+    # apply one packet to the framebuffer. Raises ValueError for a delta that does not
+    # follow the last packet (lost or out of order); the stream picks up again at the
+    # next keyframe.
+    def decode(self, packet:bytes):
+        kind, sequence = packet[0], packet[1]
+        framebuffer = self.framebuffer
+
+        if kind == KEYFRAME:
+            row_bytes, height, count = packet[2], packet[3], packet[4]
+            width = row_bytes * 8
+            if (width, height) != (framebuffer.width, framebuffer.height):
+                framebuffer.set_resolution(width, height)
+            if count != len(framebuffer.planes):
+                framebuffer.set_planes(count)
+            data = rle_decode(packet, 5)
+            for plane, rows in enumerate(framebuffer.planes):
+                base = plane * height
+                rows[:] = [int.from_bytes(data[(base + y) * row_bytes:(base + y + 1) * row_bytes], 'big')
+                           for y in range(height)]
+            framebuffer.dirty = (1 << height) - 1
+            self.sequence = (sequence + 1) & 0xff
+            return
+
+        if kind != DELTA:
+            raise ValueError(f"Unknown frame packet type: {kind}")
+        if sequence != self.sequence:
+            self.sequence = None
+            raise ValueError("Frame packet out of sequence, waiting for a keyframe.")
+        self.sequence = (sequence + 1) & 0xff
+
+        mask, offset = _read_varint(packet, 2)
+        if not mask:
+            return
+        height = framebuffer.height
+        row_bytes = (framebuffer.width + 7) // 8
+        data = rle_decode(packet, offset)
+        planes = framebuffer.planes
+        position = 0
+        dirty = 0
+        while mask:
+            index = (mask & -mask).bit_length() - 1
+            mask &= mask - 1
+            plane, y = divmod(index, height)
+            planes[plane][y] ^= int.from_bytes(data[position:position + row_bytes], 'big')
+            position += row_bytes
+            dirty |= 1 << y
+        framebuffer.dirty |= dirty
+
+
+def main(argv=None):
+    import argparse
+    from Machine import Machine
+    from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+
+    parser = argparse.ArgumentParser(description="Encode a headless run of a rom as a frame stream and report its size.")
+    parser.add_argument("rom")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL)
+    args = parser.parse_args(argv)
+
+    with open(args.rom, 'rb') as file:
+        rom = file.read()
+    display = NullDisplay()
+    machine = Machine(display, ScriptedKeyboard(), NullBeeper(), seed=args.seed)
+    machine.load(rom)
+
+    encoder = Encoder(args.keyframe_interval)
+    decoder = Decoder()
+    total = keyframes = raw = 0
+    for _ in range(args.frames):
+        machine.run_frame()
+        packet = encoder.encode(display.framebuffer)
+        decoder.decode(packet)
+        if decoder.framebuffer.to_bytes() != display.framebuffer.to_bytes():
+            raise AssertionError("Decoded frame differs from the source.")
+        total += len(packet)
+        keyframes += packet[0] == KEYFRAME
+        raw += len(display.framebuffer.to_bytes())
+
+    print(f"{args.frames} frames, {keyframes} keyframes: {total} bytes "
+          f"({total / args.frames:.1f} per frame, raw {raw / args.frames:.0f}, {raw / total:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+# one palette index bit (0 or 1) per pixel for every possible row byte
+BITS = [bytes((byte >> i) & 1 for i in range(7, -1, -1)) for byte in range(256)]
+
+
+# Screen memory shared by all display backends.
+# Each row is packed into one int, with the leftmost pixel in the most significant bit,
+# so drawing one sprite row is a shift, an AND (collision test) and an XOR, and scrolling
+# is a list slice (vertical) or one shift per row (horizontal).
+#
+# XO-CHIP screens have two bitplanes, giving four colours: the palette index of a pixel
+# has bit p set if the pixel is on in plane p. 'rows' is always plane 0. Drawing,
+# clearing and scrolling act on the planes selected in plane_mask.
+class Framebuffer:
+    LWIDTH = 64
+    LHEIGHT = 32
+    HWIDTH = 128 # SUPER-CHIP hi-res
+    HHEIGHT = 64
+
+    def __init__(self, width:int = LWIDTH, height:int = LHEIGHT, planes:int = 1):
+        self.width = width
+        self.height = height
+        self.planes = [[0] * height for _ in range(planes)]
+        self.rows = self.planes[0]
+        self.plane_mask = 1
+        # bitmask of rows changed since the last take_dirty() (bit y = row y)
+        self.dirty = 0
+
+
+    # switch resolution (SUPER-CHIP 00FE/00FF), which clears the screen
+    def set_resolution(self, width:int, height:int):
+        self.width = width
+        self.height = height
+        self.planes = [[0] * height for _ in self.planes]
+        self.rows = self.planes[0]
+        self.dirty = (1 << height) - 1
+
+
+    def set_planes(self, count:int):
+        self.planes = [[0] * self.height for _ in range(count)]
+        self.rows = self.planes[0]
+        self.plane_mask = 1
+        self.dirty = (1 << self.height) - 1
+
+
+    def selected(self) -> list:
+        return [rows for plane, rows in enumerate(self.planes) if self.plane_mask >> plane & 1]
+
+
+    # x,y - the coordinates of the top left corner of the sprite
+    # sprite - the sprite data to write (one byte per row, up to 16 rows)
+    # returns True if any pixel was flipped from 1 to 0
+    def draw(self, x:int, y:int, sprite) -> bool:
+        rows = self.rows
+        height = self.height
+        # sprite bits are clipped at the right edge by shifting them out
+        shift = self.width - 8 - x
+        collided = 0
+        top = y
+
+        for sprite_row in sprite:
+            if y >= height:
+                break
+            bits = sprite_row << shift if shift >= 0 else sprite_row >> -shift
+            row = rows[y]
+            collided |= row & bits
+            rows[y] = row ^ bits
+            y += 1
+
+        if y > top:
+            self.dirty |= ((1 << (y - top)) - 1) << top
+        return collided != 0
+
+
+    # draw() for platforms where the start position wraps onto the screen, but the pixels
+    # past the right and bottom edges are clipped (COSMAC VIP, CHIP-48)
+    def draw_wrapped_start(self, x:int, y:int, sprite) -> bool:
+        return self.draw(x % self.width, y % self.height, sprite)
+
+
+    # draw() for platforms where sprites wrap around the edges: the start position
+    # wraps, then pixels past the right edge reappear on the left and rows past the
+    # bottom on the top
+    def draw_wrapped(self, x:int, y:int, sprite) -> bool:
+        rows = self.rows
+        width = self.width
+        height = self.height
+        full = (1 << width) - 1
+        x %= width
+        y %= height
+        shift = width - 8 - x
+        collided = 0
+        dirty = 0
+
+        for sprite_row in sprite:
+            if shift >= 0:
+                bits = sprite_row << shift
+            else:
+                bits = ((sprite_row >> -shift) | (sprite_row << (width + shift))) & full
+            row = rows[y]
+            collided |= row & bits
+            rows[y] = row ^ bits
+            dirty |= 1 << y
+            y += 1
+            if y == height:
+                y = 0
+
+        self.dirty |= dirty
+        return collided != 0
+
+
+    # SUPER-CHIP/XO-CHIP sprite: the start position wraps, the sprite is 8 pixels wide
+    # and n rows high, or 16x16 (two bytes a row) when n is 0, and each selected plane
+    # takes its own copy of the sprite data from ram, one after the other
+    def draw_sprite(self, x:int, y:int, ram, index:int, n:int, wrap:bool = False) -> bool:
+        width = self.width
+        height = self.height
+        full = (1 << width) - 1
+        x %= width
+        y %= height
+        if n == 0:
+            size, sprite_width, step = 32, 16, 2
+        else:
+            size, sprite_width, step = n, 8, 1
+        shift = width - sprite_width - x
+        collided = 0
+        dirty = 0
+
+        for rows in self.selected():
+            data = ram[index:index + size]
+            index += size
+            row_y = y
+            for i in range(0, len(data), step):
+                if row_y >= height:
+                    if not wrap:
+                        break
+                    row_y -= height
+                if step == 1:
+                    value = data[i]
+                else:
+                    value = (data[i] << 8) | (data[i + 1] if i + 1 < len(data) else 0)
+                if shift >= 0:
+                    bits = value << shift
+                else:
+                    bits = value >> -shift
+                    if wrap:
+                        bits |= (value << (width + shift)) & full
+                row = rows[row_y]
+                collided |= row & bits
+                rows[row_y] = row ^ bits
+                dirty |= 1 << row_y
+                row_y += 1
+
+        self.dirty |= dirty
+        return collided != 0
+
+
+    def clear(self):
+        for rows in self.selected():
+            for y in range(self.height):
+                if rows[y]:
+                    rows[y] = 0
+                    self.dirty |= 1 << y
+
+
+    # scroll the selected planes by n pixels, shifting in blank pixels
+    def scroll_down(self, n:int):
+        n = min(n, self.height)
+        for rows in self.selected():
+            rows[:] = [0] * n + rows[:self.height - n]
+        self.dirty = (1 << self.height) - 1
+
+    def scroll_up(self, n:int):
+        n = min(n, self.height)
+        for rows in self.selected():
+            rows[:] = rows[n:] + [0] * n
+        self.dirty = (1 << self.height) - 1
+
+    def scroll_right(self, n:int):
+        for rows in self.selected():
+            rows[:] = [row >> n for row in rows]
+        self.dirty = (1 << self.height) - 1
+
+    def scroll_left(self, n:int):
+        full = (1 << self.width) - 1
+        for rows in self.selected():
+            rows[:] = [(row << n) & full for row in rows]
+        self.dirty = (1 << self.height) - 1
+
+
+    # returns the dirty row mask and starts tracking afresh
+    def take_dirty(self) -> int:
+        dirty = self.dirty
+        self.dirty = 0
+        return dirty
+
+
+    # palette index of the pixel
+    def get_pixel(self, x:int, y:int) -> int:
+        shift = self.width - 1 - x
+        return sum(((rows[y] >> shift) & 1) << plane for plane, rows in enumerate(self.planes))
+
+
+    # row y with every group of 8 pixels replaced by table[byte], e.g. a table of
+    # 8 palette indices or 8 packed colours per byte value
+    def expand_row(self, y:int, table) -> bytes:
+        row = self.rows[y].to_bytes((self.width + 7) // 8, 'big')
+        return b''.join([table[byte] for byte in row])
+
+
+    # row y as one palette index per pixel
+    def index_row(self, y:int) -> bytes:
+        if len(self.planes) == 1:
+            return self.expand_row(y, BITS)
+        row_bytes = (self.width + 7) // 8
+        pixels = 0
+        for plane, rows in enumerate(self.planes):
+            expanded = b''.join([BITS[byte] for byte in rows[y].to_bytes(row_bytes, 'big')])
+            pixels |= int.from_bytes(expanded, 'big') << plane
+        return pixels.to_bytes(row_bytes * 8, 'big')
+
+
+    # every plane's rows, plane after plane
+    def to_bytes(self) -> bytes:
+        row_bytes = (self.width + 7) // 8
+        return b''.join(row.to_bytes(row_bytes, 'big') for rows in self.planes for row in rows)
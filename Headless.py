@@ -0,0 +1,196 @@
+import sys
+from Machine import Machine
+from Backends import Display
+from Quirks import PROFILES, DEFAULT
+
+# Stand-ins for the pygame display, beeper and keyboard, so a Machine can run with
+# no window system (CI, render farms). Nothing in here imports pygame.
+# The 'null' backends throw everything away; the 'memory' ones keep what the machine
+# presented and played, and take key presses from code, for tests and tools.
+
+
+class NullDisplay(Display):
+    pass
+
+
+# keeps a copy of the screen (Framebuffer.to_bytes) for every frame it changed in
+class MemoryDisplay(Display):
+
+    def __init__(self):
+        super().__init__()
+        self.frames = []
+
+
+    def render_screen(self):
+        if self.framebuffer.take_dirty():
+            self.frames.append(self.framebuffer.to_bytes())
+
+
+class NullBeeper:
+
+    def __init__(self, sound_file:str = None):
+        self.playing = False
+
+    def play(self):
+        self.playing = True
+
+    def stop(self):
+        self.playing = False
+
+
+# records every start and stop of the sound as (call number, playing)
+class MemoryBeeper(NullBeeper):
+
+    def __init__(self, sound_file:str = None):
+        super().__init__(sound_file)
+        self.calls = 0
+        self.changes = []
+
+    def play(self):
+        self._set(True)
+
+    def stop(self):
+        self._set(False)
+
+    def _set(self, playing:bool):
+        if playing != self.playing:
+            self.changes.append((self.calls, playing))
+        self.playing = playing
+        self.calls += 1
+
+
+# Keyboard driven by a script instead of pygame events.
+# script maps a frame number (60 Hz tick) to the keys held down from that frame on,
+# e.g. {0: [], 30: [5], 32: []} holds key 5 for two frames.
+# get_events() is called once per frame by Machine.run and advances the script.
+class ScriptedKeyboard:
+
+    def __init__(self, script:dict = None, quit_frame:int = None):
+        self.script = dict(script or {})
+        self.quit_frame = quit_frame
+        self.frame = -1
+        self.held = set()
+        self.released = []
+
+
+    def get_events(self):
+        actions = {'quit':False,'keydown':False}
+        self.frame += 1
+        # a release only ends an fx0a wait in the frame it happened in
+        self.released.clear()
+
+        if self.frame in self.script:
+            held = set(self.script[self.frame])
+            for key in held - self.held:
+                actions[key] = True
+                actions['keydown'] = True
+            self.released.extend(sorted(self.held - held))
+            self.held = held
+
+        if self.quit_frame is not None and self.frame >= self.quit_frame:
+            actions['quit'] = True
+        return actions
+
+
+    def is_pressed(self, key_hex:int = None):
+
+        #1. individual actions (key released this frame)
+        if key_hex is None:
+            if self.released:
+                return self.released.pop(0)
+            return False
+
+        #2. Held down
+        return (key_hex & 0xf) in self.held
+
+
+# Keyboard driven from code: press() and release() take effect at the next frame's
+# get_events(), like a real key would.
+class MemoryKeyboard(ScriptedKeyboard):
+
+    def __init__(self):
+        super().__init__()
+        self.pending = []
+        self.quit_requested = False
+
+
+    def press(self, key:int):
+        self.pending.append((key, True))
+
+
+    def release(self, key:int):
+        self.pending.append((key, False))
+
+
+    def request_quit(self):
+        self.quit_requested = True
+
+
+    def get_events(self):
+        actions = super().get_events()
+        for key, down in self.pending:
+            if down and key not in self.held:
+                self.held.add(key)
+                actions[key] = True
+                actions['keydown'] = True
+            elif not down and key in self.held:
+                self.held.discard(key)
+                self.released.append(key)
+        self.pending = []
+        actions['quit'] = actions['quit'] or self.quit_requested
+        return actions
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a CHIP-8 rom with no window, as fast as possible.")
+    parser.add_argument("rom")
+    parser.add_argument("--cycles", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jit", action="store_true", help="run hot blocks through the recompiler")
+    parser.add_argument("--quirks", choices=sorted(PROFILES), default=DEFAULT, help="quirk profile")
+    parser.add_argument("--index", help="Disasm index of the rom, to decode and compile its code up front")
+    parser.add_argument("--capture", help="record the run to this .gif or .png (APNG) file")
+    parser.add_argument("--pipe", help="pipe raw RGB24 frames to this command, with {width}, {height} "
+                                       "and {rate} filled in, e.g. 'ffmpeg -f rawvideo -pix_fmt rgb24 "
+                                       "-s {width}x{height} -r {rate} -i - out.mp4'")
+    parser.add_argument("--scale", type=int, default=4, help="output pixels per CHIP-8 pixel when capturing")
+    args = parser.parse_args(argv)
+
+    with open(args.rom, 'rb') as file:
+        rom = file.read()
+
+    encoder = None
+    if args.capture or args.pipe:
+        import Capture
+        if args.pipe:
+            import subprocess
+            command = args.pipe.format(width=Display.LWIDTH * args.scale, height=Display.LHEIGHT * args.scale,
+                                       rate=Capture.FRAME_RATE)
+            encoder = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE)
+            capture = Capture.open_capture(stream=encoder.stdin, scale=args.scale)
+        else:
+            capture = Capture.open_capture(args.capture, scale=args.scale)
+        display = Capture.CaptureDisplay(capture)
+    else:
+        display = NullDisplay()
+    machine = Machine(display, ScriptedKeyboard(), NullBeeper(), seed=args.seed, jit=args.jit,
+                      quirks=args.quirks)
+    machine.load(rom)
+    if args.index:
+        from Disasm import load_index
+        machine.prewarm(load_index(args.index))
+    stats = machine.run(args.cycles)
+
+    print(f"{stats['cycles']} instructions, {stats['frames']} frames in {stats['seconds']:.3f}s "
+          f"({stats['ips']:,.0f} instructions/sec)")
+    print(f"screen {display.screen_hash()}")
+    display.quit()
+    if encoder is not None:
+        encoder.stdin.close()
+        encoder.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
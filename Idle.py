@@ -0,0 +1,34 @@
+# Wait-state detection.
+#
+# Input is pumped and the timers tick only at frame boundaries, so a loop that just polls
+# the delay timer or the keypad cannot make progress before the next frame. Handlers raise
+# Idle when they recognise one; the scheduler then counts the rest of the frame as
+# executed without running it (headless runs jump ahead, windowed runs sleep).
+
+
+class Idle(Exception):
+    pass
+
+
+# How far back from a jump the recognised loop bodies reach. Writes up to this many bytes
+# before a jump have to invalidate its cached handler.
+LOOKBACK = 4
+
+
+# True if 'jump' (the address of a 1nnn) to 'target' closes a loop that only waits:
+#   A: 1A                   jump to self
+#   A: Ex9E/ExA1  A+2: 1A   wait for a key
+#   A: Fx07  A+2: 3xnn/4xnn  A+4: 1A   wait for the delay timer
+def is_idle_loop(ram, jump:int, target:int) -> bool:
+    if target == jump:
+        return True
+
+    if jump == target + 2:
+        return ram[target] >> 4 == 0xe and ram[target + 1] in (0x9e, 0xa1)
+
+    if jump == target + 4:
+        x = ram[target] & 0xf
+        return (ram[target] >> 4 == 0xf and ram[target + 1] == 0x07
+                and ram[target + 2] in (0x30 | x, 0x40 | x))
+
+    return False
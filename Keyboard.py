@@ -22,11 +22,14 @@ class Keyboard():
         }
 
     def __init__(self):
-        pygame.init()
+        pygame.display.init()  # events and key state come with the display
+        self.released = [] # keys released this frame, for is_pressed() polls
     
 
     def get_events(self):
         actions = {'quit':False,'keydown':False}
+        # a release only ends an fx0a wait in the frame it happened in
+        self.released.clear()
 
         for event in pygame.event.get():
             # Check for Window Close (X button)
@@ -38,18 +41,21 @@ class Keyboard():
                 found_key = next((key for key, value in self.keys.items() if value == event.key), None)
                 actions[found_key] = True
                 actions['keydown'] = True
+
+            # Remember key releases for fx0a
+            if event.type == pygame.KEYUP and event.key in self.keys.values():
+                found_key = next((key for key, value in self.keys.items() if value == event.key), None)
+                self.released.append(found_key)
                     
         return actions
     
     
     def is_pressed(self, key_hex:int = None):
 
-        #1. individual actions
+        #1. individual actions (collected by get_events, which pumps the queue once per frame)
         if key_hex is None:
-            for event in pygame.event.get():
-                if event.type == pygame.KEYUP and event.key in self.keys.values():
-                    found_key = next((key for key, value in self.keys.items() if value == event.key), None)
-                    return found_key
+            if self.released:
+                return self.released.pop(0)
             return False
         
         #2. Held down
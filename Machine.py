@@ -0,0 +1,759 @@
+import time
+import random
+from State import State, CheckedState
+import Quirks
+from Snapshot import Snapshot
+from Idle import Idle, is_idle_loop, LOOKBACK
+
+FONTSTART = State.FONTSTART
+BIGFONTSTART = 0xa0 # right after FONT
+IPS = 700 # Instructions per second (emulated)
+TIMER_HZ = 60
+MAX_CYCLES_PER_FRAME = 0xffffffff
+
+# built-in hex font, so a machine can run without a font rom on disk
+FONT = bytes([
+    0xF0, 0x90, 0x90, 0x90, 0xF0, # 0
+    0x20, 0x60, 0x20, 0x20, 0x70, # 1
+    0xF0, 0x10, 0xF0, 0x80, 0xF0, # 2
+    0xF0, 0x10, 0xF0, 0x10, 0xF0, # 3
+    0x90, 0x90, 0xF0, 0x10, 0x10, # 4
+    0xF0, 0x80, 0xF0, 0x10, 0xF0, # 5
+    0xF0, 0x80, 0xF0, 0x90, 0xF0, # 6
+    0xF0, 0x10, 0x20, 0x40, 0x40, # 7
+    0xF0, 0x90, 0xF0, 0x90, 0xF0, # 8
+    0xF0, 0x90, 0xF0, 0x10, 0xF0, # 9
+    0xF0, 0x90, 0xF0, 0x90, 0x90, # A
+    0xE0, 0x90, 0xE0, 0x90, 0xE0, # B
+    0xF0, 0x80, 0x80, 0x80, 0xF0, # C
+    0xE0, 0x90, 0x90, 0x90, 0xE0, # D
+    0xF0, 0x80, 0xF0, 0x80, 0xF0, # E
+    0xF0, 0x80, 0xF0, 0x80, 0x80, # F
+])
+
+# SUPER-CHIP/XO-CHIP 8x10 digits for Fx30, loaded for those instruction sets only
+BIGFONT = bytes([
+    0x3C, 0x7E, 0xE7, 0xC3, 0xC3, 0xC3, 0xC3, 0xE7, 0x7E, 0x3C, # 0
+    0x18, 0x38, 0x58, 0x18, 0x18, 0x18, 0x18, 0x18, 0x18, 0x3C, # 1
+    0x3E, 0x7F, 0xC3, 0x06, 0x0C, 0x18, 0x30, 0x60, 0xFF, 0xFF, # 2
+    0x3C, 0x7E, 0xC3, 0x03, 0x0E, 0x0E, 0x03, 0xC3, 0x7E, 0x3C, # 3
+    0x06, 0x0E, 0x1E, 0x36, 0x66, 0xC6, 0xFF, 0xFF, 0x06, 0x06, # 4
+    0xFF, 0xFF, 0xC0, 0xC0, 0xFC, 0xFE, 0x03, 0xC3, 0x7E, 0x3C, # 5
+    0x3E, 0x7C, 0xC0, 0xC0, 0xFC, 0xFE, 0xC3, 0xC3, 0x7E, 0x3C, # 6
+    0xFF, 0xFF, 0x03, 0x06, 0x0C, 0x18, 0x30, 0x60, 0x60, 0x60, # 7
+    0x3C, 0x7E, 0xC3, 0xC3, 0x7E, 0x7E, 0xC3, 0xC3, 0x7E, 0x3C, # 8
+    0x3C, 0x7E, 0xC3, 0xC3, 0x7F, 0x3F, 0x03, 0x03, 0x3E, 0x7C, # 9
+    0x7E, 0xFF, 0xC3, 0xC3, 0xC3, 0xFF, 0xFF, 0xC3, 0xC3, 0xC3, # A
+    0xFC, 0xFE, 0xC3, 0xC3, 0xFE, 0xFE, 0xC3, 0xC3, 0xFE, 0xFC, # B
+    0x3C, 0x7E, 0xC3, 0xC0, 0xC0, 0xC0, 0xC0, 0xC3, 0x7E, 0x3C, # C
+    0xFC, 0xFE, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xFE, 0xFC, # D
+    0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, # E
+    0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0xC0, 0xC0, 0xC0, 0xC0, # F
+])
+
+
+# The execution core. Each opcode is decoded once into a small handler closure that
+# is cached per RAM address, so the main loop only does a lookup and a call.
+# Handlers return True when they changed the screen.
+#
+# Execution is scheduled in 60 Hz frames of ips/60 instructions. Input is pumped once
+# and the timers tick once per frame, on the emulated cycle count rather than wall time,
+# so runs are deterministic for a given seed and input script.
+#
+# 'quirks' picks the platform behaviour (see Quirks), including the instruction set:
+# SUPER-CHIP adds hi-res, scrolling and 16x16 sprites, XO-CHIP adds bitplanes and 64 KB
+# of memory on top. The legacy shift_quirk/jump_quirk arguments override the profile's
+# shift_vy/jump_vx when given.
+#
+# debug=True swaps in CheckedState and validates the state after every instruction.
+# Debug runs always use the interpreter.
+class Machine():
+
+    def __init__(self, display, keyboard, beeper, shift_quirk=None, jump_quirk=None,
+                 ips=IPS, seed=None, jit=False, debug=False, quirks=None):
+        quirks = Quirks.resolve(quirks)
+        if shift_quirk is not None and shift_quirk != quirks.shift_vy:
+            quirks = quirks.replace(shift_vy=shift_quirk)
+        if jump_quirk is not None and jump_quirk != quirks.jump_vx:
+            quirks = quirks.replace(jump_vx=jump_quirk)
+        self.quirks = quirks
+
+        self.debug = debug
+        self.state = CheckedState(memory=quirks.memory) if debug else State(memory=quirks.memory)
+        self.display = display
+        self.keyboard = keyboard
+        self.beeper = beeper
+        if quirks.instructions == 'xochip':
+            display.framebuffer.set_planes(2)
+
+        # decoded handlers, indexed by address
+        self.decoded = [None] * len(self.state.ram)
+        # 1 for every address an instruction was ever decoded or translated from, so writes
+        # to data (most of them) are let through without looking at any handler or block
+        self.code = bytearray(len(self.state.ram))
+        self._pc_mask = len(self.state.ram) - 1
+
+        # emulated time
+        self.cycles = 0
+        self.frames = 0
+        self.idle_frames = 0 # frames cut short by a detected wait loop
+        self.cycles_per_frame = max(round(ips / TIMER_HZ), 1)
+        # snapshots keep the cycles left in a frame in 32 bits
+        if self.cycles_per_frame > MAX_CYCLES_PER_FRAME:
+            raise ValueError(f"ips too high: at most {MAX_CYCLES_PER_FRAME * TIMER_HZ} instructions per second")
+        self._until_tick = self.cycles_per_frame
+
+        # Cxnn draws from a private generator so runs can be reproduced
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        elif not 0 <= seed < 1 << 64:
+            raise ValueError("seed must be between 0 and 2**64 - 1") # stored as 64 bits in snapshots and movies
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        # optional tier that runs hot basic blocks as compiled Python functions
+        self.recompiler = None
+        if jit and not debug:
+            from Recompiler import Recompiler # only jit runs pay for importing it
+            self.recompiler = Recompiler(self)
+
+        # instrumentation that wraps handlers as they are decoded, see Profiler and Trace
+        self.profiler = None
+        self.tracer = None
+
+        self.load(FONT, FONTSTART)
+        if quirks.instructions != 'chip8':
+            self.load(BIGFONT, BIGFONTSTART)
+
+
+    def load(self, data, address=State.ROMSTART):
+        self.state.set_ram(data, address)
+        self.invalidate(address, address + len(data))
+
+
+    # drop cached handlers for any instruction overlapping ram[start:end]
+    def invalidate(self, start, end):
+        decoded = self.decoded
+        # an instruction starting up to 3 bytes before 'start' may overlap it (XO-CHIP F000
+        # is 4 bytes long, and skips look at the length of the next instruction), and a
+        # jump up to LOOKBACK bytes after 'end' may have been classified as an idle loop
+        end += LOOKBACK
+        low = max(start - 3, 0)
+        high = min(end, len(decoded))
+        if self.code.find(1, low, high) < 0:
+            return
+        decoded[low:high] = [None] * (high - low)
+        if self.recompiler is not None:
+            self.recompiler.invalidate(start, end)
+
+
+    # Decode everything a Disasm index found to be code, and have the recompiler (if on)
+    # translate the blocks of every loop, before the first instruction runs
+    def prewarm(self, index:dict):
+        import hashlib
+        base = index['base']
+        if hashlib.sha1(self.state.ram[base:base + index['size']]).hexdigest() != index['sha1']:
+            raise ValueError("Index was made for a different rom.")
+        if index.get('instructions', 'chip8') != self.quirks.instructions:
+            raise ValueError(f"Index was made for {index.get('instructions', 'chip8')}, "
+                             f"this machine runs {self.quirks.instructions}.")
+
+        decoded = self.decoded
+        for address in index['code']:
+            if decoded[address] is None:
+                decoded[address] = self.decode(address)
+
+        if self.recompiler is not None:
+            self.recompiler.prewarm(start for loop in index['loops'] for start in loop['blocks'])
+
+
+    # capture the whole machine (see Snapshot for the binary format)
+    def snapshot(self) -> Snapshot:
+        return Snapshot.capture(self)
+
+
+    def restore(self, snapshot:Snapshot):
+        state = self.state
+        framebuffer = self.display.framebuffer
+        if len(snapshot.planes) != len(framebuffer.planes):
+            raise ValueError("Snapshot bitplanes do not match this display.")
+        if len(snapshot.ram) != len(state.ram):
+            raise ValueError("Snapshot memory size does not match this machine.")
+
+        # only drop cached handlers for the pages that actually differ
+        ram = state.ram
+        page = 64
+        for start in range(0, len(ram), page):
+            if ram[start:start + page] != snapshot.ram[start:start + page]:
+                self.invalidate(start, start + page)
+        ram[:] = snapshot.ram
+
+        state.pc = snapshot.pc
+        state.index = snapshot.index
+        state.delay_timer = snapshot.delay_timer
+        state.sound_timer = snapshot.sound_timer
+        state.set_stack(snapshot.stack)
+        state.registers[:] = snapshot.registers
+        state.key_state = list(snapshot.key_state)
+        state.rpl[:] = snapshot.rpl
+        state.pattern[:] = snapshot.pattern
+        state.pitch = snapshot.pitch
+
+        self.cycles = snapshot.cycles
+        self.frames = snapshot.frames
+        self._until_tick = snapshot.until_tick
+        self.seed = snapshot.seed
+        self.rng.setstate(snapshot.rng_state)
+
+        if (snapshot.width, snapshot.height) != (framebuffer.width, framebuffer.height):
+            framebuffer.set_resolution(snapshot.width, snapshot.height)
+        for rows, saved in zip(framebuffer.planes, snapshot.planes):
+            rows[:] = saved
+        framebuffer.plane_mask = snapshot.plane_mask
+        framebuffer.dirty = (1 << framebuffer.height) - 1
+
+
+    # 60 Hz timer tick, also the one point per frame where the screen is presented
+    def tick(self):
+        state = self.state
+        self.frames += 1
+        if self.profiler is not None:
+            self.profiler.end_frame()
+        self.display.render_screen()
+        state.decrement_delay_timer()
+        if state.decrement_sound_timer() > 0:
+            self.beeper.play()
+        else:
+            self.beeper.stop()
+
+
+    # Run the rest of the current 60 Hz frame as one batch: pump input once, execute the
+    # frame's instructions back to back, then tick the timers and present.
+    # Returns False if the input backend asked to quit.
+    def run_frame(self) -> bool:
+        if not self._begin_frame():
+            return False
+
+        count = self._until_tick
+        try:
+            if self.recompiler is not None:
+                self.recompiler.run(count)
+            else:
+                state = self.state
+                decoded = self.decoded
+                decode = self.decode
+                mask = self._pc_mask
+                for _ in range(count):
+                    pc = state.pc
+                    handler = decoded[pc]
+                    if handler is None:
+                        handler = decoded[pc] = decode(pc)
+                    state.pc = (pc + 2) & mask
+                    handler()
+        except Idle:
+            # nothing can change before the next frame, skip the rest of this one
+            self.idle_frames += 1
+
+        self.cycles += count
+        self._end_frame()
+        return True
+
+
+    # input is pumped once, at the first instruction of each frame
+    def _begin_frame(self) -> bool:
+        if self._until_tick == self.cycles_per_frame:
+            return not self.keyboard.get_events()['quit']
+        return True
+
+
+    def _end_frame(self):
+        self._until_tick = self.cycles_per_frame
+        self.tick()
+
+
+    # run a fixed number of instructions (or until the input backend quits, if None),
+    # as fast as the host allows
+    def run(self, cycles:int = None) -> dict:
+        return self._run(cycles, None)
+
+
+    # run until predicate(machine) is true (checked after every instruction)
+    def run_until(self, predicate, max_cycles:int = None) -> dict:
+        return self._run(max_cycles, predicate)
+
+
+    def _run(self, cycles, predicate):
+        step = self.step
+        start_cycles = self.cycles
+        start_time = time.perf_counter()
+        remaining = -1 if cycles is None else cycles
+
+        while remaining != 0:
+            # whole frames go through the batched path
+            if predicate is None and (remaining < 0 or remaining >= self._until_tick):
+                batch = self._until_tick
+                if not self.run_frame():
+                    break
+                remaining -= batch
+                continue
+
+            if not self._begin_frame():
+                break
+            executed = 1
+            try:
+                step()
+            except Idle:
+                # jump ahead to the end of the frame, within the cycle budget
+                executed = self._until_tick if remaining < 0 else min(remaining, self._until_tick)
+                self.idle_frames += 1
+            self.cycles += executed
+            remaining -= executed
+            self._until_tick -= executed
+            if self._until_tick == 0:
+                self._end_frame()
+
+            if predicate is not None and predicate(self):
+                break
+
+        executed = self.cycles - start_cycles
+        seconds = time.perf_counter() - start_time
+        return {
+            'cycles': executed,
+            'frames': self.frames,
+            'idle_frames': self.idle_frames,
+            'seconds': seconds,
+            'ips': executed / seconds if seconds > 0 else 0.0,
+        }
+
+
+    def step(self) -> bool:
+        state = self.state
+        pc = state.pc
+        handler = self.decoded[pc]
+        if handler is None:
+            handler = self.decoded[pc] = self.decode(pc)
+        state.pc = (pc + 2) & self._pc_mask
+        return handler()
+
+
+    def decode(self, address):
+        instr = self.state.get_ram(2, address)
+        if len(instr) != 2:
+            raise ValueError("Instruction is the wrong size for decoding.")
+        opcode = (instr[0] << 8) | instr[1]
+        self.code[address] = 1
+        op = self._decode_opcode(opcode, address)
+        if self.profiler is not None:
+            op = self.profiler.wrap(op, address, opcode)
+        if self.tracer is not None:
+            op = self.tracer.wrap(op, address, opcode)
+        if self.debug:
+            op = self._checked(op)
+        return op
+
+
+    # debug runs validate the machine state after every handler
+    def _checked(self, op):
+        check = self.state.check
+        def checked():
+            result = op()
+            check()
+            return result
+        return checked
+
+
+    # build the handler for the 16 bit opcode at 'address'
+    def _decode_opcode(self, opcode:int, address:int):
+        state = self.state
+        R = state.registers
+        ram = state.ram
+        mask = self._pc_mask
+        framebuffer = self.display.framebuffer
+        keyboard = self.keyboard
+        extended = self.quirks.instructions != 'chip8'
+        xochip = self.quirks.instructions == 'xochip'
+
+        # nibbles
+        n1 = (opcode >> 12) & 0xf
+        n2 = (opcode >> 8) & 0xf
+        n3 = (opcode >> 4) & 0xf
+        n4 = opcode & 0xf
+        nn = opcode & 0xff
+        nnn = opcode & 0xfff
+
+        def unknown():
+            raise SyntaxError(f"Instruction not recognized: {opcode:04x}")
+
+        # XO-CHIP skips step over the whole of a 4 byte F000 nnnn
+        skip = 4 if xochip and ram[address + 2:address + 4] == b'\xf0\x00' else 2
+
+        match n1:
+            case 0x0:
+                match nn:
+                    case 0xe0:      # 00e0 clear screen
+                        clear = framebuffer.clear
+                        def op():
+                            clear()
+                            return True
+                    case 0xee:      # 00ee return from subroutine
+                        pop = state.stack_pop
+                        def op():
+                            state.pc = pop()
+                    case _ if extended:
+                        op = self._decode_screen(n2, n3, n4, address)
+                        if op is None:
+                            op = unknown
+                    case _:
+                        op = unknown
+            case 0x1:               # 1nnn jump
+                if is_idle_loop(ram, address, nnn):
+                    def op():
+                        state.pc = nnn
+                        raise Idle
+                else:
+                    def op():
+                        state.pc = nnn
+            case 0x2:               # 2nnn call subroutine
+                push = state.stack_push
+                def op():
+                    push(state.pc)
+                    state.pc = nnn
+            case 0x3:               # 3xnn skip one instr if vx == nn
+                def op():
+                    if R[n2] == nn:
+                        state.pc = (state.pc + skip) & mask
+            case 0x4:               # 4xnn skip one instr if vx != nn
+                def op():
+                    if R[n2] != nn:
+                        state.pc = (state.pc + skip) & mask
+            case 0x5 if xochip and n4 in (0x2, 0x3):
+                op = self._decode_range(n2, n3, n4)
+            case 0x5:               # 5xy0 skips if the values in VX and VY are equal
+                def op():
+                    if R[n2] == R[n3]:
+                        state.pc = (state.pc + skip) & mask
+            case 0x6:               # 6xnn set register vx
+                def op():
+                    R[n2] = nn
+            case 0x7:               # 7xnn add value to register vx
+                def op():
+                    R[n2] = (R[n2] + nn) & 0xff
+            case 0x8:
+                op = self._decode_alu(n2, n3, n4)
+                if op is None:
+                    op = unknown
+            case 0x9:               # 9xy0 skips if the values in VX and VY are not equal
+                def op():
+                    if R[n2] != R[n3]:
+                        state.pc = (state.pc + skip) & mask
+            case 0xa:               # annn set index register I
+                def op():
+                    state.index = nnn
+            case 0xb:               # bnnn jump with offset
+                if self.quirks.jump_vx:
+                    def op():
+                        state.pc = (nnn + R[n2]) & mask
+                else:
+                    def op():
+                        state.pc = (nnn + R[0]) & mask
+            case 0xc:               # cxnn random
+                randint = self.rng.randint
+                def op():
+                    R[n2] = nn & randint(0, 0xff)
+            case 0xd if extended:   # dxyn draw to the selected planes, dxy0 draws 16x16
+                sprite = framebuffer.draw_sprite
+                wrap = self.quirks.wrap
+                if self.quirks.display_wait:
+                    def op():
+                        R[0xf] = 1 if sprite(R[n2], R[n3], ram, state.index, n4, wrap) else 0
+                        raise Idle
+                else:
+                    def op():
+                        R[0xf] = 1 if sprite(R[n2], R[n3], ram, state.index, n4, wrap) else 0
+                        return True
+            case 0xd:               # dxyn draw
+                draw = (framebuffer.draw_wrapped if self.quirks.wrap else
+                        framebuffer.draw_wrapped_start if self.quirks.wrap_start else framebuffer.draw)
+                if self.quirks.display_wait:
+                    def op():
+                        index = state.index
+                        R[0xf] = 1 if draw(R[n2], R[n3], ram[index:index + n4]) else 0
+                        raise Idle # nothing more runs until the next frame
+                else:
+                    def op():
+                        index = state.index
+                        R[0xf] = 1 if draw(R[n2], R[n3], ram[index:index + n4]) else 0
+                        return True
+            case 0xe:
+                is_pressed = keyboard.is_pressed
+                match nn:
+                    case 0x9e:      # ex9e skip if vx key pressed
+                        def op():
+                            if is_pressed(R[n2]):
+                                state.pc = (state.pc + skip) & mask
+                    case 0xa1:      # exa1 skip if vx key not pressed
+                        def op():
+                            if not is_pressed(R[n2]):
+                                state.pc = (state.pc + skip) & mask
+                    case _:
+                        op = unknown
+            case 0xf:
+                op = self._decode_misc(n2, nn, address)
+                if op is None:
+                    op = unknown
+
+        return op
+
+
+    # SUPER-CHIP/XO-CHIP 00nn screen control. Scroll distances are in pixels of the
+    # current resolution.
+    def _decode_screen(self, n2, n3, n4, address):
+        state = self.state
+        framebuffer = self.display.framebuffer
+        xochip = self.quirks.instructions == 'xochip'
+
+        if n2 != 0:
+            return None
+        match n3:
+            case 0xc:                       # 00cn scroll down n rows
+                def op():
+                    framebuffer.scroll_down(n4)
+                    return True
+            case 0xd if xochip:             # 00dn scroll up n rows
+                def op():
+                    framebuffer.scroll_up(n4)
+                    return True
+            case 0xf:
+                match n4:
+                    case 0xb:               # 00fb scroll right 4 pixels
+                        def op():
+                            framebuffer.scroll_right(4)
+                            return True
+                    case 0xc:               # 00fc scroll left 4 pixels
+                        def op():
+                            framebuffer.scroll_left(4)
+                            return True
+                    case 0xd:               # 00fd exit: stays here, like a jump to itself
+                        def op():
+                            state.pc = address
+                            raise Idle
+                    case 0xe:               # 00fe low resolution
+                        def op():
+                            framebuffer.set_resolution(framebuffer.LWIDTH, framebuffer.LHEIGHT)
+                            return True
+                    case 0xf:               # 00ff high resolution
+                        def op():
+                            framebuffer.set_resolution(framebuffer.HWIDTH, framebuffer.HHEIGHT)
+                            return True
+                    case _:
+                        return None
+            case _:
+                return None
+        return op
+
+
+    # XO-CHIP 5xy2/5xy3 save/load vx..vy (either way round) at I, leaving I alone
+    def _decode_range(self, x, y, n):
+        state = self.state
+        R = state.registers
+        ram = state.ram
+        memory = len(ram)
+        invalidate = self.invalidate
+        registers = list(range(x, y + 1) if x <= y else range(x, y - 1, -1))
+        count = len(registers)
+
+        if n == 0x2:                # 5xy2 save
+            def op():
+                index = state.index
+                if index + count > memory:
+                    raise OverflowError("Out of memory while writing to RAM.")
+                ram[index:index + count] = bytes([R[r] for r in registers])
+                invalidate(index, index + count)
+        else:                       # 5xy3 load
+            def op():
+                index = state.index
+                values = ram[index:index + count]
+                for r, value in zip(registers, values):
+                    R[r] = value
+        return op
+
+
+    # 8xyn arithmetic and logic
+    def _decode_alu(self, x, y, n):
+        R = self.state.registers
+        quirks = self.quirks
+
+        match n:
+            case 0x0:       # 8xy0 set x = y
+                def op():
+                    R[x] = R[y]
+            case 0x1 if quirks.vf_reset:    # 8xy1 binary OR, VF cleared
+                def op():
+                    R[x] |= R[y]
+                    R[0xf] = 0
+            case 0x1:       # 8xy1 binary OR
+                def op():
+                    R[x] |= R[y]
+            case 0x2 if quirks.vf_reset:    # 8xy2 binary AND, VF cleared
+                def op():
+                    R[x] &= R[y]
+                    R[0xf] = 0
+            case 0x2:       # 8xy2 binary AND
+                def op():
+                    R[x] &= R[y]
+            case 0x3 if quirks.vf_reset:    # 8xy3 binary XOR, VF cleared
+                def op():
+                    R[x] ^= R[y]
+                    R[0xf] = 0
+            case 0x3:       # 8xy3 binary XOR
+                def op():
+                    R[x] ^= R[y]
+            case 0x4:       # 8xy4 add with carry
+                def op():
+                    value = R[x] + R[y]
+                    R[x] = value & 0xff
+                    R[0xf] = value >> 8
+            case 0x5:       # 8xy5 sets VX to the result of VX - VY
+                def op():
+                    value = R[x] - R[y]
+                    R[x] = value & 0xff
+                    R[0xf] = 0 if value < 0 else 1
+            case 0x6:       # 8xy6 right shift
+                src = y if quirks.shift_vy else x
+                def op():
+                    value = R[src]
+                    R[x] = value >> 1
+                    R[0xf] = value & 0x1 # grab the rightmost bit
+            case 0x7:       # 8xy7 sets VX to the result of VY - VX
+                def op():
+                    value = R[y] - R[x]
+                    R[x] = value & 0xff
+                    R[0xf] = 0 if value < 0 else 1
+            case 0xe:       # 8xye left shift
+                src = y if quirks.shift_vy else x
+                def op():
+                    value = R[src]
+                    R[x] = (value << 1) & 0xff
+                    R[0xf] = value >> 7 # grab the leftmost bit
+            case _:
+                return None
+        return op
+
+
+    # fxnn timers, index and memory
+    def _decode_misc(self, x, nn, address):
+        state = self.state
+        R = state.registers
+        ram = state.ram
+        memory = len(ram)
+        mask = self._pc_mask
+        keyboard = self.keyboard
+        invalidate = self.invalidate
+        extended = self.quirks.instructions != 'chip8'
+        xochip = self.quirks.instructions == 'xochip'
+
+        match nn:
+            case 0x00 if xochip and x == 0:     # f000 nnnn set I to the 16 bit nnnn that follows
+                value = (ram[(address + 2) & mask] << 8) | ram[(address + 3) & mask]
+                def op():
+                    state.index = value
+                    state.pc = (state.pc + 2) & mask
+            case 0x01 if xochip:                # fn01 select bitplanes n
+                framebuffer = self.display.framebuffer
+                def op():
+                    framebuffer.plane_mask = x
+            case 0x02 if xochip and x == 0:     # f002 load the audio pattern from I
+                def op():
+                    index = state.index
+                    state.pattern[:] = ram[index:index + 16].ljust(16, b'\0')
+            case 0x07:      # fx07 get delay timer
+                def op():
+                    R[x] = state.delay_timer
+            case 0x0a:      # fx0a get key
+                is_pressed = keyboard.is_pressed
+                def op():
+                    keypress = is_pressed()
+                    if keypress is False:
+                        state.pc = (state.pc - 2) & mask
+                        raise Idle # keys only change between frames
+                    else:
+                        R[x] = keypress
+            case 0x15:      # fx15 set delay timer to vx
+                def op():
+                    state.delay_timer = R[x]
+            case 0x18:      # fx18 set sound timer to vx
+                def op():
+                    state.sound_timer = R[x]
+            case 0x1e:      # fx1e add to index
+                def op():
+                    index = state.index + R[x]
+                    if index > mask:
+                        R[0xf] = 1
+                    state.index = index & mask
+            case 0x29:      # fx29 set I to font location for char x
+                def op():
+                    state.index = R[x] * 5 + FONTSTART
+            case 0x30 if extended:  # fx30 set I to big font location for char x
+                def op():
+                    state.index = (R[x] & 0xf) * 10 + BIGFONTSTART
+            case 0x3a if xochip:    # fx3a set audio pitch to vx
+                def op():
+                    state.pitch = R[x]
+            case 0x33:      # fx33 BCD conversion
+                def op():
+                    index = state.index
+                    if index + 3 > memory:
+                        raise OverflowError("Out of memory while writing to RAM.")
+                    bcd = R[x]
+                    ram[index] = bcd // 100
+                    ram[index + 1] = (bcd % 100) // 10
+                    ram[index + 2] = bcd % 10
+                    invalidate(index, index + 3)
+            case 0x55:      # fx55 store registers to memory
+                count = x + 1
+                if self.quirks.memory_increment is None:
+                    def op():
+                        index = state.index
+                        if index + count > memory:
+                            raise OverflowError("Out of memory while writing to RAM.")
+                        ram[index:index + count] = R[:count]
+                        invalidate(index, index + count)
+                else:
+                    advance = x + self.quirks.memory_increment
+                    def op():
+                        index = state.index
+                        if index + count > memory:
+                            raise OverflowError("Out of memory while writing to RAM.")
+                        ram[index:index + count] = R[:count]
+                        state.index = (index + advance) & mask
+                        invalidate(index, index + count)
+            case 0x65:      # fx65 load registers from memory
+                count = x + 1
+                if self.quirks.memory_increment is None:
+                    def op():
+                        index = state.index
+                        values = ram[index:index + count]
+                        # reads past the end of RAM load zeros
+                        R[:len(values)] = values
+                        R[len(values):count] = bytes(count - len(values))
+                else:
+                    advance = x + self.quirks.memory_increment
+                    def op():
+                        index = state.index
+                        values = ram[index:index + count]
+                        R[:len(values)] = values
+                        R[len(values):count] = bytes(count - len(values))
+                        state.index = (index + advance) & mask
+            case 0x75 if extended:  # fx75 save v0..vx to the flag registers
+                count = x + 1
+                rpl = state.rpl
+                def op():
+                    rpl[:count] = R[:count]
+            case 0x85 if extended:  # fx85 load v0..vx from the flag registers
+                count = x + 1
+                rpl = state.rpl
+                def op():
+                    R[:count] = rpl[:count]
+            case _:
+                return None
+        return op
@@ -0,0 +1,200 @@
+import sys
+import struct
+import hashlib
+from Machine import Machine, TIMER_HZ
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+from Quirks import Quirks, PROFILES, resolve
+
+# Input movies: the key states of a session by emulated frame, plus the RNG seed and
+# machine settings, so a session can be replayed exactly and headless.
+#
+# File format (little endian):
+#   header   magic, version, seed, rom sha1, ips, quirk flags, length in frames, record count
+#   records  frame delta (LEB128 varint) + 16 bit mask of held keys, one per change
+
+MAGIC = b'C8MV'
+VERSION = 4
+HEADER = struct.Struct('<4sBQ20sIHII')
+# version 3 had a 16 bit ips, versions 1 (shift and jump flags only) and 2 a one byte
+# flags field as well
+V3_HEADER = struct.Struct('<4sBQ20sHHII')
+OLD_HEADER = struct.Struct('<4sBQ20sHBII')
+MAX_IPS = 0xffffffff
+
+SHIFT_FLAG = 0x1
+JUMP_FLAG = 0x2
+VF_RESET_FLAG = 0x4
+MEMORY_FLAG = 0x8           # Fx55/Fx65 move I ...
+MEMORY_PLUS_ONE_FLAG = 0x10 # ... to I + x + 1 rather than I + x
+WAIT_FLAG = 0x20
+WRAP_FLAG = 0x40
+SCHIP_FLAG = 0x80
+XOCHIP_FLAG = 0x100
+WRAP_START_FLAG = 0x200
+
+
+def pack_quirks(quirks:Quirks) -> int:
+    flags = ((SHIFT_FLAG if quirks.shift_vy else 0) | (JUMP_FLAG if quirks.jump_vx else 0)
+             | (VF_RESET_FLAG if quirks.vf_reset else 0) | (WAIT_FLAG if quirks.display_wait else 0)
+             | (WRAP_FLAG if quirks.wrap else 0) | (WRAP_START_FLAG if quirks.wrap_start else 0)
+             | {'chip8': 0, 'schip': SCHIP_FLAG, 'xochip': XOCHIP_FLAG}[quirks.instructions])
+    if quirks.memory_increment is not None:
+        flags |= MEMORY_FLAG | (MEMORY_PLUS_ONE_FLAG if quirks.memory_increment else 0)
+    return flags
+
+
+def unpack_quirks(flags:int) -> Quirks:
+    memory_increment = None
+    if flags & MEMORY_FLAG:
+        memory_increment = 1 if flags & MEMORY_PLUS_ONE_FLAG else 0
+    quirks = Quirks(shift_vy=bool(flags & SHIFT_FLAG), jump_vx=bool(flags & JUMP_FLAG),
+                    vf_reset=bool(flags & VF_RESET_FLAG), memory_increment=memory_increment,
+                    display_wait=bool(flags & WAIT_FLAG), wrap=bool(flags & WRAP_FLAG),
+                    wrap_start=bool(flags & WRAP_START_FLAG),
+                    instructions='xochip' if flags & XOCHIP_FLAG else 'schip' if flags & SCHIP_FLAG else 'chip8')
+    # keep the profile name when the flags match one
+    for profile in PROFILES.values():
+        if profile == quirks:
+            return profile
+    return quirks
+
+
+class Movie:
+
+    def __init__(self, seed:int, rom_hash:bytes, ips:int, quirks, script:dict = None, length:int = 0):
+        if not 0 < ips <= MAX_IPS:
+            raise ValueError(f"ips must be between 1 and {MAX_IPS} to be stored in a movie")
+        self.seed = seed
+        self.rom_hash = rom_hash
+        self.ips = ips
+        self.quirks = resolve(quirks)
+        self.script = dict(script or {})   # frame -> keys held from that frame on
+        self.length = length
+
+
+    # keyboard that plays the movie back, and quits when it ends
+    def player(self) -> ScriptedKeyboard:
+        return ScriptedKeyboard(self.script, quit_frame=self.length)
+
+
+    def pack(self) -> bytes:
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.seed, self.rom_hash, self.ips,
+                                    pack_quirks(self.quirks), self.length, len(self.script)))
+        last = 0
+        for frame in sorted(self.script):
+            delta = frame - last
+            last = frame
+            while delta >= 0x80:
+                out.append((delta & 0x7f) | 0x80)
+                delta >>= 7
+            out.append(delta)
+            out += sum(1 << key for key in self.script[frame]).to_bytes(2, 'little')
+        return bytes(out)
+
+
+    @classmethod
+    def unpack(cls, blob:bytes):
+        if len(blob) < OLD_HEADER.size or blob[:4] != MAGIC:
+            raise ValueError("Not a movie file.")
+        header = {VERSION: HEADER, 3: V3_HEADER}.get(blob[4], OLD_HEADER)
+        if len(blob) < header.size:
+            raise ValueError("Not a movie file.")
+        magic, version, seed, rom_hash, ips, flags, length, count = header.unpack_from(blob)
+        if version not in (1, 2, 3, VERSION):
+            raise ValueError(f"Unsupported movie version: {version}")
+
+        script = {}
+        offset = header.size
+        frame = 0
+        for _ in range(count):
+            delta = shift = 0
+            while True:
+                byte = blob[offset]
+                offset += 1
+                delta |= (byte & 0x7f) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            frame += delta
+            mask = int.from_bytes(blob[offset:offset + 2], 'little')
+            offset += 2
+            script[frame] = [key for key in range(16) if mask >> key & 1]
+
+        return cls(seed, rom_hash, ips, unpack_quirks(flags), script, length)
+
+
+    def save(self, filename:str):
+        with open(filename, 'wb') as file:
+            file.write(self.pack())
+
+
+    @classmethod
+    def load(cls, filename:str):
+        with open(filename, 'rb') as file:
+            return cls.unpack(file.read())
+
+
+# Wraps a live keyboard. Once per frame it samples which keys are held, records any
+# change and serves the game from the recorded state, so a live session and its replay
+# go through exactly the same input code path.
+class MovieRecorder(ScriptedKeyboard):
+
+    def __init__(self, keyboard):
+        super().__init__()
+        self.keyboard = keyboard
+        self.last_held = set()
+
+
+    def get_events(self):
+        live = self.keyboard.get_events()
+
+        # a key tapped and released within one frame still counts as held for that frame
+        held = {key for key in range(16) if live.get(key) or self.keyboard.is_pressed(key)}
+        # releases are served from the recording, drain the live keyboard's so they don't pile up
+        while self.keyboard.is_pressed() is not False:
+            pass
+        if held != self.last_held:
+            self.script[self.frame + 1] = sorted(held)
+            self.last_held = held
+
+        actions = super().get_events()
+        actions['quit'] = live['quit']
+        return actions
+
+
+    def movie(self, machine, rom:bytes) -> Movie:
+        return Movie(machine.seed, hashlib.sha1(rom).digest(), machine.cycles_per_frame * TIMER_HZ,
+                     machine.quirks, self.script, length=machine.frames)
+
+
+# replay a movie headless, at full speed
+def replay(movie:Movie, rom:bytes):
+    if hashlib.sha1(rom).digest() != movie.rom_hash:
+        raise ValueError("Movie was recorded with a different rom.")
+    display = NullDisplay()
+    machine = Machine(display, movie.player(), NullBeeper(), quirks=movie.quirks, ips=movie.ips,
+                      seed=movie.seed)
+    machine.load(rom)
+    stats = machine.run()
+    return machine, stats
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a CHIP-8 input movie headless.")
+    parser.add_argument("movie")
+    parser.add_argument("rom")
+    args = parser.parse_args(argv)
+
+    with open(args.rom, 'rb') as file:
+        rom = file.read()
+    machine, stats = replay(Movie.load(args.movie), rom)
+
+    print(f"{stats['frames']} frames, {stats['cycles']} instructions in {stats['seconds']:.3f}s "
+          f"({stats['ips']:,.0f} instructions/sec)")
+    print(f"screen {machine.display.screen_hash()}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import sys
+import time
+from array import array
+from debug_utils import describe, opcode_class
+
+# Cycle-level profiler.
+#
+# While attached, every handler the machine decodes is wrapped to count its executions
+# and host time, per ROM address and per opcode class. 2nnn/00EE keep a shadow call
+# stack, which gives the call graph edges and flamegraph stacks (one frame per routine,
+# named after its address). Sprites drawn are counted per 60 Hz frame.
+#
+#   profiler = Profiler()
+#   profiler.attach(machine)
+#   machine.run(1_000_000)
+#   print(profiler.report())
+#   profiler.write_folded("out.folded")    # flamegraph.pl out.folded > out.svg
+#
+# Nothing is wrapped while no profiler is attached, so normal runs pay nothing. The
+# recompiler is switched off while attached: blocks would bypass the wrapped handlers.
+
+ROOT = 'main'
+
+
+def routine_name(address:int) -> str:
+    return f'sub_{address:03X}'
+
+
+class Profiler:
+
+    def __init__(self):
+        self.machine = None
+        self._recompiler = None
+
+        self.addresses = {}             # address -> [executions, ns]
+        self.classes = {}               # opcode class -> [executions, ns]
+        self.edges = {}                 # (caller, callee) -> calls
+        self.stacks = {}                # call path -> [executions, ns]
+        self.path = (ROOT,)
+        self.current = self.stacks.setdefault(self.path, [0, 0])
+
+        self.sprites = 0                # drawn in the current frame
+        self.sprites_per_frame = array('I')
+
+
+    def attach(self, machine):
+        self.machine = machine
+        self._recompiler = machine.recompiler
+        machine.recompiler = None
+        machine.profiler = self
+        # handlers decoded so far are not wrapped
+        machine.decoded[:] = [None] * len(machine.decoded)
+
+
+    def detach(self):
+        machine = self.machine
+        machine.profiler = None
+        machine.decoded[:] = [None] * len(machine.decoded)
+        if self._recompiler is not None:
+            # its blocks missed every RAM write made while profiling
+            machine.recompiler = type(self._recompiler)(machine)
+        self.machine = self._recompiler = None
+
+
+    # wrap the handler decoded from 'opcode' at 'address'
+    def wrap(self, op, address:int, opcode:int):
+        clock = time.perf_counter_ns
+        per_address = self.addresses.setdefault(address, [0, 0])
+        per_class = self.classes.setdefault(opcode_class(opcode), [0, 0])
+
+        def profiled():
+            start = clock()
+            try:
+                return op()
+            finally:
+                elapsed = clock() - start
+                per_address[0] += 1
+                per_address[1] += elapsed
+                per_class[0] += 1
+                per_class[1] += elapsed
+                current = self.current
+                current[0] += 1
+                current[1] += elapsed
+
+        n1 = opcode >> 12
+        if n1 == 0x2:
+            target = opcode & 0xfff
+            def call():
+                result = profiled()
+                self._call(target)
+                return result
+            return call
+        if opcode == 0x00ee:
+            def ret():
+                result = profiled()
+                self._return()
+                return result
+            return ret
+        if n1 == 0xd:
+            def draw():
+                self.sprites += 1
+                return profiled()
+            return draw
+        return profiled
+
+
+    def _call(self, target:int):
+        callee = routine_name(target)
+        edge = (self.path[-1], callee)
+        self.edges[edge] = self.edges.get(edge, 0) + 1
+        self.path += (callee,)
+        self.current = self.stacks.setdefault(self.path, [0, 0])
+
+
+    def _return(self):
+        # a return with no matching call (attached mid-routine) stays at the root
+        if len(self.path) > 1:
+            self.path = self.path[:-1]
+            self.current = self.stacks.setdefault(self.path, [0, 0])
+
+
+    # called by the machine at every 60 Hz tick
+    def end_frame(self):
+        self.sprites_per_frame.append(self.sprites)
+        self.sprites = 0
+
+
+    # inclusive [executions, ns] per routine, from the call stacks
+    def routines(self) -> dict:
+        totals = {}
+        for path, (count, ns) in self.stacks.items():
+            for name in set(path):
+                total = totals.setdefault(name, [0, 0])
+                total[0] += count
+                total[1] += ns
+        return totals
+
+
+    def report(self, limit:int = 20) -> str:
+        executions = sum(count for count, ns in self.classes.values()) or 1
+        host = sum(ns for count, ns in self.classes.values()) or 1
+        ram = self.machine.state.ram if self.machine is not None else None
+        lines = [f'{executions:,} instructions, {host / 1e6:,.1f} ms host time', '']
+
+        def table(title, rows):
+            lines.append(f'{title:<28} {"count":>12} {"%":>6} {"ms":>10} {"%":>6} {"ns/op":>8}')
+            for name, (count, ns) in rows[:limit]:
+                lines.append(f'{name:<28} {count:>12,} {100 * count / executions:>6.1f} '
+                             f'{ns / 1e6:>10.2f} {100 * ns / host:>6.1f} {ns / max(count, 1):>8.0f}')
+            lines.append('')
+
+        by_time = lambda item: -item[1][1]
+        table('opcode class', sorted(self.classes.items(), key=by_time))
+
+        def label(address):
+            if ram is None:
+                return f'{address:03X}'
+            opcode = (ram[address] << 8) | ram[(address + 1) % len(ram)]
+            return f'{address:03X} {describe(opcode)}'[:28]
+        hot = sorted(self.addresses.items(), key=lambda item: -item[1][0])
+        table('address', [(label(address), stats) for address, stats in hot])
+
+        table('routine (inclusive)', sorted(self.routines().items(), key=by_time))
+
+        lines.append(f'{"call edge":<28} {"calls":>12}')
+        for (caller, callee), calls in sorted(self.edges.items(), key=lambda item: -item[1])[:limit]:
+            lines.append(f'{caller + " -> " + callee:<28} {calls:>12,}')
+        lines.append('')
+
+        frames = len(self.sprites_per_frame)
+        if frames:
+            lines.append(f'sprites per frame: mean {sum(self.sprites_per_frame) / frames:.1f}, '
+                         f'max {max(self.sprites_per_frame)} over {frames} frames')
+        return '\n'.join(lines)
+
+
+    # one 'main;sub_2A4;sub_31C <weight>' line per call stack, for flamegraph.pl and
+    # speedscope. weight is 'cycles' (emulated instructions) or 'time' (host ns).
+    def write_folded(self, filename:str, weight:str = 'cycles'):
+        column = {'cycles': 0, 'time': 1}[weight]
+        with open(filename, 'w') as file:
+            for path, stats in sorted(self.stacks.items()):
+                if stats[column]:
+                    file.write(f'{";".join(path)} {stats[column]}\n')
+
+
+def main(argv=None):
+    import argparse
+    from Machine import Machine
+    from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+
+    parser = argparse.ArgumentParser(description="Profile a CHIP-8 rom headless.")
+    parser.add_argument("rom")
+    parser.add_argument("--cycles", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=20, help="rows per table")
+    parser.add_argument("--folded", help="write flamegraph stacks to this file")
+    parser.add_argument("--weight", choices=('cycles', 'time'), default='cycles',
+                        help="what the flamegraph stacks measure")
+    args = parser.parse_args(argv)
+
+    with open(args.rom, 'rb') as file:
+        rom = file.read()
+
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), seed=args.seed)
+    machine.load(rom)
+    profiler = Profiler()
+    profiler.attach(machine)
+    machine.run(args.cycles)
+
+    print(profiler.report(args.limit))
+    if args.folded:
+        profiler.write_folded(args.folded, args.weight)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,10 @@
 import pygame
+import Backends
+
+GRIDKEY = (255, 0, 255) # transparent colour of the padding overlay
 
 # This will take care of memory mapping and displaying
-class Display:
+class Display(Backends.Display):
     LWIDTH = 64
     LHEIGHT = 32
 
@@ -15,13 +18,10 @@ class Display:
     WIDTH = (LWIDTH * PIXWIDTH) + ((LWIDTH + 1) * PADDING)
     HEIGHT = (LHEIGHT * PIXHEIGHT) + ((LHEIGHT + 1) * PADDING)
 
-    WHITE = (255, 204, 2)
-    BLACK = (153, 103, 0)
-
 
     def __init__(self):
-        self.mm_screen = [[0 for j in range(self.LWIDTH)] for i in range(self.LHEIGHT)]
-        pygame.init()  # safe to call more than once
+        super().__init__()
+        pygame.display.init()  # safe to call more than once; the mixer is left to Beeper
 
         self.window = pygame.display.set_mode((self.WIDTH, self.HEIGHT))
         pygame.display.set_caption("CHIP-8")
@@ -29,87 +29,63 @@ class Display:
         self.window.fill(self.BLACK)
         pygame.display.flip()
 
-    
-    # helper function to get list of bits from a byte
-    def _int_to_bits_bitwise(self, byte:int):
-        bits_list = []
-        for i in range(7, -1, -1):
-            # Check if the bit at position 'i' is set (1) or not (0)
-            bit = (byte >> i) & 1
-            bits_list.append(bit)
-        return bits_list
-    
-
-    def _update_screen_row(self, x:int, y:int, sprite_row:int) -> bool:
-        if y >= len(self.mm_screen):
-            raise ValueError("Out of range when drawing screen.")
-        
-        vf = False
-        screen_row = self.mm_screen[y]
-        bits_list = self._int_to_bits_bitwise(sprite_row)
-
-        for bit in bits_list:
-            if x >= len(screen_row):
-                break
-            if bit == 1:
-                if screen_row[x] == 1:
-                    screen_row[x] = 0
-                    vf = True
-                else: # screen_row[x] must be 0
-                    screen_row[x] = 1
-            x += 1
-
-        return vf
-    
-    # update a "screen" array (memory mapped monochrome window, consisting of a 2D array of bits)
-    # screen_arr - the screen array to read/write
-    # x,y - the coordinates to start the read/write
-    # sprite - the sprite data to write (bytearray of up to 16 bytes)
-    # returns True if any pixel was flipped from 1 to 0
-    def update_screen(self, x:int, y:int, sprite:bytearray) -> bool:
-        vf = False
-
-        # For N rows:
-        #     Get the Nth byte of sprite data, counting from the memory address in the I register (I is not incremented)
-        #     For each of the 8 pixels/bits in this sprite row (from left to right, ie. from most to least significant bit):
-        #         If the current pixel in the sprite row is on and the pixel at coordinates X,Y on the screen is also on, turn off the pixel and set VF to 1
-        #         Or if the current pixel in the sprite row is on and the screen pixel is not, draw the pixel at the X and Y coordinates
-        #         If you reach the right edge of the screen, stop drawing this row
-        #         Increment X (VX is not incremented)
-        #     Increment Y (VY is not incremented)
-        #     Stop if you reach the bottom edge of the screen
-        
-        for row in sprite:
-            if y >= len(self.mm_screen):
-                break
-            vf = self._update_screen_row(x, y, row)
-            y += 1
-            
-        return vf
-
-
-    def clear_screen(self):
-        self.mm_screen = [[0 for j in range(self.LWIDTH)] for i in range(self.LHEIGHT)]
-        self.window.fill(self.BLACK)
-
-
-    def _draw(self, logical_x, logical_y):
-        # draw a pixel
-        x = self.PADDING + logical_x * (self.PIXWIDTH + self.PADDING)
-        y = self.PADDING + logical_y * (self.PIXHEIGHT + self.PADDING)
-        pixel = pygame.Rect(x, y, self.PIXWIDTH, self.PIXHEIGHT)
-        pygame.draw.rect(self.window, self.WHITE, pixel)
-
-
-    def render_screen(self):        
-        self.window.fill(self.BLACK)
-
-        for y in range(self.LHEIGHT):            
-            for x in range(self.LWIDTH):
-                if self.mm_screen[y][x]:
-                    self._draw(x, y)
-        
-        pygame.display.flip()
+        # The logical screen is kept as an 8-bit surface the size of the framebuffer.
+        # Presenting scales it up in one call and lays the padding grid over it, instead
+        # of drawing every pixel.
+        self.scaled = pygame.Surface((self.LWIDTH * (self.PIXWIDTH + self.PADDING),
+                                      self.LHEIGHT * (self.PIXHEIGHT + self.PADDING)), depth=8)
+        self.scaled.set_palette(self.PALETTE)
+        self._layout()
+
+
+    # (re)build the logical surface and grid for the framebuffer's current resolution.
+    # The window keeps its size: SUPER-CHIP hi-res draws smaller cells without a grid.
+    def _layout(self):
+        framebuffer = self.framebuffer
+        self.surface = pygame.Surface((framebuffer.width, framebuffer.height), depth=8)
+        self.surface.set_palette(self.PALETTE)
+        self.cell_width = self.scaled.get_width() // framebuffer.width
+        self.cell_height = self.scaled.get_height() // framebuffer.height
+
+        self.grid = pygame.Surface((self.WIDTH, self.HEIGHT))
+        self.grid.fill(GRIDKEY)
+        self.grid.set_colorkey(GRIDKEY)
+        if self.PADDING and framebuffer.width == self.LWIDTH:
+            for x in range(self.LWIDTH + 1):
+                self.grid.fill(self.BLACK, (x * self.cell_width, 0, self.PADDING, self.HEIGHT))
+            for y in range(self.LHEIGHT + 1):
+                self.grid.fill(self.BLACK, (0, y * self.cell_height, self.WIDTH, self.PADDING))
+
+
+    # Present the rows changed since the last call. Cheap to call every frame: does
+    # nothing when no draw or clear happened in between.
+    def render_screen(self):
+        framebuffer = self.framebuffer
+        dirty = framebuffer.take_dirty()
+        if not dirty:
+            return
+        if self.surface.get_size() != (framebuffer.width, framebuffer.height):
+            self._layout()
+
+        # upload the dirty rows into the logical surface
+        pitch = self.surface.get_pitch()
+        pixels = self.surface.get_buffer()
+        top = (dirty & -dirty).bit_length() - 1
+        bottom = dirty.bit_length()
+        for y in range(top, bottom):
+            if dirty >> y & 1:
+                pixels.write(framebuffer.index_row(y), y * pitch)
+        del pixels # unlocks the surface
+
+        # scale in one go and redraw only the band of rows that changed
+        pygame.transform.scale(self.surface, self.scaled.get_size(), self.scaled)
+        band_y = top * self.cell_height
+        band_height = (bottom - top) * self.cell_height
+        self.window.blit(self.scaled, (self.PADDING, self.PADDING + band_y), (0, band_y, self.scaled.get_width(), band_height))
+        band = pygame.Rect(0, band_y, self.WIDTH, band_height + self.PADDING)
+        self.window.blit(self.grid, band, band)
+
+        pygame.display.update(band)
     
 
     def quit(self):
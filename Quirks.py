@@ -0,0 +1,104 @@
+# Quirk profiles: the behaviours that differ between CHIP-8 platforms.
+#
+# A machine takes one profile for its lifetime and its decoder builds handlers that
+# already have the profile's behaviour baked in, so the hot loop never looks at a flag.
+#
+#   shift_vy          8xy6/8xyE shift VY into VX (COSMAC) instead of shifting VX in place
+#   jump_vx           Bxnn jumps to xnn + VX (CHIP-48) instead of nnn + V0
+#   vf_reset          8xy1/8xy2/8xy3 clear VF
+#   memory_increment  Fx55/Fx65 leave I at I + x + memory_increment, None leaves I alone
+#   display_wait      Dxyn waits for the next frame (the VIP drew in the vertical blank)
+#   wrap              sprites wrap around the screen edges instead of being clipped
+#   wrap_start        Dxyn starts the sprite at (VX % 64, VY % 32) and clips only what is
+#                     past the edges; off, a sprite starting off screen is not drawn. SUPER-CHIP
+#                     and XO-CHIP sprites always wrap their start
+#   instructions      opcode set: 'chip8', 'schip' (hi-res, scrolling, 16x16 sprites) or
+#                     'xochip' (schip plus bitplanes, 64 KB of memory and its own opcodes)
+#
+# 'legacy' is how this emulator behaved before profiles existed, and stays the default
+# so existing movies, snapshots and batch results are unchanged.
+
+
+class Quirks:
+
+    FIELDS = ('shift_vy', 'jump_vx', 'vf_reset', 'memory_increment', 'display_wait', 'wrap', 'wrap_start',
+              'instructions')
+    INSTRUCTION_SETS = ('chip8', 'schip', 'xochip')
+
+    def __init__(self, name:str = 'custom', shift_vy=False, jump_vx=False, vf_reset=False,
+                 memory_increment=None, display_wait=False, wrap=False, wrap_start=False, instructions='chip8'):
+        if instructions not in self.INSTRUCTION_SETS:
+            raise ValueError(f"Unknown instruction set: {instructions}")
+        self.name = name
+        self.shift_vy = shift_vy
+        self.jump_vx = jump_vx
+        self.vf_reset = vf_reset
+        self.memory_increment = memory_increment
+        self.display_wait = display_wait
+        self.wrap = wrap
+        self.wrap_start = wrap_start
+        self.instructions = instructions
+
+    # bytes of memory the instruction set can address
+    @property
+    def memory(self) -> int:
+        return 0x10000 if self.instructions == 'xochip' else 0x1000
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.FIELDS)
+        return f'Quirks({self.name!r}, {fields})'
+
+    def __eq__(self, other):
+        return isinstance(other, Quirks) and self.as_dict() == other.as_dict()
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    # a copy with some behaviours changed
+    def replace(self, **changes):
+        unknown = changes.keys() - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown quirks: {', '.join(sorted(unknown))}")
+        fields = self.as_dict()
+        fields.update(changes)
+        return Quirks('custom' if changes else self.name, **fields)
+
+
+PROFILES = {
+    'legacy': Quirks('legacy', shift_vy=True, jump_vx=True),
+    'chip8':  Quirks('chip8', shift_vy=True, vf_reset=True, memory_increment=1, display_wait=True, wrap_start=True),
+    'chip48': Quirks('chip48', jump_vx=True, memory_increment=0, wrap_start=True),
+    'schip':  Quirks('schip', jump_vx=True, instructions='schip'),
+    'xochip': Quirks('xochip', shift_vy=True, memory_increment=1, wrap=True, instructions='xochip'),
+}
+DEFAULT = 'legacy'
+
+
+# Quirks from a profile name, a Quirks, or a dict of a 'profile' name plus overrides
+# (as in batch manifests and the rom database). None is the default profile.
+def resolve(quirks) -> Quirks:
+    if quirks is None:
+        return PROFILES[DEFAULT]
+    if isinstance(quirks, Quirks):
+        return quirks
+    if isinstance(quirks, str):
+        if quirks not in PROFILES:
+            raise ValueError(f"Unknown quirk profile: {quirks}")
+        return PROFILES[quirks]
+    overrides = dict(quirks)
+    profile = resolve(overrides.pop('profile', None))
+    return profile.replace(**overrides) if overrides else profile
+
+
+# Rom database: a JSON object of rom SHA-1 (hex) -> profile name or {"profile": ..., overrides}
+def load_database(filename:str) -> dict:
+    import json # not needed by runs that never read a database
+    with open(filename) as file:
+        return {sha1.lower(): entry for sha1, entry in json.load(file).items()}
+
+
+# the profile the database lists for 'rom', or 'default' if it is not listed
+def for_rom(rom:bytes, database:dict, default=None) -> Quirks:
+    import hashlib
+    entry = database.get(hashlib.sha1(rom).hexdigest())
+    return resolve(entry if entry is not None else default)
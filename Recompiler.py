@@ -0,0 +1,415 @@
+# Dynamic recompiler: translates hot CHIP-8 basic blocks into Python functions.
+#
+# A block starts at the current pc and runs straight-line code up to the first control
+# transfer (1nnn, 2nnn, 00EE, Bnnn, a skip), which ends it. The block is emitted as
+# Python source with V0-VF and I held in local variables, loaded when first used and written
+# back once on exit (Fx55 and Fx65 copy between RAM and the registers directly), compiled
+# with compile()/exec and cached by start address. Opcodes
+# the translator does not handle (Fx0A, unknown opcodes) end the block before them and
+# are left to the interpreter. A block returns the number of instructions it ran.
+#
+# Blocks are only translated once their address has been reached HOT_THRESHOLD times, so
+# code that runs once is not worth the compile. Writes into RAM (Fx33, Fx55) invalidate
+# every block overlapping the written bytes; one that lands in the rest of the running
+# block leaves it early, so the instructions after it are run from the new bytes. A jump
+# closing a wait loop (see Idle) raises Idle like the interpreter does.
+#
+# Deeply nested calls gain little: most of their blocks are a lone 2nnn or 00EE, where
+# the block call costs about what interpreting it would (handing those to the interpreter
+# instead measured slower still).
+
+from Idle import Idle, is_idle_loop, LOOKBACK
+
+HOT_THRESHOLD = 8
+MAX_BLOCK = 64 # instructions
+PAGE_BITS = 6
+
+INTERPRET = (None, 0) # marker: no block can start at this address
+
+
+class Recompiler:
+
+    def __init__(self, machine):
+        self.machine = machine
+        self.state = machine.state
+        size = len(self.state.ram)
+        self.blocks = [None] * size     # (function, length) per start address
+        self.hits = [0] * size
+        self.pages = {}                 # page number -> start addresses of blocks touching it
+        self.extents = {}               # start address -> end address (exclusive)
+
+
+    # execute exactly 'count' instructions
+    def run(self, count:int):
+        state = self.state
+        blocks = self.blocks
+        hits = self.hits
+        step = self.machine.step
+
+        while count > 0:
+            pc = state.pc
+            block = blocks[pc]
+            if block is None:
+                hits[pc] += 1
+                if hits[pc] < HOT_THRESHOLD:
+                    step()
+                    count -= 1
+                    continue
+                block = blocks[pc] = self.translate(pc)
+
+            function, length = block
+            if function is None or length > count:
+                step()
+                count -= 1
+            else:
+                count -= function()
+
+
+    # translate blocks starting at 'addresses' now rather than once they get hot
+    def prewarm(self, addresses):
+        blocks = self.blocks
+        for address in addresses:
+            if blocks[address] is None:
+                blocks[address] = self.translate(address)
+
+
+    # forget blocks overlapping ram[start:end] (an instruction up to 3 bytes before start
+    # overlaps too: XO-CHIP F000 nnnn is 4 bytes, and skips look at the next instruction).
+    # Called from Machine.invalidate, only for writes near code.
+    def invalidate(self, start:int, end:int):
+        start = max(start - 3, 0)
+        pages = self.pages
+        extents = self.extents
+        for page in range(start >> PAGE_BITS, ((end - 1) >> PAGE_BITS) + 1):
+            starts = pages.get(page)
+            if starts:
+                for block_start in [block_start for block_start in starts
+                                    if block_start < end and extents[block_start] > start]:
+                    self._drop(block_start)
+
+
+    def _drop(self, block_start:int):
+        end = self.extents.pop(block_start)
+        for page in range(block_start >> PAGE_BITS, ((end - 1) >> PAGE_BITS) + 1):
+            self.pages[page].discard(block_start)
+        self.blocks[block_start] = None
+        self.hits[block_start] = 0
+
+
+    def translate(self, start:int):
+        ram = self.state.ram
+        emitter = _BlockEmitter(self.machine, start)
+
+        address = start
+        length = 0
+        ended = False
+        while length < MAX_BLOCK and address + 1 < len(ram) and not ended:
+            opcode = (ram[address] << 8) | ram[address + 1]
+            result = emitter.emit(opcode, address)
+            if result is None:
+                break
+            length += 1
+            address += 2
+            ended = result
+
+        end = max(address, start + 2)
+        self.extents[start] = end
+        self.machine.code[start:end] = b'\1' * (end - start)
+        for page in range(start >> PAGE_BITS, ((end - 1) >> PAGE_BITS) + 1):
+            self.pages.setdefault(page, set()).add(start)
+
+        if length == 0:
+            return INTERPRET
+        if not ended:
+            emitter.exit.append(f"state.pc = {address % len(ram)}")
+        return (emitter.build(end, length), length)
+
+
+# Collects the Python source for one block
+class _BlockEmitter:
+
+    def __init__(self, machine, start:int):
+        self.machine = machine
+        self.start = start
+        self.body = []
+        self.exit = []          # runs after registers are written back
+        self.loaded = set()     # registers held in locals
+        self.written = set()    # registers whose local differs from R
+        self.uses_index = False
+        self.writes_index = False
+
+
+    # registers are loaded into locals when first needed, and written back on exit
+    def _r(self, *registers):
+        for r in registers:
+            if r not in self.loaded:
+                self.body.append(f"v{r:x} = R[{r}]")
+                self.loaded.add(r)
+
+    def _w(self, *registers):
+        self._r(*registers)
+        self.written.update(registers)
+
+
+    # Append the code for one opcode. Returns False to continue the block, True if the
+    # opcode ends it, or None if it cannot be translated (the block stops before it).
+    def emit(self, opcode:int, address:int):
+        body = self.body
+        memory = len(self.machine.state.ram)
+        n1 = (opcode >> 12) & 0xf
+        x = (opcode >> 8) & 0xf
+        y = (opcode >> 4) & 0xf
+        n = opcode & 0xf
+        nn = opcode & 0xff
+        nnn = opcode & 0xfff
+        vx = f"v{x:x}"
+        vy = f"v{y:x}"
+        next_pc = (address + 2) % memory
+        skip_pc = (address + 4) % memory
+        if (self.machine.quirks.instructions == 'xochip'
+                and self.machine.state.ram[address + 2:address + 4] == b'\xf0\x00'):
+            skip_pc = (address + 6) % memory    # skip all of F000 nnnn
+
+        match n1:
+            case 0x0:
+                if opcode == 0x00e0:            # 00e0 clear screen
+                    body.append("clear()")
+                    return False
+                if opcode == 0x00ee:            # 00ee return from subroutine
+                    self.exit += self._stack("state.pc = stack_pop()", next_pc)
+                    return True
+                return None
+            case 0x1:                           # 1nnn jump
+                self.exit.append(f"state.pc = {nnn}")
+                if is_idle_loop(self.machine.state.ram, address, nnn):
+                    self.exit.append("raise Idle")
+                return True
+            case 0x2:                           # 2nnn call subroutine
+                self.exit += self._stack(f"stack_push({next_pc})", next_pc)
+                self.exit.append(f"state.pc = {nnn}")
+                return True
+            case 0x3:                           # 3xnn skip if vx == nn
+                self._r(x)
+                return self._skip(f"{vx} == {nn}", next_pc, skip_pc)
+            case 0x4:                           # 4xnn skip if vx != nn
+                self._r(x)
+                return self._skip(f"{vx} != {nn}", next_pc, skip_pc)
+            case 0x5 if n == 0:                 # 5xy0 skip if vx == vy
+                self._r(x, y)
+                return self._skip(f"{vx} == {vy}", next_pc, skip_pc)
+            case 0x6:                           # 6xnn set register vx
+                self._w(x)
+                body.append(f"{vx} = {nn}")
+                return False
+            case 0x7:                           # 7xnn add value to register vx
+                self._w(x)
+                body.append(f"{vx} = ({vx} + {nn}) & 0xff")
+                return False
+            case 0x8:
+                return self._alu(x, y, n, vx, vy)
+            case 0x9 if n == 0:                 # 9xy0 skip if vx != vy
+                self._r(x, y)
+                return self._skip(f"{vx} != {vy}", next_pc, skip_pc)
+            case 0xa:                           # annn set index register I
+                self.writes_index = True
+                body.append(f"I = {nnn}")
+                return False
+            case 0xb:                           # bnnn jump with offset
+                if self.machine.quirks.jump_vx:
+                    self._r(x)
+                    self.exit.append(f"state.pc = ({nnn} + {vx}) & {self.machine._pc_mask}")
+                else:
+                    self._r(0)
+                    self.exit.append(f"state.pc = ({nnn} + v0) & {self.machine._pc_mask}")
+                return True
+            case 0xc:                           # cxnn random
+                self._w(x)
+                body.append(f"{vx} = {nn} & randint(0, 0xff)")
+                return False
+            case 0xd:                           # dxyn draw
+                self._r(x, y)
+                self._w(0xf)
+                self.uses_index = True
+                if self.machine.quirks.instructions != 'chip8':
+                    wrap = self.machine.quirks.wrap
+                    body.append(f"vf = 1 if sprite({vx}, {vy}, ram, I, {n}, {wrap}) else 0")
+                else:
+                    body.append(f"vf = 1 if draw({vx}, {vy}, ram[I:I + {n}]) else 0")
+                if self.machine.quirks.display_wait:
+                    self.exit += [f"state.pc = {next_pc}", "raise Idle"]
+                    return True
+                return False
+            case 0xe if nn == 0x9e:             # ex9e skip if vx key pressed
+                self._r(x)
+                return self._skip(f"is_pressed({vx})", next_pc, skip_pc)
+            case 0xe if nn == 0xa1:             # exa1 skip if vx key not pressed
+                self._r(x)
+                return self._skip(f"not is_pressed({vx})", next_pc, skip_pc)
+            case 0xf:
+                return self._misc(x, nn, vx, address, next_pc)
+        return None
+
+
+    def _skip(self, condition, next_pc, skip_pc):
+        self.exit.append(f"state.pc = {skip_pc} if {condition} else {next_pc}")
+        return True
+
+
+    def _alu(self, x, y, n, vx, vy):
+        body = self.body
+        quirks = self.machine.quirks
+        src = vy if quirks.shift_vy else vx
+        if n not in (0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0xe):
+            return None
+        self._r(y)
+        self._w(x)
+        if n >= 0x4 or (n >= 0x1 and quirks.vf_reset):
+            self._w(0xf)
+        match n:
+            case 0x0:       # 8xy0 set x = y
+                body.append(f"{vx} = {vy}")
+            case 0x1:       # 8xy1 binary OR
+                body.append(f"{vx} = {vx} | {vy}")
+            case 0x2:       # 8xy2 binary AND
+                body.append(f"{vx} = {vx} & {vy}")
+            case 0x3:       # 8xy3 binary XOR
+                body.append(f"{vx} = {vx} ^ {vy}")
+            case 0x4:       # 8xy4 add with carry
+                body += [f"t = {vx} + {vy}", f"{vx} = t & 0xff", "vf = t >> 8"]
+            case 0x5:       # 8xy5 vx - vy
+                body += [f"t = {vx} - {vy}", f"{vx} = t & 0xff", "vf = 1 if t >= 0 else 0"]
+            case 0x6:       # 8xy6 right shift
+                body += [f"t = {src}", f"{vx} = t >> 1", "vf = t & 0x1"]
+            case 0x7:       # 8xy7 vy - vx
+                body += [f"t = {vy} - {vx}", f"{vx} = t & 0xff", "vf = 1 if t >= 0 else 0"]
+            case 0xe:       # 8xye left shift
+                body += [f"t = {src}", f"{vx} = (t << 1) & 0xff", "vf = t >> 7"]
+        if 0x1 <= n <= 0x3 and quirks.vf_reset:
+            body.append("vf = 0")
+        return False
+
+
+    # a stack push or pop that, when the stack over- or underflows, leaves pc after the
+    # instruction like the interpreter does
+    def _stack(self, line:str, next_pc:int) -> list:
+        return ["try:", f"    {line}", "except IndexError:", f"    state.pc = {next_pc}", "    raise"]
+
+
+    # code that writes back what the block changed so far and leaves after the instruction
+    # at 'address', instead of running the rest of the block
+    def _leave(self, address:int, next_pc:int) -> list:
+        lines = [f"R[{r}] = v{r:x}" for r in sorted(self.written)]
+        lines += ["state.index = I", f"state.pc = {next_pc}"]
+        return lines
+
+
+    # a write of 'count' bytes at I, out of memory: raise like the interpreter does
+    def _bounds(self, count:int, address:int, next_pc:int) -> list:
+        memory = len(self.machine.state.ram)
+        return ([f"if I + {count} > {memory}:"]
+                + [f"    {line}" for line in self._leave(address, next_pc)]
+                + ["    raise OverflowError('Out of memory while writing to RAM.')"])
+
+
+    # after a write of 'count' bytes at 'base': drop what was decoded from them, and leave
+    # if they were in the rest of this block (see Machine.invalidate for the margins)
+    def _wrote(self, base:str, count:int, address:int, next_pc:int) -> list:
+        executed = (address - self.start) // 2 + 1
+        return ([f"invalidate({base}, {base} + {count})",
+                 f"if {base} < block_end + 3 and {base} + {count + LOOKBACK} > {next_pc}:"]
+                + [f"    {line}" for line in self._leave(address, next_pc)]
+                + [f"    return {executed}"])
+
+
+    def _misc(self, x, nn, vx, address, next_pc):
+        body = self.body
+        increment = self.machine.quirks.memory_increment
+        mask = self.machine._pc_mask
+        match nn:
+            case 0x07:      # fx07 get delay timer
+                self._w(x)
+                body.append(f"{vx} = state.delay_timer")
+            case 0x15:      # fx15 set delay timer to vx
+                self._r(x)
+                body.append(f"state.delay_timer = {vx}")
+            case 0x18:      # fx18 set sound timer to vx
+                self._r(x)
+                body.append(f"state.sound_timer = {vx}")
+            case 0x1e:      # fx1e add to index, VF set on overflow
+                self._r(x)
+                self._w(0xf)
+                self.uses_index = self.writes_index = True
+                body += [f"I += {vx}", f"if I > {mask}:", "    vf = 1", f"    I &= {mask}"]
+            case 0x29:      # fx29 set I to font location for char x
+                self._r(x)
+                self.writes_index = True
+                body.append(f"I = {vx} * 5 + {self.machine.state.FONTSTART}")
+            case 0x65:      # fx65 load registers from memory
+                self.uses_index = True
+                count = x + 1
+                # straight into R, the registers are loaded again if the block reads them
+                self.loaded.difference_update(range(count))
+                self.written.difference_update(range(count))
+                # reads past the end of RAM load zeros
+                body += [f"t = ram[I:I + {count}]", f"if len(t) < {count}:", f"    t += bytes({count} - len(t))",
+                         f"R[:{count}] = t"]
+                if increment is not None:
+                    self.writes_index = True
+                    body.append(f"I = (I + {x + increment}) & {mask}")
+            case 0x33:      # fx33 BCD conversion
+                self._r(x)
+                self.uses_index = True
+                body += self._bounds(3, address, next_pc)
+                body += [f"ram[I] = {vx} // 100", f"ram[I + 1] = ({vx} % 100) // 10", f"ram[I + 2] = {vx} % 10"]
+                body += self._wrote("I", 3, address, next_pc)
+            case 0x55:      # fx55 store registers to memory
+                count = x + 1
+                self.uses_index = True
+                body += self._bounds(count, address, next_pc)
+                # straight from R, once the registers changed in locals are written back
+                stored = sorted(self.written.intersection(range(count)))
+                body += [f"R[{r}] = v{r:x}" for r in stored]
+                self.written.difference_update(stored)
+                body.append(f"ram[I:I + {count}] = R[:{count}]")
+                base = "I"
+                if increment is not None:
+                    self.writes_index = True
+                    body += ["t = I", f"I = (I + {x + increment}) & {mask}"]
+                    base = "t"
+                body += self._wrote(base, count, address, next_pc)
+            case _:
+                return None
+        return False
+
+
+    # the block's function; 'end' is the address after its last instruction, 'length' the
+    # number of instructions in it
+    def build(self, end:int, length:int):
+        machine = self.machine
+        start = self.start
+        lines = []
+        if self.uses_index or self.writes_index:
+            lines.append("I = state.index")
+        lines += self.body
+        lines += [f"R[{r}] = v{r:x}" for r in sorted(self.written)]
+        if self.writes_index:
+            lines.append("state.index = I")
+        lines += self.exit
+        lines.append(f"return {length}")
+
+        source = (
+            "def make(state, R, ram, stack_push, stack_pop, draw, sprite, clear, randint, is_pressed,"
+            " invalidate, block_end):\n"
+            f"    def block_{start:03x}():\n"
+            + "".join(f"        {line}\n" for line in lines)
+            + f"    return block_{start:03x}\n"
+        )
+        namespace = {'Idle': Idle}
+        exec(compile(source, f"<block {start:03x}>", "exec"), namespace)
+        state = machine.state
+        framebuffer = machine.display.framebuffer
+        draw = (framebuffer.draw_wrapped if machine.quirks.wrap else
+                framebuffer.draw_wrapped_start if machine.quirks.wrap_start else framebuffer.draw)
+        return namespace['make'](state, state.registers, state.ram, state.stack_push, state.stack_pop,
+                                 draw, framebuffer.draw_sprite, framebuffer.clear, machine.rng.randint,
+                                 machine.keyboard.is_pressed, machine.invalidate, end)
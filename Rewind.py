@@ -0,0 +1,133 @@
+from collections import deque
+from Snapshot import Snapshot
+
+# Bounded rewind history, recorded once per 60 Hz frame.
+#
+# Every frame the machine is packed into a snapshot image (see Snapshot) and compared
+# with the previous frame's image in small blocks. Only the blocks that changed are kept,
+# as XOR deltas, so the same entry takes the history one frame back or one frame forward.
+# The image grows and shrinks with the screen resolution, so each entry also keeps the
+# image length before and after its frame; blocks past the shorter one XOR against zeros.
+# Entries live in a ring buffer that drops the oldest frames once the memory cap is hit.
+#
+#   rewind = Rewind(machine)
+#   while machine.run_frame():
+#       rewind.record()
+#   rewind.seek(rewind.frame - 120)     # two seconds back
+
+BLOCK = 32
+ENTRY_OVERHEAD = 64 # rough per-block cost of the tuple and bytes headers
+
+
+class Rewind:
+
+    def __init__(self, machine, max_bytes:int = 16 * 1024 * 1024):
+        self.machine = machine
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        self.entries = deque()          # entries[i] turns frame base+i into base+i+1 and back
+        self.base = machine.frames      # frame number of the oldest reachable state
+        self.position = 0               # number of entries applied to reach the current state
+        self.image = bytearray(machine.snapshot().pack())
+
+
+    @property
+    def frame(self) -> int:
+        return self.base + self.position
+
+    @property
+    def oldest(self) -> int:
+        return self.base
+
+    @property
+    def newest(self) -> int:
+        return self.base + len(self.entries)
+
+
+    # call once per frame, after the frame has run
+    def record(self):
+        entries = self.entries
+
+        # recording after a rewind discards the old future
+        while len(entries) > self.position:
+            self.size -= self._cost(entries.pop())
+
+        image = self.machine.snapshot().pack()
+        previous = self.image
+        before = len(previous)
+        after = len(image)
+        size = max(before, after)
+        padded = image.ljust(size, b'\0')
+        previous = previous.ljust(size, b'\0')
+        blocks = []
+        for start in range(0, size, BLOCK):
+            new = padded[start:start + BLOCK]
+            old = previous[start:start + BLOCK]
+            if new != old:
+                xor = int.from_bytes(new, 'big') ^ int.from_bytes(old, 'big')
+                blocks.append((start, xor.to_bytes(len(new), 'big')))
+
+        delta = (before, after, tuple(blocks))
+        entries.append(delta)
+        self.size += self._cost(delta)
+        self.position += 1
+        self.image[:] = image
+
+        while self.size > self.max_bytes and len(entries) > 1:
+            self.size -= self._cost(entries.popleft())
+            self.base += 1
+            self.position -= 1
+
+
+    def step_back(self) -> bool:
+        if self.position == 0:
+            return False
+        self.position -= 1
+        self._apply(self.entries[self.position])
+        self._restore()
+        return True
+
+
+    def step_forward(self) -> bool:
+        if self.position == len(self.entries):
+            return False
+        self._apply(self.entries[self.position])
+        self.position += 1
+        self._restore()
+        return True
+
+
+    # move to frame number 'frame', in time proportional to the distance travelled
+    def seek(self, frame:int):
+        if not self.oldest <= frame <= self.newest:
+            raise IndexError(f"Frame {frame} is outside the rewind history ({self.oldest}-{self.newest}).")
+        entries = self.entries
+        while self.frame > frame:
+            self.position -= 1
+            self._apply(entries[self.position])
+        while self.frame < frame:
+            self._apply(entries[self.position])
+            self.position += 1
+        self._restore()
+
+
+    # the same entry goes either way: the image's length says which side of it we are on
+    def _apply(self, delta):
+        before, after, blocks = delta
+        image = self.image
+        length = after if len(image) == before else before
+        image.extend(bytes(max(before, after) - len(image)))
+        for start, xor in blocks:
+            end = start + len(xor)
+            value = int.from_bytes(image[start:end], 'big') ^ int.from_bytes(xor, 'big')
+            image[start:end] = value.to_bytes(len(xor), 'big')
+        del image[length:]
+
+
+    def _restore(self):
+        self.machine.restore(Snapshot.unpack(bytes(self.image)))
+
+
+    def _cost(self, delta) -> int:
+        return sum(len(xor) + ENTRY_OVERHEAD for start, xor in delta[2])
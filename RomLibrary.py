@@ -0,0 +1,269 @@
+import sys
+import os
+import mmap
+import json
+import hashlib
+import Quirks
+from State import State
+
+# Rom library: every rom under a set of directories, indexed by content.
+#
+# scan() walks the directories and records each rom under its SHA-1 with its size,
+# platform, quirk profile and title. The index is saved as JSON and loaded again in one
+# read, so a batch job resolves a hash to a rom with a dict lookup and never hashes
+# anything. Rescanning only hashes files whose size or modification time changed.
+#
+# rom(sha1) maps the file read-only and returns a memoryview of it, which Machine.load
+# copies straight into ram. Mappings are kept open (up to OPEN_LIMIT of them) so a rom
+# loaded again costs a stat of its file, which catches the file changing under the mapping.
+#
+#   python RomLibrary.py roms.json scan roms/
+#   python RomLibrary.py roms.json list --platform schip
+#
+#   library = RomLibrary.load('roms.json')
+#   machine = Machine(display, keyboard, beeper, quirks=library.quirks(sha1))
+#   machine.load(library.rom(sha1))
+#
+# The index, roms.json:
+#   {"version": 1,
+#    "roms":  {sha1: {"path", "size", "platform", "quirks", "title"}},
+#    "files": {path: [sha1, size, mtime_ns]}}
+# A rom found at several paths has one entry, with the first path; "files" lists them all.
+
+INDEX_VERSION = 1
+EXTENSIONS = {'.ch8': 'chip8', '.c8': 'chip8', '.sc8': 'schip', '.xo8': 'xochip'}
+PLATFORMS = ('chip8', 'schip', 'xochip') # each a superset of the one before
+PLATFORM_PROFILES = {'chip8': Quirks.DEFAULT, 'schip': 'schip', 'xochip': 'xochip'}
+OPEN_LIMIT = 256 # mapped roms kept open, each one holds a file descriptor
+
+# opcodes (masked) only the later platforms have. One on its own may be sprite data
+# that happens to line up, so detect() wants two different ones.
+SCHIP_OPCODES = {(0xffff, 0x00fb), (0xffff, 0x00fc), (0xffff, 0x00fd), (0xffff, 0x00fe), (0xffff, 0x00ff),
+                 (0xfff0, 0x00c0), (0xf0ff, 0xf030), (0xf0ff, 0xf075), (0xf0ff, 0xf085)}
+XOCHIP_OPCODES = {(0xffff, 0xf000), (0xffff, 0xf002), (0xf0ff, 0xf001), (0xf00f, 0x5002), (0xf00f, 0x5003),
+                  (0xf0ff, 0xf03a), (0xfff0, 0x00d0)}
+
+
+# platform of a rom, from its size, the opcodes in it and the file extension
+def detect(rom, extension:str = '') -> str:
+    if len(rom) > 0x1000 - State.ROMSTART:
+        return 'xochip'
+    found = {'schip': set(), 'xochip': set()}
+    opcodes = {(rom[i] << 8) | rom[i + 1] for i in range(0, len(rom) - 1, 2)}
+    for platform, markers in (('schip', SCHIP_OPCODES), ('xochip', XOCHIP_OPCODES)):
+        for mask, value in markers:
+            if any(opcode & mask == value for opcode in opcodes):
+                found[platform].add(value)
+    platform = EXTENSIONS.get(extension.lower(), 'chip8')
+    for candidate in ('schip', 'xochip'):
+        if len(found[candidate]) >= 2 and PLATFORMS.index(candidate) > PLATFORMS.index(platform):
+            platform = candidate
+    return platform
+
+
+# "15 Puzzle [Roger Ivie] (alt).ch8" -> "15 Puzzle"
+def title(path:str) -> str:
+    name = os.path.splitext(os.path.basename(path))[0]
+    text = []
+    depth = 0
+    for char in name:
+        if char in '[(':
+            depth += 1
+        elif char in '])':
+            depth = max(depth - 1, 0)
+        elif not depth:
+            text.append(char)
+    return ' '.join(''.join(text).replace('_', ' ').split()) or name
+
+
+class RomLibrary:
+
+    def __init__(self, roms:dict = None, files:dict = None):
+        self.roms = roms if roms is not None else {}     # sha1 -> entry
+        self.files = files if files is not None else {}  # path -> [sha1, size, mtime_ns]
+        self.open_roms = {} # sha1 -> mmap, oldest first
+
+
+    def __len__(self):
+        return len(self.roms)
+
+
+    def __contains__(self, sha1:str):
+        return sha1.lower() in self.roms
+
+
+    def entry(self, sha1:str) -> dict:
+        entry = self.roms.get(sha1.lower())
+        if entry is None:
+            raise KeyError(f"Rom not in library: {sha1}")
+        return entry
+
+
+    # index every rom under 'directories', hashing only new or changed files. Roms that
+    # were under them and are gone are dropped. 'database' is a Quirks rom database whose
+    # profiles win over the detected ones. Returns (files seen, files hashed).
+    def scan(self, directories:list, database:dict = None, extensions=EXTENSIONS):
+        seen = set()
+        hashed = 0
+        for directory in directories:
+            for path in _walk(os.path.abspath(directory), extensions):
+                stat = os.stat(path)
+                if stat.st_size == 0:
+                    continue
+                seen.add(path)
+                known = self.files.get(path)
+                if known is not None and known[1:] == [stat.st_size, stat.st_mtime_ns]:
+                    if known[0] in self.roms:
+                        continue
+                if known is not None:
+                    self._close(known[0]) # it may have been mapped from this file
+                with open(path, 'rb') as file:
+                    rom = file.read()
+                hashed += 1
+                sha1 = hashlib.sha1(rom).hexdigest()
+                self.files[path] = [sha1, stat.st_size, stat.st_mtime_ns]
+                if sha1 not in self.roms:
+                    platform = detect(rom, os.path.splitext(path)[1])
+                    quirks = database.get(sha1) if database else None
+                    self.roms[sha1] = {'path': path, 'size': len(rom), 'platform': platform,
+                                       'quirks': quirks if quirks is not None else PLATFORM_PROFILES[platform],
+                                       'title': title(path)}
+
+        roots = tuple(os.path.join(os.path.abspath(directory), '') for directory in directories)
+        for path in [path for path in self.files if path.startswith(roots) and path not in seen]:
+            del self.files[path]
+        self._relink()
+        return len(seen), hashed
+
+
+    # point every rom at a path that still has its contents, and drop roms with none
+    def _relink(self):
+        paths = {}
+        for path, (sha1, _, _) in self.files.items():
+            paths.setdefault(sha1, path)
+        for sha1 in list(self.roms):
+            if sha1 not in paths:
+                del self.roms[sha1]
+                self._close(sha1)
+            elif self.roms[sha1]['path'] not in self.files or self.files[self.roms[sha1]['path']][0] != sha1:
+                self.roms[sha1]['path'] = paths[sha1]
+
+
+    def quirks(self, sha1:str) -> Quirks.Quirks:
+        return Quirks.resolve(self.entry(sha1)['quirks'])
+
+
+    # the rom's contents, mapped from its file. Raises ValueError if the file changed
+    # since it was indexed (scan again), rather than hashing it on every load.
+    def rom(self, sha1:str) -> memoryview:
+        sha1 = sha1.lower()
+        path = self.entry(sha1)['path']
+        if not self._unchanged(sha1, path, os.stat(path)):
+            self._close(sha1)
+            raise ValueError(f"Rom file changed since it was indexed: {path}")
+        mapping = self.open_roms.pop(sha1, None)
+        if mapping is None:
+            with open(path, 'rb') as file:
+                if not self._unchanged(sha1, path, os.fstat(file.fileno())):
+                    raise ValueError(f"Rom file changed since it was indexed: {path}")
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            while len(self.open_roms) >= OPEN_LIMIT:
+                self._close(next(iter(self.open_roms)))
+        # most recently used last
+        self.open_roms[sha1] = mapping
+        return memoryview(mapping)
+
+
+    def _unchanged(self, sha1:str, path:str, stat) -> bool:
+        return self.files.get(path) == [sha1, stat.st_size, stat.st_mtime_ns]
+
+
+    def _close(self, sha1:str):
+        mapping = self.open_roms.pop(sha1, None)
+        if mapping is None:
+            return
+        try:
+            mapping.close()
+        except BufferError:
+            pass # a caller still holds a view of it, it closes when that goes away
+
+
+    def close(self):
+        for sha1 in list(self.open_roms):
+            self._close(sha1)
+
+
+    # entries matching every given field, e.g. find(platform='schip')
+    def find(self, **fields) -> list:
+        return [(sha1, entry) for sha1, entry in self.roms.items()
+                if all(entry.get(field) == value for field, value in fields.items())]
+
+
+    def save(self, filename:str):
+        # written next to the old index and swapped in, so a reader never sees half of it
+        temporary = filename + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'version': INDEX_VERSION, 'roms': self.roms, 'files': self.files}, file,
+                      separators=(',', ':'))
+        os.replace(temporary, filename)
+
+
+    @classmethod
+    def load(cls, filename:str):
+        with open(filename) as file:
+            index = json.load(file)
+        if index.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported rom library version: {index.get('version')}")
+        return cls(index['roms'], index['files'])
+
+
+def _walk(directory:str, extensions):
+    for item in os.scandir(directory):
+        if item.is_dir():
+            yield from _walk(item.path, extensions)
+        elif os.path.splitext(item.name)[1].lower() in extensions:
+            yield item.path
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Index CHIP-8 roms by content hash.")
+    parser.add_argument("index", help="library index file (JSON)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('scan', help="add the roms under these directories, rehashing changed files")
+    command.add_argument("directories", nargs='+')
+    command.add_argument("--quirk-db", help="Quirks rom database, its profiles win over detected ones")
+
+    command = commands.add_parser('list', help="list the indexed roms")
+    command.add_argument("--platform", choices=PLATFORMS)
+
+    command = commands.add_parser('show', help="show one rom's entry")
+    command.add_argument("sha1")
+    args = parser.parse_args(argv)
+
+    if args.command == 'scan':
+        library = RomLibrary.load(args.index) if os.path.exists(args.index) else RomLibrary()
+        database = Quirks.load_database(args.quirk_db) if args.quirk_db else None
+        start = time.perf_counter()
+        seen, hashed = library.scan(args.directories, database)
+        library.save(args.index)
+        print(f"{seen} files, {hashed} hashed, {len(library)} roms in the library "
+              f"({time.perf_counter() - start:.2f}s)")
+        return 0
+
+    library = RomLibrary.load(args.index)
+    if args.command == 'show':
+        print(json.dumps(library.entry(args.sha1), indent=1))
+        return 0
+
+    fields = {'platform': args.platform} if args.platform else {}
+    for sha1, entry in sorted(library.find(**fields), key=lambda item: item[1]['title'].lower()):
+        print(f"{sha1}  {entry['platform']:6} {entry['size']:6}  {entry['title']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
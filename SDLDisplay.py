@@ -1,7 +1,10 @@
+import ctypes
 import sdl2
+import sdl2.ext
+import Backends
 
 # This will take care of memory mapping and displaying
-class Display:
+class Display(Backends.Display):
     LWIDTH = 64
     LHEIGHT = 32
 
@@ -15,12 +18,13 @@ class Display:
     WIDTH = (LWIDTH * PIXWIDTH) + ((LWIDTH + 1) * PADDING)
     HEIGHT = (LHEIGHT * PIXHEIGHT) + ((LHEIGHT + 1) * PADDING)
 
-    WHITE = sdl2.ext.Color(255, 204, 2)
-    BLACK = sdl2.ext.Color(153, 103, 0)
+    WHITE = sdl2.ext.Color(*Backends.Display.WHITE)
+    BLACK = sdl2.ext.Color(*Backends.Display.BLACK)
+    PALETTE = [sdl2.ext.Color(*colour) for colour in Backends.Display.PALETTE]
 
 
     def __init__(self):
-        self.mm_screen = [[0 for j in range(self.LWIDTH)] for i in range(self.LHEIGHT)]
+        super().__init__()
         sdl2.ext.init()  # safe to call more than once
 
         self.window = sdl2.ext.Window("CHIP-8", size=(self.WIDTH, self.HEIGHT))
@@ -28,91 +32,74 @@ class Display:
 
         self.window.show()
 
-    
-    # helper function to get list of bits from a byte
-    def _int_to_bits_bitwise(self, byte:int):
-        bits_list = []
-        for i in range(7, -1, -1):
-            # Check if the bit at position 'i' is set (1) or not (0)
-            bit = (byte >> i) & 1
-            bits_list.append(bit)
-        return bits_list
-    
-
-    def _update_screen_row(self, x:int, y:int, sprite_row:int) -> bool:
-        if y >= len(self.mm_screen):
-            raise ValueError("Out of range when drawing screen.")
-        
-        vf = False
-        screen_row = self.mm_screen[y]
-        bits_list = self._int_to_bits_bitwise(sprite_row)
-
-        for bit in bits_list:
-            if x >= len(screen_row):
-                break
-            if bit == 1:
-                if screen_row[x] == 1:
-                    screen_row[x] = 0
-                    vf = True
-                else: # screen_row[x] must be 0
-                    screen_row[x] = 1
-            x += 1
-
-        return vf
-    
-    # update a "screen" array (memory mapped monochrome window, consisting of a 2D array of bits)
-    # screen_arr - the screen array to read/write
-    # x,y - the coordinates to start the read/write
-    # sprite - the sprite data to write (bytearray of up to 16 bytes)
-    # returns True if any pixel was flipped from 1 to 0
-    def update_screen(self, x:int, y:int, sprite:bytearray) -> bool:
-        vf = False
-
-        # For N rows:
-        #     Get the Nth byte of sprite data, counting from the memory address in the I register (I is not incremented)
-        #     For each of the 8 pixels/bits in this sprite row (from left to right, ie. from most to least significant bit):
-        #         If the current pixel in the sprite row is on and the pixel at coordinates X,Y on the screen is also on, turn off the pixel and set VF to 1
-        #         Or if the current pixel in the sprite row is on and the screen pixel is not, draw the pixel at the X and Y coordinates
-        #         If you reach the right edge of the screen, stop drawing this row
-        #         Increment X (VX is not incremented)
-        #     Increment Y (VY is not incremented)
-        #     Stop if you reach the bottom edge of the screen
-        
-        for row in sprite:
-            if y >= len(self.mm_screen):
-                break
-            vf = self._update_screen_row(x, y, row)
-            y += 1
-            
-        return vf
-
-
-    def clear_screen(self):
-        self.mm_screen = [[0 for j in range(self.LWIDTH)] for i in range(self.LHEIGHT)]
-        self.windowrenderer.clear(self.BLACK)
-
-
-    def _draw(self, logical_x, logical_y):
-        # draw a pixel
-        x = self.PADDING + logical_x * (self.PIXWIDTH + self.PADDING)
-        y = self.PADDING + logical_y * (self.PIXHEIGHT + self.PADDING)
-        self.windowrenderer.fill((x, y, self.PIXWIDTH, self.PIXHEIGHT), self.WHITE)
-
-
-    def render_screen(self):        
-        self.windowrenderer.clear(self.BLACK)
-
-        for y in range(self.LHEIGHT):            
-            for x in range(self.LWIDTH):
-                if self.mm_screen[y][x]:
-                    self._draw(x, y)
-        
-        self.windowrenderer.present()
+        # The logical screen is kept as an ARGB streaming texture the size of the
+        # framebuffer. Presenting uploads it in one call and stretches it over the window,
+        # then fills the padding grid.
+        self.target = sdl2.SDL_Rect(self.PADDING, self.PADDING,
+                                    self.LWIDTH * (self.PIXWIDTH + self.PADDING), self.LHEIGHT * (self.PIXHEIGHT + self.PADDING))
+
+        # one ARGB8888 pixel (little endian byte order) per palette index, and 8 pixels
+        # for every possible row byte of a single plane screen
+        self._colours = [bytes((colour.b, colour.g, colour.r, 0xff)) for colour in self.PALETTE]
+        on, off = self._colours[1], self._colours[0]
+        self._row_pixels = [b''.join(on if (byte >> i) & 1 else off for i in range(7, -1, -1)) for byte in range(256)]
+
+        self.texture = None
+        self._layout()
+
+
+    # (re)build the texture and grid for the framebuffer's current resolution. The window
+    # keeps its size: SUPER-CHIP hi-res draws smaller cells without a grid.
+    def _layout(self):
+        framebuffer = self.framebuffer
+        if self.texture is not None:
+            sdl2.SDL_DestroyTexture(self.texture)
+        self.size = (framebuffer.width, framebuffer.height)
+        self.pixels = bytearray(framebuffer.width * framebuffer.height * 4)
+        self._pixels_ptr = (ctypes.c_ubyte * len(self.pixels)).from_buffer(self.pixels)
+        self.texture = sdl2.SDL_CreateTexture(self.windowrenderer.sdlrenderer, sdl2.SDL_PIXELFORMAT_ARGB8888,
+                                              sdl2.SDL_TEXTUREACCESS_STREAMING, framebuffer.width, framebuffer.height)
+
+        self.grid = []
+        if self.PADDING and framebuffer.width == self.LWIDTH:
+            self.grid += [(x * (self.PIXWIDTH + self.PADDING), 0, self.PADDING, self.HEIGHT) for x in range(self.LWIDTH + 1)]
+            self.grid += [(0, y * (self.PIXHEIGHT + self.PADDING), self.WIDTH, self.PADDING) for y in range(self.LHEIGHT + 1)]
+
+
+    # Present the rows changed since the last call. Cheap to call every frame: does
+    # nothing when no draw or clear happened in between.
+    def render_screen(self):
+        framebuffer = self.framebuffer
+        dirty = framebuffer.take_dirty()
+        if not dirty:
+            return
+        if self.size != (framebuffer.width, framebuffer.height):
+            self._layout()
+
+        row_length = framebuffer.width * 4
+        single = len(framebuffer.planes) == 1
+        colours = self._colours
+        for y in range(dirty.bit_length()):
+            if dirty >> y & 1:
+                if single:
+                    row = framebuffer.expand_row(y, self._row_pixels)
+                else:
+                    row = b''.join([colours[index] for index in framebuffer.index_row(y)])
+                self.pixels[y * row_length:(y + 1) * row_length] = row
+
+        renderer = self.windowrenderer
+        sdl2.SDL_UpdateTexture(self.texture, None, self._pixels_ptr, row_length)
+        renderer.clear(self.BLACK)
+        sdl2.SDL_RenderCopy(renderer.sdlrenderer, self.texture, None, self.target)
+        if self.grid:
+            renderer.fill(self.grid, self.BLACK)
+        renderer.present()
     
 
     def quit(self):
         # Perform cleanup actions
         if self.windowrenderer:
+            sdl2.SDL_DestroyTexture(self.texture)
             sdl2.ext.quit() # This single call handles all sdl2.ext resources
 
         # General SDL cleanup
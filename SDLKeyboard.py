@@ -0,0 +1,65 @@
+import sdl2
+import sdl2.ext
+
+# Keyboard for the SDL front end, the same layout and behaviour as the pygame Keyboard
+class Keyboard():
+
+    keys = { 0:sdl2.SDL_SCANCODE_X,
+        1:sdl2.SDL_SCANCODE_1,
+        2:sdl2.SDL_SCANCODE_2,
+        3:sdl2.SDL_SCANCODE_3,
+        4:sdl2.SDL_SCANCODE_Q,
+        5:sdl2.SDL_SCANCODE_W,
+        6:sdl2.SDL_SCANCODE_E,
+        7:sdl2.SDL_SCANCODE_A,
+        8:sdl2.SDL_SCANCODE_S,
+        9:sdl2.SDL_SCANCODE_D,
+        0xa:sdl2.SDL_SCANCODE_Z,
+        0xb:sdl2.SDL_SCANCODE_C,
+        0xc:sdl2.SDL_SCANCODE_4,
+        0xd:sdl2.SDL_SCANCODE_R,
+        0xe:sdl2.SDL_SCANCODE_F,
+        0xf:sdl2.SDL_SCANCODE_V,
+        }
+
+    def __init__(self):
+        sdl2.ext.init()  # safe to call more than once
+        self.scancodes = {value: key for key, value in self.keys.items()}
+        self.released = [] # keys released this frame, for is_pressed() polls
+
+
+    def get_events(self):
+        actions = {'quit':False,'keydown':False}
+        # a release only ends an fx0a wait in the frame it happened in
+        self.released.clear()
+
+        for event in sdl2.ext.get_events():
+            if event.type == sdl2.SDL_QUIT:
+                actions['quit'] = True
+
+            elif event.type == sdl2.SDL_KEYDOWN and not event.key.repeat:
+                found_key = self.scancodes.get(event.key.keysym.scancode)
+                if found_key is not None:
+                    actions[found_key] = True
+                    actions['keydown'] = True
+
+            # Remember key releases for fx0a
+            elif event.type == sdl2.SDL_KEYUP:
+                found_key = self.scancodes.get(event.key.keysym.scancode)
+                if found_key is not None:
+                    self.released.append(found_key)
+
+        return actions
+
+
+    def is_pressed(self, key_hex:int = None):
+
+        #1. individual actions (collected by get_events, which pumps the queue once per frame)
+        if key_hex is None:
+            if self.released:
+                return self.released.pop(0)
+            return False
+
+        #2. Held down
+        keys_pressed = sdl2.SDL_GetKeyboardState(None)
+        return bool(keys_pressed[self.keys[key_hex & 0xf]])
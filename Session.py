@@ -0,0 +1,208 @@
+import sys
+import asyncio
+from Machine import Machine, IPS, TIMER_HZ
+from Backends import Display
+from Headless import ScriptedKeyboard
+
+# Emulator sessions driven by asyncio, for services that run many of them at once.
+#
+# Session.run() is a coroutine that runs one 60 Hz frame at a time and awaits between
+# frames, so any number of sessions share one event loop (and one thread). Input arrives
+# on an asyncio.Queue of (key, down) pairs, or QUIT; what the machine presents and plays
+# goes to every subscriber queue as
+#
+#   ('frame', frame, width, height, rows)   rows as Framebuffer.to_bytes(), only for
+#                                           frames that changed the screen
+#   ('beep', frame, on)                     the sound starting or stopping
+#   ('end', frame, None)                    the session is over
+#
+#   session = Session(rom)
+#   events = session.subscribe()
+#   asyncio.create_task(session.run())
+#   session.input.put_nowait((5, True))
+
+QUIT = None
+SUBSCRIBER_QUEUE = 8 # events kept for a subscriber that falls behind
+
+
+# Keyboard fed from an asyncio.Queue, drained once per frame without waiting
+class QueueKeyboard(ScriptedKeyboard):
+
+    def __init__(self, queue:asyncio.Queue):
+        super().__init__()
+        self.queue = queue
+
+
+    def get_events(self):
+        actions = super().get_events()
+        queue = self.queue
+        while not queue.empty():
+            event = queue.get_nowait()
+            if event is QUIT:
+                actions['quit'] = True
+                continue
+            key, down = event
+            key &= 0xf
+            if down and key not in self.held:
+                self.held.add(key)
+                actions[key] = True
+                actions['keydown'] = True
+            elif not down and key in self.held:
+                self.held.discard(key)
+                self.released.append(key)
+        return actions
+
+
+class _SessionDisplay(Display):
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+
+    def render_screen(self):
+        framebuffer = self.framebuffer
+        if framebuffer.take_dirty():
+            self.session.publish(('frame', self.session.machine.frames, framebuffer.width, framebuffer.height,
+                                  framebuffer.to_bytes()))
+
+
+class _SessionBeeper:
+
+    def __init__(self, session):
+        self.session = session
+        self.playing = False
+
+    def play(self):
+        if not self.playing:
+            self.playing = True
+            self.session.publish(('beep', self.session.machine.frames, True))
+
+    def stop(self):
+        if self.playing:
+            self.playing = False
+            self.session.publish(('beep', self.session.machine.frames, False))
+
+
+class Session:
+
+    def __init__(self, rom:bytes, quirks=None, seed:int = None, ips:int = IPS, jit:bool = False,
+                 realtime:bool = True):
+        self.input = asyncio.Queue()
+        self.subscribers = []
+        self.realtime = realtime # False runs frames back to back, still yielding between them
+        self.machine = Machine(_SessionDisplay(self), QueueKeyboard(self.input), _SessionBeeper(self),
+                               quirks=quirks, ips=ips, seed=seed, jit=jit)
+        self.machine.load(rom)
+        self.running = False
+
+
+    # a queue that receives every event from now on. A subscriber that falls more than
+    # 'maxsize' events behind loses the oldest ones: a frame is the whole screen, so the
+    # next one brings it up to date.
+    def subscribe(self, maxsize:int = SUBSCRIBER_QUEUE) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize)
+        self.subscribers.append(queue)
+        return queue
+
+
+    def unsubscribe(self, queue:asyncio.Queue):
+        self.subscribers.remove(queue)
+
+
+    def publish(self, event:tuple):
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+    def press(self, key:int):
+        self.input.put_nowait((key, True))
+
+
+    def release(self, key:int):
+        self.input.put_nowait((key, False))
+
+
+    def stop(self):
+        self.input.put_nowait(QUIT)
+
+
+    # run until stopped, or for 'frames' frames. Yields to the event loop once a frame,
+    # sleeping off the rest of it when realtime.
+    async def run(self, frames:int = None):
+        machine = self.machine
+        loop = asyncio.get_running_loop()
+        frame_time = 1 / TIMER_HZ
+        next_frame = loop.time()
+        self.running = True
+        try:
+            while frames is None or frames > 0:
+                if not machine.run_frame():
+                    break
+                if frames is not None:
+                    frames -= 1
+
+                delay = 0
+                if self.realtime:
+                    next_frame += frame_time
+                    delay = next_frame - loop.time()
+                    if delay < 0:
+                        next_frame = loop.time() # running behind, don't try to catch up
+                        delay = 0
+                await asyncio.sleep(delay)
+        finally:
+            self.running = False
+            self.publish(('end', machine.frames, None))
+
+
+# Run 'count' sessions of one rom on one event loop for 'seconds', and report how well they
+# kept up: the frames each one ran against the frames a 60 Hz clock would have.
+async def _load_test(rom:bytes, count:int, seconds:float, jit:bool) -> dict:
+    sessions = [Session(rom, seed=number, jit=jit) for number in range(count)]
+    subscribers = [session.subscribe() for session in sessions]
+    delivered = 0
+
+    async def drain(queue):
+        nonlocal delivered
+        while True:
+            event = await queue.get()
+            if event[0] == 'end':
+                return
+            delivered += event[0] == 'frame'
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    runs = [asyncio.create_task(session.run()) for session in sessions]
+    drains = [asyncio.create_task(drain(queue)) for queue in subscribers]
+    await asyncio.sleep(seconds)
+    for session in sessions:
+        session.stop()
+    await asyncio.gather(*runs, *drains)
+    elapsed = loop.time() - start
+
+    frames = sum(session.machine.frames for session in sessions)
+    return {'sessions': count, 'seconds': elapsed, 'frames': frames,
+            'realtime': frames / (count * elapsed * TIMER_HZ), 'frames_delivered': delivered}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run many CHIP-8 sessions on one asyncio event loop.")
+    parser.add_argument("rom")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--jit", action="store_true")
+    args = parser.parse_args(argv)
+
+    with open(args.rom, 'rb') as file:
+        rom = file.read()
+    result = asyncio.run(_load_test(rom, args.sessions, args.seconds, args.jit))
+    print(f"{result['sessions']} sessions for {result['seconds']:.2f}s: {result['frames']} frames "
+          f"({result['realtime']:.0%} of realtime), {result['frames_delivered']} screen updates delivered")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
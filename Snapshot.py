@@ -0,0 +1,127 @@
+import struct
+
+# Snapshot of a whole machine: CPU state, RAM, framebuffer, emulated clock and RNG.
+#
+# In memory a Snapshot only holds immutable values (bytes/tuples), so one snapshot can be
+# restored into any number of machines: the buffers are shared, and each machine copies
+# them into its own RAM only when restoring. pack()/unpack() convert to and from a compact
+# versioned binary blob:
+#
+#   header   fixed size, see HEADER
+#   rng      Mersenne Twister state, 625 x uint32 + gauss flag/value
+#   extra    bitplanes, plane mask, pitch, flag registers, audio pattern, see EXTRA
+#   ram      4 KB (64 KB for XO-CHIP)
+#   screen   packed framebuffer rows, width/8 bytes per row, one plane after the other
+#
+# Version 1 blobs (no extra block, one plane) and version 2 blobs (16 bit cycles left in
+# frame) still unpack.
+
+MAGIC = b'C8SN'
+VERSION = 3
+
+# magic, version, pc, index, delay, sound, stack depth, stack[16], registers,
+# key mask, cycles, frames, cycles left in frame, seed, screen width, screen height
+HEADER = struct.Struct('<4sBHHHHB16H16sHQQIQHH')
+OLD_HEADER = struct.Struct('<4sBHHHHB16H16sHQQHQHH') # versions 1 and 2
+# bitplanes, plane mask, pitch, SUPER-CHIP flag registers, XO-CHIP audio pattern
+EXTRA = struct.Struct('<BBB16s16s')
+RNG = struct.Struct('<625IBd')
+STACK_SLOTS = 16
+
+
+class Snapshot:
+
+    def __init__(self, pc, index, delay_timer, sound_timer, stack, registers, key_state,
+                 cycles, frames, until_tick, seed, rng_state, ram, width, height, planes,
+                 plane_mask=1, rpl=bytes(16), pattern=bytes(16), pitch=64):
+        self.pc = pc
+        self.index = index
+        self.delay_timer = delay_timer
+        self.sound_timer = sound_timer
+        self.stack = tuple(stack)
+        self.registers = bytes(registers)
+        self.key_state = tuple(key_state)
+        self.cycles = cycles
+        self.frames = frames
+        self.until_tick = until_tick
+        self.seed = seed
+        self.rng_state = rng_state
+        self.ram = bytes(ram)
+        self.width = width
+        self.height = height
+        self.planes = tuple(tuple(rows) for rows in planes)
+        self.plane_mask = plane_mask
+        self.rpl = bytes(rpl)
+        self.pattern = bytes(pattern)
+        self.pitch = pitch
+
+    # plane 0
+    @property
+    def rows(self):
+        return self.planes[0]
+
+
+    @classmethod
+    def capture(cls, machine):
+        state = machine.state
+        framebuffer = machine.display.framebuffer
+        return cls(state.pc, state.index, state.delay_timer, state.sound_timer, state.get_stack(), state.registers,
+                   state.key_state, machine.cycles, machine.frames, machine._until_tick, machine.seed,
+                   machine.rng.getstate(), state.ram, framebuffer.width, framebuffer.height, framebuffer.planes,
+                   framebuffer.plane_mask, state.rpl, state.pattern, state.pitch)
+
+
+    def pack(self) -> bytes:
+        if len(self.stack) > STACK_SLOTS:
+            raise OverflowError("Stack too deep to snapshot.")
+        stack = self.stack + (0,) * (STACK_SLOTS - len(self.stack))
+        keys = sum(1 << key for key, held in enumerate(self.key_state) if held)
+        header = HEADER.pack(MAGIC, VERSION, self.pc, self.index, self.delay_timer, self.sound_timer,
+                             len(self.stack), *stack, self.registers, keys, self.cycles, self.frames,
+                             self.until_tick, self.seed, self.width, self.height)
+
+        version, words, gauss = self.rng_state
+        rng = RNG.pack(*words, gauss is not None, gauss or 0.0)
+        extra = EXTRA.pack(len(self.planes), self.plane_mask, self.pitch, self.rpl, self.pattern)
+
+        row_bytes = (self.width + 7) // 8
+        screen = b''.join(row.to_bytes(row_bytes, 'big') for rows in self.planes for row in rows)
+        return header + rng + extra + self.ram + screen
+
+
+    @classmethod
+    def unpack(cls, blob:bytes):
+        if len(blob) < OLD_HEADER.size + RNG.size or blob[:4] != MAGIC:
+            raise ValueError("Not a machine snapshot.")
+        version = blob[4]
+        if version not in (1, 2, VERSION):
+            raise ValueError(f"Unsupported snapshot version: {version}")
+        header = HEADER if version == VERSION else OLD_HEADER
+        fields = header.unpack_from(blob)
+
+        pc, index, delay_timer, sound_timer, depth = fields[2:7]
+        stack = fields[7:7 + depth]
+        registers, keys, cycles, frames, until_tick, seed, width, height = fields[23:]
+        key_state = [bool(keys >> key & 1) for key in range(16)]
+
+        rng = RNG.unpack_from(blob, header.size)
+        rng_state = (3, rng[:625], rng[626] if rng[625] else None)
+
+        offset = header.size + RNG.size
+        if version == 1:
+            count, plane_mask, pitch, rpl, pattern = 1, 1, 64, bytes(16), bytes(16)
+        else:
+            count, plane_mask, pitch, rpl, pattern = EXTRA.unpack_from(blob, offset)
+            offset += EXTRA.size
+        row_bytes = (width + 7) // 8
+        ram_size = len(blob) - offset - row_bytes * height * count
+        ram = blob[offset:offset + ram_size]
+        offset += ram_size
+        planes = []
+        for plane in range(count):
+            planes.append([int.from_bytes(blob[offset + y * row_bytes:offset + (y + 1) * row_bytes], 'big')
+                           for y in range(height)])
+            offset += row_bytes * height
+
+        return cls(pc, index, delay_timer, sound_timer, stack, registers, key_state, cycles, frames,
+                   until_tick, seed, rng_state, ram, width, height, planes, plane_mask, rpl, pattern, pitch)
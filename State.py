@@ -1,16 +1,30 @@
+STACK_DEPTH = 16
+
+
+# CPU state. The execution core reads and writes the registers, ram and stack buffers
+# directly, so the accessors here stay unchecked; CheckedState puts the validation back
+# for debugging.
 class State():
 
     ROMSTART = 0x200
+    FONTSTART = 0x50
+
+    __slots__ = ('index', 'registers', 'pc', 'delay_timer', 'sound_timer', 'stack', 'sp',
+                 'key_state', 'ram', 'rpl', 'pattern', 'pitch')
 
-    def __init__(self, pc=ROMSTART):
+    def __init__(self, pc=ROMSTART, memory=4096):
         self.index = 0
         self.registers = bytearray(16)
         self.pc = pc
         self.delay_timer = 0
         self.sound_timer = 0
-        self.stack = []
+        self.stack = [0]*STACK_DEPTH
+        self.sp = 0 # number of entries in use
         self.key_state = [False]*16
-        self.ram = bytearray(4096)
+        self.ram = bytearray(memory)
+        self.rpl = bytearray(16) # SUPER-CHIP Fx75/Fx85 flag registers
+        self.pattern = bytearray(16) # XO-CHIP audio: 128 one bit samples ...
+        self.pitch = 64 # ... played at 4000 * 2 ** ((pitch - 64) / 48) Hz
 
     def __str__(self):
         string = ""
@@ -19,36 +33,27 @@ class State():
         return string
 
     def set_vx(self, vx, value):
-        if vx > 15:
-            raise ValueError(f"Attempting to set non-existent register: {vx:X}")
-        if type(value) == bytes or type(value) == bytearray:
-            value = int.from_bytes(value)
-        self.registers[vx] = value % 256
-    
+        self.registers[vx] = value & 0xff
+
     def get_vx(self, vx):
-        if vx > 15:
-            raise ValueError(f"Attempting to get non-existent register: {vx:X}")
-        
         return self.registers[vx]
-    
+
     def increment_pc(self, by=2):
-        self.pc = (self.pc + by) % 4096
-    
+        self.pc = (self.pc + by) % len(self.ram)
+
     def decrement_pc(self, by=2):
-        self.pc = (self.pc - by)
+        self.pc = (self.pc - by) % len(self.ram)
 
     def get_pc(self):
         return self.pc
-    
+
     def set_pc(self, value):
-        if value > 4096:
-            raise IndexError("Cannot set PC to value greater than 0xfff")
         self.pc = value
 
     def set_index(self, value, set_overflow=False):
-        if(set_overflow and (value > 4095)):
-            self.set_vx(0xf, 1)
-        self.index = value % 4096
+        if(set_overflow and (value >= len(self.ram))):
+            self.registers[0xf] = 1
+        self.index = value % len(self.ram)
 
     def get_index(self):
         return self.index
@@ -58,64 +63,136 @@ class State():
         return self.ram[self.pc:self.pc+length]
 
     def get_ram(self,length=1,address=None):
-        # TODO checks
         # defaults to reading from location that index points to
         if address == None:
             address = self.index
         return self.ram[address:address+length]
-    
+
+    # 'data' is anything a bytearray slice accepts: bytes, bytearray, memoryview, list of ints
     def set_ram(self, data, address=None):
         if address == None:
             address = self.index
-        if type(data) == int:
-            data = data.to_bytes(1)
-        elif type(data) == list:
-            data = bytes(data)
-        if type(data) != bytearray and type(data) != bytes:
-            raise ValueError(f"Attempting to set RAM with wrong data type: {type(data)}")
-        if address + len(data) > 4096:
+        end = address + len(data)
+        # a slice assignment past the end would grow the bytearray
+        if end > len(self.ram):
             raise OverflowError("Out of memory while writing to RAM.")
-        self.ram[address:address+len(data)] = data
+        self.ram[address:end] = data
 
     def set_delay_timer(self, value):
         self.delay_timer = value
-    
+
     def get_delay_timer(self):
         return self.delay_timer
-    
+
     def set_sound_timer(self, value):
         self.sound_timer = value
-    
+
     def decrement_delay_timer(self):
         self.delay_timer = max(self.delay_timer - 1, 0)
         return self.delay_timer
 
     def decrement_sound_timer(self):
-        self.sound_timer = max(self.sound_timer - 1, 0)  
+        self.sound_timer = max(self.sound_timer - 1, 0)
         return self.sound_timer
 
     def stack_push(self, value):
-        self.stack.append(value)
+        sp = self.sp
+        if sp >= STACK_DEPTH:
+            raise IndexError("Stack overflow.")
+        self.stack[sp] = value
+        self.sp = sp + 1
 
     def stack_pop(self):
-        if len(self.stack) <= 0:
+        sp = self.sp - 1
+        if sp < 0:
             raise IndexError("Attempting to pop from empty stack.")
-        return self.stack.pop()
-    
+        self.sp = sp
+        return self.stack[sp]
+
+    # entries in use, oldest first
+    def get_stack(self):
+        return self.stack[:self.sp]
+
+    def set_stack(self, values):
+        if len(values) > STACK_DEPTH:
+            raise IndexError("Stack overflow.")
+        self.stack[:len(values)] = values
+        self.stack[len(values):] = [0]*(STACK_DEPTH - len(values))
+        self.sp = len(values)
+
     def clear_key_state(self):
         self.key_state = [False]*16
-    
+
+    def set_key_state(self,key:int,value:bool):
+        self.key_state[key] = value
+
+    def get_key_state(self,key=None):
+        if key == None:
+            return self.key_state
+        return self.key_state[key]
+
+
+# State with the original argument checking on every accessor, for debugging front ends
+# and tools (see Machine(debug=True)).
+class CheckedState(State):
+
+    __slots__ = ()
+
+    def set_vx(self, vx, value):
+        if vx > 15:
+            raise ValueError(f"Attempting to set non-existent register: {vx:X}")
+        if type(value) == bytes or type(value) == bytearray:
+            value = int.from_bytes(value)
+        self.registers[vx] = value % 256
+
+    def get_vx(self, vx):
+        if vx > 15:
+            raise ValueError(f"Attempting to get non-existent register: {vx:X}")
+        return self.registers[vx]
+
+    def set_pc(self, value):
+        if value >= len(self.ram):
+            raise IndexError("Cannot set PC to value greater than 0xfff")
+        self.pc = value
+
+    def get_ram(self,length=1,address=None):
+        if address == None:
+            address = self.index
+        if address < 0 or address >= len(self.ram):
+            raise IndexError(f"Attempting to read outside RAM: {address:X}")
+        return self.ram[address:address+length]
+
+    def set_ram(self, data, address=None):
+        if type(data) == int:
+            data = data.to_bytes(1)
+        elif type(data) == list:
+            data = bytes(data)
+        if type(data) not in (bytearray, bytes, memoryview):
+            raise ValueError(f"Attempting to set RAM with wrong data type: {type(data)}")
+        super().set_ram(data, address)
+
     def set_key_state(self,key:int,value:bool):
         if key >= 16 or key < 0:
             raise ValueError("Key value out of range.")
         if type(value) != bool:
             raise TypeError("Key state value must be a boolean.")
         self.key_state[key] = value
-    
+
     def get_key_state(self,key=None):
         if key == None:
             return self.key_state
         elif key >= 16 or key < 0:
             raise ValueError("Key value out of range.")
         else:
-            return self.key_state[key]
\ No newline at end of file
+            return self.key_state[key]
+
+    # invariants the execution core relies on, checked after every instruction in debug runs
+    def check(self):
+        if not 0 <= self.pc < len(self.ram):
+            raise IndexError(f"PC outside RAM: {self.pc:X}")
+        if not 0 <= self.index < len(self.ram):
+            raise IndexError(f"Index outside RAM: {self.index:X}")
+        if len(self.registers) != 16 or len(self.ram) not in (0x1000, 0x10000):
+            raise ValueError("Register file or RAM changed size.")
+        if not 0 <= self.delay_timer <= 0xff or not 0 <= self.sound_timer <= 0xff:
+            raise ValueError("Timer out of range.")
@@ -0,0 +1,213 @@
+import sys
+import struct
+from debug_utils import describe, opcode_class
+
+# Instruction trace.
+#
+# While attached, every executed instruction appends one fixed-size binary record to a
+# preallocated buffer: frame number, pc, opcode, I after the instruction, a mask of the
+# registers it changed and the register file after it. Nothing is formatted while the
+# machine runs. With a filename the buffer is written out in one call whenever it
+# fills, otherwise it keeps the most recent 'capacity' records as a ring.
+#
+#   trace = Trace("run.c8t", start=0x2a4, limit=100_000)
+#   trace.attach(machine)
+#   ...
+#   trace.close()
+#
+# 'start' waits until that address executes before recording (until then only that one
+# handler is wrapped), 'stop' ends recording at an address, 'limit' after that many
+# records. Like the profiler, tracing parks the recompiler while attached.
+#
+# Read a trace back with
+#   python Trace.py run.c8t --start 0x300 --end 0x340 --opcode Dxyn --register 3
+#
+# File format (little endian): HEADER, then RECORD after RECORD.
+
+MAGIC = b'C8TR'
+VERSION = 1
+HEADER = struct.Struct('<4sBH')         # magic, version, record size
+
+# frame, pc, opcode, I, changed register mask, registers after
+RECORD = struct.Struct('<IHHHH16s')
+
+
+class Trace:
+
+    def __init__(self, filename:str = None, capacity:int = 65536, start:int = None, stop:int = None,
+                 limit:int = None):
+        self.filename = filename
+        self.capacity = capacity
+        self.start = start
+        self.stop = stop
+        self.limit = limit
+
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.used = 0                   # records in the buffer
+        self.wrapped = False            # ring mode: the buffer has been overwritten at least once
+        self.recorded = 0               # records taken in total
+        self.active = start is None
+        self.finished = False
+        self.machine = None
+        self._recompiler = None
+
+        self.file = None
+        if filename is not None:
+            self.file = open(filename, 'wb')
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+
+
+    def attach(self, machine):
+        self.machine = machine
+        self._recompiler = machine.recompiler
+        machine.recompiler = None
+        machine.tracer = self
+        machine.decoded[:] = [None] * len(machine.decoded)
+
+
+    def detach(self):
+        machine = self.machine
+        machine.tracer = None
+        machine.decoded[:] = [None] * len(machine.decoded)
+        if self._recompiler is not None:
+            machine.recompiler = type(self._recompiler)(machine)
+        self.machine = self._recompiler = None
+
+
+    # wrap the handler decoded from 'opcode' at 'address'
+    def wrap(self, op, address:int, opcode:int):
+        if self.finished:
+            return op
+        if not self.active:
+            if address != self.start:
+                return op
+            def trigger():
+                self._set_active(True)
+                return self._record(op, address, opcode)
+            return trigger
+        if address == self.stop:
+            def stop():
+                result = self._record(op, address, opcode)
+                self._finish()
+                return result
+            return stop
+        return lambda: self._record(op, address, opcode)
+
+
+    def _record(self, op, address, opcode):
+        state = self.machine.state
+        registers = state.registers
+        before = bytes(registers)
+        try:
+            return op()
+        finally:
+            after = bytes(registers)
+            changed = 0
+            if before != after:
+                for i in range(16):
+                    if before[i] != after[i]:
+                        changed |= 1 << i
+
+            if self.used == self.capacity:
+                self._flush()
+            RECORD.pack_into(self.buffer, self.used * RECORD.size, self.machine.frames, address,
+                             opcode, state.index, changed, after)
+            self.used += 1
+            self.recorded += 1
+            if self.limit is not None and self.recorded >= self.limit:
+                self._finish()
+
+
+    def _set_active(self, active:bool):
+        self.active = active
+        # rewrap everything (or unwrap it) from the next instruction on
+        decoded = self.machine.decoded
+        decoded[:] = [None] * len(decoded)
+
+
+    def _finish(self):
+        self.finished = True
+        self._set_active(False)
+
+
+    def _flush(self):
+        if self.file is not None:
+            self.file.write(memoryview(self.buffer)[:self.used * RECORD.size])
+            self.used = 0
+        else:
+            # ring: drop the oldest half in one move rather than one record at a time
+            half = (self.capacity // 2) * RECORD.size
+            self.buffer[:len(self.buffer) - half] = self.buffer[half:]
+            self.used -= self.capacity // 2
+            self.wrapped = True
+
+
+    # the buffered records, oldest first (ring mode)
+    def records(self):
+        return iter_records(memoryview(self.buffer)[:self.used * RECORD.size])
+
+
+    def close(self):
+        if self.machine is not None:
+            self.detach()
+        if self.file is not None:
+            self._flush()
+            self.file.close()
+            self.file = None
+
+
+def iter_records(data):
+    return RECORD.iter_unpack(data)
+
+
+def load(filename:str):
+    with open(filename, 'rb') as file:
+        data = file.read()
+    if len(data) < HEADER.size or data[:4] != MAGIC:
+        raise ValueError("Not a trace file.")
+    magic, version, size = HEADER.unpack_from(data)
+    if version != VERSION or size != RECORD.size:
+        raise ValueError(f"Unsupported trace version: {version}")
+    body = memoryview(data)[HEADER.size:]
+    return iter_records(body[:len(body) - len(body) % RECORD.size])
+
+
+# keep records inside [start, end) whose opcode matches and that changed 'register'
+def select(records, start:int = None, end:int = None, opcode:str = None, register:int = None):
+    for record in records:
+        frame, pc, code, index, changed, registers = record
+        if start is not None and pc < start:
+            continue
+        if end is not None and pc >= end:
+            continue
+        if opcode is not None and opcode_class(code).lower() != opcode.lower() and f'{code:04x}' != opcode.lower():
+            continue
+        if register is not None and not changed >> register & 1:
+            continue
+        yield record
+
+
+def format_record(record) -> str:
+    frame, pc, opcode, index, changed, registers = record
+    changes = ' '.join(f'v{i:X}={registers[i]:02X}' for i in range(16) if changed >> i & 1)
+    return f'{frame:>8} {pc:03X}: {opcode:04X}  {describe(opcode):<44} I={index:03X} {changes}'
+
+
+def main(argv=None):
+    import argparse
+
+    number = lambda text: int(text, 0)
+    parser = argparse.ArgumentParser(description="Disassemble and filter a CHIP-8 instruction trace.")
+    parser.add_argument("trace")
+    parser.add_argument("--start", type=number, help="lowest pc to show")
+    parser.add_argument("--end", type=number, help="show pcs below this")
+    parser.add_argument("--opcode", help="opcode class (eg. Dxyn, 8xy4, Fx33) or exact opcode (eg. 00e0)")
+    parser.add_argument("--register", type=number, help="only instructions that changed this register")
+    args = parser.parse_args(argv)
+
+    for record in select(load(args.trace), args.start, args.end, args.opcode, args.register):
+        print(format_record(record))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+import numpy as np
+from State import State
+from Machine import FONT, FONTSTART, IPS, TIMER_HZ
+import Quirks
+
+# Lockstep engine for many CHIP-8 instances at once (RL, fuzzing).
+#
+# All machine state is held in arrays with a leading instance axis. step() fetches the
+# current opcode of every instance, then executes each opcode class present this cycle
+# as one masked, batched numpy operation, so the per-instruction Python cost is shared
+# by all instances.
+#
+# Semantics follow Machine. Instances that hit an unknown opcode or a stack fault are
+# halted (their pc stops advancing) instead of raising, so one bad instance does not stop
+# the batch. Memory addresses wrap at 4 KB rather than raising.
+#
+# 'quirks' is a profile as for Machine, with its behaviours applied per batch operation.
+# Only the chip8 instruction set is vectorised, so the schip and xochip profiles (or
+# anything with their instruction sets) are refused.
+
+MEMORY = 4096
+STACK_DEPTH = 16
+
+
+class VectorMachine:
+
+    def __init__(self, instances:int, shift_quirk=None, jump_quirk=None, ips=IPS, seed=None,
+                 reward=None, observation=None, quirks=None):
+        quirks = Quirks.resolve(quirks)
+        if shift_quirk is not None and shift_quirk != quirks.shift_vy:
+            quirks = quirks.replace(shift_vy=shift_quirk)
+        if jump_quirk is not None and jump_quirk != quirks.jump_vx:
+            quirks = quirks.replace(jump_vx=jump_quirk)
+        if quirks.instructions != 'chip8':
+            raise ValueError(f"VectorMachine only runs the chip8 instruction set, not {quirks.instructions}")
+        self.quirks = quirks
+
+        n = instances
+        self.instances = n
+        self.cycles_per_frame = max(round(ips / TIMER_HZ), 1)
+
+        self.registers = np.zeros((n, 16), np.uint8)
+        self.ram = np.zeros((n, MEMORY), np.uint8)
+        self.pc = np.full(n, State.ROMSTART, np.int32)
+        self.index = np.zeros(n, np.int32)
+        self.delay_timer = np.zeros(n, np.int32)
+        self.sound_timer = np.zeros(n, np.int32)
+        self.stack = np.zeros((n, STACK_DEPTH), np.int32)
+        self.sp = np.zeros(n, np.int32)
+        # one packed row per uint64, leftmost pixel in the most significant bit (as Framebuffer)
+        self.screen = np.zeros((n, 32), np.uint64)
+        self.keys = np.zeros((n, 16), bool)
+        self.released = np.zeros((n, 16), bool)
+        self.halted = np.zeros(n, bool)
+        self.waiting = np.zeros(n, bool) # drew this frame with display_wait, resumes next frame
+
+        self.cycles = 0
+        self.frames = 0
+        self.rng = np.random.default_rng(seed)
+
+        # reward(machine) -> array of shape (instances,), evaluated once per frame
+        self.reward = reward
+        # observation(machine) -> anything, evaluated once per frame (default: the screens)
+        self.observation = observation or VectorMachine.screens
+
+        self._all = np.arange(n)
+        self.ram[:, FONTSTART:FONTSTART + len(FONT)] = np.frombuffer(FONT, np.uint8)
+
+
+    # load the same rom into every instance, or into the selected ones
+    def load(self, data, address=State.ROMSTART, instances=None):
+        if address + len(data) > MEMORY:
+            raise OverflowError("Out of memory while writing to RAM.")
+        rows = slice(None) if instances is None else instances
+        self.ram[rows, address:address + len(data)] = np.frombuffer(bytes(data), np.uint8)
+
+
+    # keys: bool array (instances, 16) of keys held this frame
+    def set_keys(self, keys):
+        keys = np.asarray(keys, bool)
+        self.released |= self.keys & ~keys
+        self.keys[:] = keys
+
+
+    # screens as (instances, 32, 64) arrays of 0/1
+    def screens(self):
+        packed = self.screen.astype('>u8').view(np.uint8).reshape(self.instances, 32, 8)
+        return np.unpackbits(packed, axis=2)
+
+
+    # Run one 60 Hz frame for every instance and tick the timers.
+    # Returns (observation, rewards).
+    def run_frame(self, keys=None):
+        if keys is not None:
+            self.set_keys(keys)
+        for _ in range(self.cycles_per_frame):
+            self.step()
+        self.waiting[:] = False
+        # like the keyboards, a release only ends an fx0a wait in its own frame
+        self.released[:] = False
+
+        self.frames += 1
+        np.maximum(self.delay_timer - 1, 0, out=self.delay_timer)
+        np.maximum(self.sound_timer - 1, 0, out=self.sound_timer)
+
+        rewards = self.reward(self) if self.reward else np.zeros(self.instances, np.float32)
+        return self.observation(self), rewards
+
+
+    def step(self):
+        ram = self.ram
+        live = self._all[~(self.halted | self.waiting)]
+        pc = self.pc[live]
+        op = (ram[live, pc].astype(np.int32) << 8) | ram[live, (pc + 1) % MEMORY]
+        self.pc[live] = (pc + 2) % MEMORY
+        self.cycles += 1
+
+        n1 = op >> 12
+        present = np.bincount(n1, minlength=16)
+        for klass in np.nonzero(present)[0]:
+            sel = n1 == klass
+            self._OPS[klass](self, live[sel], op[sel])
+
+
+    ### opcode classes. Each gets the instance numbers and opcodes to execute.
+
+    def _op_0(self, idx, op):
+        cls = idx[op == 0x00e0]     # 00e0 clear screen
+        self.screen[cls] = 0
+
+        ret = idx[op == 0x00ee]     # 00ee return from subroutine
+        if ret.size:
+            empty = self.sp[ret] <= 0
+            self.halted[ret[empty]] = True
+            ret = ret[~empty]
+            self.sp[ret] -= 1
+            self.pc[ret] = self.stack[ret, self.sp[ret]]
+
+        self.halted[idx[(op != 0x00e0) & (op != 0x00ee)]] = True
+
+    def _op_1(self, idx, op):       # 1nnn jump
+        self.pc[idx] = op & 0xfff
+
+    def _op_2(self, idx, op):       # 2nnn call subroutine
+        full = self.sp[idx] >= STACK_DEPTH
+        self.halted[idx[full]] = True
+        idx, op = idx[~full], op[~full]
+        self.stack[idx, self.sp[idx]] = self.pc[idx]
+        self.sp[idx] += 1
+        self.pc[idx] = op & 0xfff
+
+    def _skip(self, idx, condition):
+        skip = idx[condition]
+        self.pc[skip] = (self.pc[skip] + 2) % MEMORY
+
+    def _op_3(self, idx, op):       # 3xnn skip if vx == nn
+        self._skip(idx, self.registers[idx, (op >> 8) & 0xf] == (op & 0xff))
+
+    def _op_4(self, idx, op):       # 4xnn skip if vx != nn
+        self._skip(idx, self.registers[idx, (op >> 8) & 0xf] != (op & 0xff))
+
+    def _op_5(self, idx, op):       # 5xy0 skip if vx == vy
+        regs = self.registers
+        self._skip(idx, regs[idx, (op >> 8) & 0xf] == regs[idx, (op >> 4) & 0xf])
+
+    def _op_6(self, idx, op):       # 6xnn set register vx
+        self.registers[idx, (op >> 8) & 0xf] = op & 0xff
+
+    def _op_7(self, idx, op):       # 7xnn add value to register vx
+        x = (op >> 8) & 0xf
+        self.registers[idx, x] = (self.registers[idx, x] + (op & 0xff)) & 0xff
+
+    def _op_8(self, idx, op):       # 8xyn arithmetic and logic
+        regs = self.registers
+        x = (op >> 8) & 0xf
+        y = (op >> 4) & 0xf
+        n = op & 0xf
+        vx = regs[idx, x].astype(np.int32)
+        vy = regs[idx, y].astype(np.int32)
+        shift_src = vy if self.quirks.shift_vy else vx
+
+        result = np.select(
+            [n == 0x0, n == 0x1, n == 0x2, n == 0x3, n == 0x4, n == 0x5, n == 0x6, n == 0x7, n == 0xe],
+            [vy, vx | vy, vx & vy, vx ^ vy, vx + vy, vx - vy, shift_src >> 1, vy - vx, shift_src << 1])
+        flag = np.select(
+            [n == 0x4, n == 0x5, n == 0x6, n == 0x7, n == 0xe],
+            [result > 255, result >= 0, shift_src & 0x1, result >= 0, (shift_src >> 7) & 0x1], -1) # -1: VF untouched
+        if self.quirks.vf_reset:
+            flag[(n >= 0x1) & (n <= 0x3)] = 0
+
+        known = (n <= 0x7) | (n == 0xe)
+        self.halted[idx[~known]] = True
+        regs[idx[known], x[known]] = result[known] & 0xff
+        # VF is written after VX, so it wins when x is F
+        flags = known & (flag >= 0)
+        regs[idx[flags], 0xf] = flag[flags]
+
+    def _op_9(self, idx, op):       # 9xy0 skip if vx != vy
+        regs = self.registers
+        self._skip(idx, regs[idx, (op >> 8) & 0xf] != regs[idx, (op >> 4) & 0xf])
+
+    def _op_a(self, idx, op):       # annn set index register I
+        self.index[idx] = op & 0xfff
+
+    def _op_b(self, idx, op):       # bnnn jump with offset
+        if self.quirks.jump_vx:
+            self.pc[idx] = ((op & 0xfff) + self.registers[idx, (op >> 8) & 0xf]) % MEMORY
+        else:
+            self.pc[idx] = ((op & 0xfff) + self.registers[idx, 0]) % MEMORY
+
+    def _op_c(self, idx, op):       # cxnn random
+        random = self.rng.integers(0, 256, idx.size)
+        self.registers[idx, (op >> 8) & 0xf] = (op & 0xff) & random
+
+    def _op_d(self, idx, op):       # dxyn draw
+        regs = self.registers
+        x = regs[idx, (op >> 8) & 0xf].astype(np.int64)
+        y = regs[idx, (op >> 4) & 0xf].astype(np.int64)
+        height = op & 0xf
+        index = self.index[idx]
+        collided = np.zeros(idx.size, bool)
+
+        wrap = self.quirks.wrap
+        if wrap or self.quirks.wrap_start:
+            x %= 64
+            y %= 32
+        # sprite bits are clipped at the right edge by shifting them out, or with wrap the
+        # ones shifted out come back in on the left
+        left = np.clip(56 - x, 0, 63).astype(np.uint64)
+        right = np.clip(x - 56, 0, 63).astype(np.uint64)
+        around = np.where(x > 56, 120 - x, 0).astype(np.uint64)
+        for row in range(int(height.max(initial=0))):
+            live = (row < height) & (wrap | (y + row < 32))
+            if not live.any():
+                continue
+            rows = idx[live]
+            screen_y = (y[live] + row) % 32
+            sprite = self.ram[rows, (index[live] + row) % MEMORY].astype(np.uint64)
+            bits = (sprite << left[live]) >> right[live]
+            if wrap:
+                bits |= np.where(x[live] > 56, sprite << around[live], np.uint64(0))
+            current = self.screen[rows, screen_y]
+            collided[live] |= (current & bits) != 0
+            self.screen[rows, screen_y] = current ^ bits
+
+        regs[idx, 0xf] = collided
+        if self.quirks.display_wait:
+            self.waiting[idx] = True # nothing more runs until the next frame
+
+    def _op_e(self, idx, op):
+        nn = op & 0xff
+        pressed = self.keys[idx, self.registers[idx, (op >> 8) & 0xf] & 0xf]
+        self._skip(idx, (nn == 0x9e) & pressed)     # ex9e skip if vx key pressed
+        self._skip(idx, (nn == 0xa1) & ~pressed)    # exa1 skip if vx key not pressed
+        self.halted[idx[(nn != 0x9e) & (nn != 0xa1)]] = True
+
+    def _op_f(self, idx, op):
+        regs = self.registers
+        ram = self.ram
+        x = (op >> 8) & 0xf
+        nn = op & 0xff
+
+        sel = nn == 0x07            # fx07 get delay timer
+        regs[idx[sel], x[sel]] = self.delay_timer[idx[sel]]
+
+        sel = nn == 0x0a            # fx0a wait for a key release
+        if sel.any():
+            waiting, wx = idx[sel], x[sel]
+            got = self.released[waiting].any(axis=1)
+            key = self.released[waiting].argmax(axis=1)
+            self.pc[waiting[~got]] = (self.pc[waiting[~got]] - 2) % MEMORY
+            regs[waiting[got], wx[got]] = key[got]
+            self.released[waiting[got], key[got]] = False
+
+        sel = nn == 0x15            # fx15 set delay timer to vx
+        self.delay_timer[idx[sel]] = regs[idx[sel], x[sel]]
+
+        sel = nn == 0x18            # fx18 set sound timer to vx
+        self.sound_timer[idx[sel]] = regs[idx[sel], x[sel]]
+
+        sel = nn == 0x1e            # fx1e add to index, VF set on overflow
+        if sel.any():
+            i = idx[sel]
+            value = self.index[i] + regs[i, x[sel]]
+            regs[i[value > 4095], 0xf] = 1
+            self.index[i] = value % MEMORY
+
+        sel = nn == 0x29            # fx29 set I to font location for char x
+        self.index[idx[sel]] = regs[idx[sel], x[sel]].astype(np.int32) * 5 + FONTSTART
+
+        sel = nn == 0x33            # fx33 BCD conversion
+        if sel.any():
+            i = idx[sel]
+            value = regs[i, x[sel]]
+            index = self.index[i]
+            ram[i, index] = value // 100
+            ram[i, (index + 1) % MEMORY] = (value % 100) // 10
+            ram[i, (index + 2) % MEMORY] = value % 10
+
+        store = nn == 0x55          # fx55 store registers to memory
+        load = nn == 0x65           # fx65 load registers from memory
+        if store.any() or load.any():
+            for r in range(16):
+                sel = store & (x >= r)
+                ram[idx[sel], (self.index[idx[sel]] + r) % MEMORY] = regs[idx[sel], r]
+                sel = load & (x >= r)
+                regs[idx[sel], r] = ram[idx[sel], (self.index[idx[sel]] + r) % MEMORY]
+            if self.quirks.memory_increment is not None:
+                sel = store | load
+                i = idx[sel]
+                self.index[i] = (self.index[i] + x[sel] + self.quirks.memory_increment) % MEMORY
+
+        known = np.isin(nn, (0x07, 0x0a, 0x15, 0x18, 0x1e, 0x29, 0x33, 0x55, 0x65))
+        self.halted[idx[~known]] = True
+
+    _OPS = [_op_0, _op_1, _op_2, _op_3, _op_4, _op_5, _op_6, _op_7,
+            _op_8, _op_9, _op_a, _op_b, _op_c, _op_d, _op_e, _op_f]
@@ -0,0 +1,126 @@
+import sys
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+import Quirks
+
+# Batch runner: shards a manifest of headless jobs across a process pool.
+#
+# The manifest is a JSON list of jobs, for example
+#   [{"id": "pong-1", "rom": "roms/pong.ch8", "cycles": 100000, "seed": 1,
+#     "quirks": "schip", "input": {"0": [], "30": [1], "40": []}}]
+# Only "rom" is required. "quirks" is a profile name (see Quirks), or an object of a
+# "profile" plus overrides, eg. {"profile": "chip8", "display_wait": false}; "shift" and
+# "jump" are accepted for shift_vy and jump_vx. Without it the rom is looked up in the
+# "quirk_db" rom database, if the job names one. "input" is a ScriptedKeyboard script
+# (frame -> keys held), or the path of a JSON file containing one. "jit": true runs the
+# job on the recompiler. With "library" (a RomLibrary index) "rom" is a SHA-1 from it, and
+# the library's quirk profile is used unless the job gives one.
+#
+# Workers only import the headless core, never pygame.
+
+DEFAULT_CYCLES = 1_000_000
+
+_libraries = {} # index file -> RomLibrary, loaded once per worker process
+
+
+def load_script(script):
+    if script is None:
+        return {}
+    if isinstance(script, str):
+        with open(script) as file:
+            script = json.load(file)
+    # JSON object keys are always strings
+    return {int(frame): keys for frame, keys in script.items()}
+
+
+def job_library(job:dict):
+    filename = job['library']
+    library = _libraries.get(filename)
+    if library is None:
+        from RomLibrary import RomLibrary
+        library = _libraries[filename] = RomLibrary.load(filename)
+    return library
+
+
+def job_quirks(job:dict, rom:bytes) -> Quirks.Quirks:
+    quirks = job.get('quirks')
+    if quirks is None and 'library' in job:
+        return job_library(job).quirks(job['rom'])
+    if isinstance(quirks, dict):
+        quirks = dict(quirks)
+        for old, new in (('shift', 'shift_vy'), ('jump', 'jump_vx')):
+            if old in quirks:
+                quirks[new] = quirks.pop(old)
+    if quirks is None and 'quirk_db' in job:
+        return Quirks.for_rom(rom, Quirks.load_database(job['quirk_db']))
+    return Quirks.resolve(quirks)
+
+
+# runs in a worker process
+def run_job(job:dict) -> dict:
+    result = {'id': job.get('id', job['rom']), 'rom': job['rom']}
+
+    try:
+        if 'library' in job:
+            rom = job_library(job).rom(job['rom'])
+        else:
+            with open(job['rom'], 'rb') as file:
+                rom = file.read()
+
+        display = NullDisplay()
+        machine = Machine(display, ScriptedKeyboard(load_script(job.get('input'))), NullBeeper(),
+                          quirks=job_quirks(job, rom), seed=job.get('seed', 0), jit=job.get('jit', False))
+        machine.load(rom)
+        stats = machine.run(job.get('cycles', DEFAULT_CYCLES))
+        result.update(stats)
+        result['screen'] = display.screen_hash()
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    return result
+
+
+def run_batch(jobs:list, workers:int = None) -> list:
+    workers = workers or os.cpu_count()
+    # a few jobs per task keeps the pool busy without paying IPC per job
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_job, jobs, chunksize=chunksize))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a manifest of CHIP-8 jobs headless, in parallel.")
+    parser.add_argument("manifest", help="JSON list of jobs")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", help="write results as JSON to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as file:
+        jobs = json.load(file)
+
+    start = time.perf_counter()
+    results = run_batch(jobs, args.workers)
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    instructions = sum(result.get('cycles', 0) for result in results)
+    failed = sum('error' in result for result in results)
+    print(f"{len(results)} jobs ({failed} failed), {instructions} instructions in {elapsed:.2f}s "
+          f"({instructions / elapsed:,.0f} instructions/sec overall)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+import sys
+import os
+import ast
+import compileall
+import json
+import time
+import statistics
+import subprocess
+import tempfile
+import contextlib
+import multiprocessing
+
+# Benchmarks.
+#
+# run: the headless core on a fixed set of workloads (see WORKLOADS, plus any roms given
+# with --rom), for every engine tier and display backend asked for. Each combination runs
+# in a fresh process and reports instructions/sec, frames/sec, allocations per instruction
+# and peak RSS. Results can be saved as JSON and compared against a saved baseline, and
+# the run fails if any of them got worse by more than the threshold:
+#
+#   python bench.py run --save baseline.json
+#   python bench.py run --baseline baseline.json --threshold 0.1
+#
+# startup: time from a fresh interpreter to the first executed instruction, the cost every
+# short batch run pays before doing any work. Each run is a new process that imports the
+# core, selects a backend, builds a Machine, loads the rom and executes one instruction;
+# it reports how long that took in-process and which heavy modules got imported on the
+# way, and the parent adds the process spawn time on top.
+#
+#   python bench.py startup --backend null --runs 20
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_VERSION = 1
+CYCLES = 300_000
+ENGINES = ('interpreter', 'jit', 'debug')
+# metric -> True if bigger is better; the ones compared against a baseline
+METRICS = {'ips': True, 'fps': True, 'allocations_per_instruction': False, 'peak_rss_kb': False}
+
+
+def _program(*words) -> bytes:
+    return b''.join(word.to_bytes(2, 'big') for word in words)
+
+
+# nested calls: 200 calls the first of 'depth' subroutines, each calling the next, the
+# innermost one adds to v0; every return unwinds one level
+def _call_chain(depth:int) -> bytes:
+    program = [0x2210, 0x1200] + [0x0000] * 6
+    for level in range(depth - 1):
+        program += [0x2000 | (0x210 + 4 * (level + 1)), 0x00ee]
+    program += [0x7001, 0x00ee]
+    return _program(*program)
+
+
+# synthetic workloads, each a rom that loops forever
+WORKLOADS = {
+    # register arithmetic, no memory or screen traffic
+    'alu': _program(0x6001, 0x6103, 0x6207,
+                    0x8014, 0x8125, 0x8206, 0x810e, 0x8213, 0x8021, 0x7005, 0x7103,
+                    0x1206),
+    # a font digit drawn at a moving position, changing digit every time
+    'sprites': _program(0x6000, 0x6100, 0x6200,
+                        0xf229, 0xd015, 0x7003, 0x7102, 0x7201,
+                        0x1206),
+    # clear the screen and draw a row of digits, over and over
+    'clear': _program(0x00e0, 0x6000, 0x6100, 0xa050,
+                      0xd015, 0x7008, 0xd015, 0x7008, 0xd015, 0x7008, 0xd015,
+                      0x1200),
+    # store and load all registers
+    'memory': _program(0xa300, 0xff55, 0xff65, 0x7001,
+                       0x1202),
+    # 12 deep subroutine calls
+    'calls': _call_chain(12),
+}
+HEAVY_MODULES = ('pygame', 'sdl2', 'numpy', 'json', 'typing', 'Recompiler')
+
+# runs in the child process; argv: backend, rom path or '', jit flag, modules to look for
+_STARTUP_CHILD = """
+import time
+start = time.perf_counter()
+import sys
+backend, rom_path, jit = sys.argv[1], sys.argv[2], sys.argv[3] == '1'
+import Backends
+from Machine import Machine
+from Idle import Idle
+imported = time.perf_counter()
+display, beeper, keyboard = Backends.select(backend)
+machine = Machine(display, keyboard, beeper, seed=0, jit=jit)
+if rom_path:
+    with open(rom_path, 'rb') as file:
+        machine.load(file.read())
+else:
+    machine.load(bytes([0x60, 0x00, 0x12, 0x00])) # 200: v0 = 0, 202: jump 200
+ready = time.perf_counter()
+try:
+    machine.step()
+except Idle:
+    pass
+first = time.perf_counter()
+wall = time.time()
+heavy = [name for name in sys.argv[4].split(',') if name in sys.modules]
+print(repr((imported - start, ready - imported, first - ready, first - start, wall, heavy)))
+"""
+
+
+# Children load cached bytecode, as an installed copy would, even when the environment
+# says not to write it. It is compiled into a temporary cache (sys.pycache_prefix) that
+# they are pointed at, not next to the sources.
+@contextlib.contextmanager
+def _bytecode_cache():
+    saved = sys.pycache_prefix, os.environ.get('PYTHONPYCACHEPREFIX')
+    with tempfile.TemporaryDirectory(prefix='bench-pycache-') as directory:
+        sys.pycache_prefix = os.environ['PYTHONPYCACHEPREFIX'] = directory
+        try:
+            compileall.compile_dir(HERE, maxlevels=0, quiet=1)
+            yield
+        finally:
+            sys.pycache_prefix = saved[0]
+            if saved[1] is None:
+                del os.environ['PYTHONPYCACHEPREFIX']
+            else:
+                os.environ['PYTHONPYCACHEPREFIX'] = saved[1]
+
+
+def startup_run(backend:str = 'null', rom:str = None, jit:bool = False) -> dict:
+    spawned = time.time()
+    output = subprocess.run([sys.executable, '-c', _STARTUP_CHILD, backend, rom or '', '1' if jit else '0',
+                             ','.join(HEAVY_MODULES)],
+                            cwd=HERE, capture_output=True, text=True, check=True).stdout
+    imports, init, step, first, wall, heavy = ast.literal_eval(output.strip().splitlines()[-1])
+    return {'imports': imports, 'init': init, 'first_step': step, 'in_process': first,
+            'total': wall - spawned, 'heavy_modules': heavy}
+
+
+# median and best of 'runs' fresh processes, in seconds
+def startup(backend:str = 'null', rom:str = None, jit:bool = False, runs:int = 20) -> dict:
+    with _bytecode_cache():
+        samples = [startup_run(backend, rom, jit) for _ in range(runs)]
+    result = {'backend': backend, 'jit': jit, 'runs': runs,
+              'heavy_modules': sorted({name for sample in samples for name in sample['heavy_modules']})}
+    for key in ('imports', 'init', 'first_step', 'in_process', 'total'):
+        values = [sample[key] for sample in samples]
+        result[key] = {'median': statistics.median(values), 'best': min(values)}
+    return result
+
+
+def format_startup(result:dict) -> str:
+    lines = [f"startup, {result['backend']} backend{' + jit' if result['jit'] else ''}, "
+             f"{result['runs']} runs (median / best):"]
+    for key, label in (('imports', 'core imports'), ('init', 'backend + machine init'),
+                       ('first_step', 'first instruction'), ('in_process', 'interpreter up to first instruction'),
+                       ('total', 'process spawn to first instruction')):
+        lines.append(f"  {label:36} {result[key]['median'] * 1000:8.2f} ms {result[key]['best'] * 1000:8.2f} ms")
+    lines.append(f"  heavy modules imported: {', '.join(result['heavy_modules']) or 'none'}")
+    return '\n'.join(lines)
+
+
+# one workload on one engine and backend; runs in a fresh process (see _measure), so the
+# peak RSS is this run's alone. The best of 'repeat' timed runs is kept.
+def run_workload(name:str, rom:bytes, engine:str, backend:str, cycles:int, repeat:int) -> dict:
+    import gc
+    import resource
+    import Backends
+    from Machine import Machine
+
+    if backend == 'pygame':
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    display, beeper, keyboard = Backends.select(backend)
+    machine = Machine(display, keyboard, beeper, seed=0, jit=engine == 'jit', debug=engine == 'debug')
+    machine.load(rom)
+    machine.run(cycles // 10) # warm up: decode, compile the hot blocks
+
+    best = None
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    for _ in range(repeat):
+        stats = machine.run(cycles)
+        if best is None or stats['seconds'] < best['seconds']:
+            best = stats
+    gc.collect()
+    allocations = (sys.getallocatedblocks() - blocks) / (cycles * repeat)
+    display.quit()
+
+    return {
+        'workload': name,
+        'engine': engine,
+        'backend': backend,
+        'cycles': best['cycles'],
+        'seconds': best['seconds'],
+        'ips': best['cycles'] / best['seconds'],
+        'fps': machine.cycles_per_frame and (best['cycles'] / machine.cycles_per_frame) / best['seconds'],
+        'allocations_per_instruction': allocations,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _measure_child(connection, *args):
+    try:
+        connection.send((True, run_workload(*args)))
+    except BaseException as error:
+        connection.send((False, repr(error)))
+    finally:
+        connection.close()
+
+
+# run_workload in a process of its own, started for this one measurement
+def _measure(*args) -> dict:
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_measure_child, args=(sender, *args))
+    process.start()
+    sender.close()
+    try:
+        ok, result = receiver.recv()
+    except EOFError:
+        ok, result = False, "worker process died"
+    process.join()
+    if not ok:
+        raise RuntimeError(f"Benchmark {args[0]} ({args[2]}, {args[3]}) failed: {result}")
+    return result
+
+
+def suite(workloads:dict, engines=('interpreter', 'jit'), backends=('null',), cycles:int = CYCLES,
+          repeat:int = 3) -> dict:
+    results = []
+    with _bytecode_cache():
+        for name, rom in workloads.items():
+            for engine in engines:
+                for backend in backends:
+                    results.append(_measure(name, rom, engine, backend, cycles, repeat))
+    return {'version': RESULTS_VERSION, 'python': sys.version.split()[0], 'cycles': cycles, 'results': results}
+
+
+def save_results(results:dict, filename:str):
+    with open(filename, 'w') as file:
+        json.dump(results, file, indent=1)
+
+
+def load_results(filename:str) -> dict:
+    with open(filename) as file:
+        results = json.load(file)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"Unsupported benchmark results version: {results.get('version')}")
+    return results
+
+
+# (workload, engine, backend, metric, baseline, current, change) for every metric that got
+# worse than the baseline by more than 'threshold' (a fraction, 0.1 is 10%)
+def regressions(results:dict, baseline:dict, threshold:float) -> list:
+    previous = {(entry['workload'], entry['engine'], entry['backend']): entry for entry in baseline['results']}
+    found = []
+    for entry in results['results']:
+        before = previous.get((entry['workload'], entry['engine'], entry['backend']))
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before[metric], entry[metric]
+            if metric == 'allocations_per_instruction':
+                # a handful of blocks over the whole run is noise, not a per instruction cost
+                worse = new - old > max(threshold * abs(old), 0.001)
+                change = new - old
+            elif old:
+                change = (new - old) / old
+                worse = -change > threshold if higher_is_better else change > threshold
+            else:
+                continue
+            if worse:
+                found.append((entry['workload'], entry['engine'], entry['backend'], metric, old, new, change))
+    return found
+
+
+def format_results(results:dict) -> str:
+    lines = [f"{'workload':12} {'engine':12} {'backend':8} {'instr/s':>12} {'frames/s':>9} "
+             f"{'allocs/instr':>12} {'peak RSS':>10}"]
+    for entry in results['results']:
+        lines.append(f"{entry['workload']:12} {entry['engine']:12} {entry['backend']:8} {entry['ips']:12,.0f} "
+                     f"{entry['fps']:9,.0f} {entry['allocations_per_instruction']:12.4f} "
+                     f"{entry['peak_rss_kb']:8,} KB")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CHIP-8 emulator benchmarks.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('run', help="run the workloads on each engine and backend")
+    command.add_argument("--workloads", nargs='+', choices=sorted(WORKLOADS), default=sorted(WORKLOADS))
+    command.add_argument("--rom", action='append', default=[], help="also run this rom (repeatable)")
+    command.add_argument("--engines", nargs='+', choices=ENGINES, default=['interpreter', 'jit'])
+    command.add_argument("--backends", nargs='+', default=['null'], help="display backends (see Backends.REGISTRY)")
+    command.add_argument("--cycles", type=int, default=CYCLES, help="instructions per timed run")
+    command.add_argument("--repeat", type=int, default=3, help="timed runs per combination, the best is kept")
+    command.add_argument("--save", help="write the results as JSON to this file")
+    command.add_argument("--baseline", help="JSON results to compare against")
+    command.add_argument("--threshold", type=float, default=0.1,
+                         help="fail if a metric is worse than the baseline by more than this fraction")
+
+    command = commands.add_parser('startup', help="time from a fresh process to the first instruction")
+    command.add_argument("--backend", default='null', help="backend to select (see Backends.REGISTRY)")
+    command.add_argument("--rom", help="rom to load, a one instruction loop if not given")
+    command.add_argument("--jit", action="store_true")
+    command.add_argument("--runs", type=int, default=20)
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == 'startup':
+        result = startup(args.backend, args.rom, args.jit, args.runs)
+        print(json.dumps(result, indent=1) if args.json else format_startup(result))
+        return 0
+
+    workloads = {name: WORKLOADS[name] for name in args.workloads}
+    for filename in args.rom:
+        with open(filename, 'rb') as file:
+            workloads[os.path.splitext(os.path.basename(filename))[0]] = file.read()
+    results = suite(workloads, args.engines, args.backends, args.cycles, args.repeat)
+    print(format_results(results))
+    if args.save:
+        save_results(results, args.save)
+
+    if args.baseline:
+        found = regressions(results, load_results(args.baseline), args.threshold)
+        for workload, engine, backend, metric, old, new, change in found:
+            print(f"REGRESSION {workload}/{engine}/{backend} {metric}: {old:,.4g} -> {new:,.4g}", file=sys.stderr)
+        if found:
+            return 1
+        print(f"no regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
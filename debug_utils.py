@@ -6,6 +6,21 @@ def get_instr_definition(n1, n2, n3, n4, nn, nnn) -> str:
                     return "clear screen"
                 case 0xee:      # 00ee return from subroutine
                     return "return from subroutine"
+                case 0xfb:      # 00fb scroll right (SUPER-CHIP)
+                    return "scroll right 4"
+                case 0xfc:      # 00fc scroll left (SUPER-CHIP)
+                    return "scroll left 4"
+                case 0xfd:      # 00fd exit (SUPER-CHIP)
+                    return "exit"
+                case 0xfe:      # 00fe low resolution (SUPER-CHIP)
+                    return "low resolution"
+                case 0xff:      # 00ff high resolution (SUPER-CHIP)
+                    return "high resolution"
+            match n3:
+                case 0xc:       # 00cn scroll down (SUPER-CHIP)
+                    return f"scroll down {n4:X}"
+                case 0xd:       # 00dn scroll up (XO-CHIP)
+                    return f"scroll up {n4:X}"
         case 0x1:               # 1nn:Xn jump
             return f"jump to {nnn:3X}"
         case 0x2:               # 2nn:Xn call subroutine
@@ -14,8 +29,13 @@ def get_instr_definition(n1, n2, n3, n4, nn, nnn) -> str:
             return f'skip if v{n2:X} == {nn:X}'
         case 0x4:               # 4xnn:X skip one instr if vx != nn:X
             return f'skip if v{n2:X} != {nn:X}'
-        case 0x5:               # 5xy0 skips if the values in VX and VY are equal
-            return f'skip if v{n2:X} == v{n3:X}'
+        case 0x5:
+            match n4:
+                case 0x2:       # 5xy2 save vx..vy (XO-CHIP)
+                    return f'store v{n2:X}..v{n3:X} to memory'
+                case 0x3:       # 5xy3 load vx..vy (XO-CHIP)
+                    return f'load v{n2:X}..v{n3:X} from memory'
+            return f'skip if v{n2:X} == v{n3:X}'  # 5xy0 skips if the values in VX and VY are equal
         case 0x6:               # 6xnn:X set register vx
             return f'set v{n2:X} to {nn:X}'
         case 0x7:               # 7xnn:X add value to register vx
@@ -58,6 +78,12 @@ def get_instr_definition(n1, n2, n3, n4, nn, nnn) -> str:
                     return f'skip if key at v{n2:X} not pressed'
         case 0xf:
             match nn:
+                case 0x00:      # f000 nnnn long index (XO-CHIP)
+                    return 'set index I to the next 16 bits'
+                case 0x01:      # fn01 select bitplanes (XO-CHIP)
+                    return f'select planes {n2:X}'
+                case 0x02:      # f002 load audio pattern (XO-CHIP)
+                    return 'load audio pattern from I'
                 case 0x07:      # fx07 get delay timer
                     return f'set v{n2:X} to delay timer'
                 case 0x0a:      # fx0a get key
@@ -70,9 +96,46 @@ def get_instr_definition(n1, n2, n3, n4, nn, nnn) -> str:
                     return f'add v{n2:X} to index I'
                 case 0x29:      # fx29 set I to font location for char x
                     return f'set index I to font location for v{n2:X}'
+                case 0x30:      # fx30 big font (SUPER-CHIP)
+                    return f'set index I to big font location for v{n2:X}'
+                case 0x3a:      # fx3a audio pitch (XO-CHIP)
+                    return f'set pitch to v{n2:X}'
                 case 0x33:      # fx33 BCD conversion
                     return f'BCD conversion of value in v{n2:X}'
                 case 0x55:      # fx55 store registers to memory
                     return f'store {n2:X} registers to memory'
                 case 0x65:      # fx65 load registers from memory
                     return f'load {n2:X} registers from memory'
+                case 0x75:      # fx75 save to flag registers (SUPER-CHIP)
+                    return f'store {n2:X} registers to flags'
+                case 0x85:      # fx85 load from flag registers (SUPER-CHIP)
+                    return f'load {n2:X} registers from flags'
+
+
+# get_instr_definition for a whole 16 bit opcode, with a fallback for unknown ones
+def describe(opcode:int) -> str:
+    definition = get_instr_definition((opcode >> 12) & 0xf, (opcode >> 8) & 0xf, (opcode >> 4) & 0xf,
+                                      opcode & 0xf, opcode & 0xff, opcode & 0xfff)
+    return definition or f'unknown {opcode:04X}'
+
+
+# the opcode pattern an instruction belongs to, eg. 8xy4 or Fx33
+def opcode_class(opcode:int) -> str:
+    n1 = (opcode >> 12) & 0xf
+    match n1:
+        case 0x0:
+            if opcode in (0x00e0, 0x00ee):
+                return f'{opcode:04X}'
+            return '0nnn'
+        case 0x1 | 0x2 | 0xa | 0xb:
+            return f'{n1:X}nnn'
+        case 0x3 | 0x4 | 0x6 | 0x7 | 0xc:
+            return f'{n1:X}xnn'
+        case 0x5 | 0x9:
+            return f'{n1:X}xy0'
+        case 0x8:
+            return f'8xy{opcode & 0xf:X}'
+        case 0xd:
+            return 'Dxyn'
+        case _:
+            return f'{n1:X}x{opcode & 0xff:02X}'
@@ -0,0 +1,20 @@
+import pytest
+import Backends
+
+
+@pytest.mark.parametrize('name', ['null', 'memory'])
+def test_headless_backends_implement_the_protocol(name):
+    display, audio, keyboard = Backends.select(name)
+    assert display.framebuffer is not None
+    display.render_screen()
+    audio.play()
+    audio.stop()
+    assert 'quit' in keyboard.get_events()
+    assert keyboard.is_pressed(5) is False
+    assert keyboard.is_pressed() is False
+    display.quit()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        Backends.load('display', 'nonexistent')
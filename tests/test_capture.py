@@ -0,0 +1,155 @@
+import io
+import zlib
+import struct
+import random
+import pytest
+from Framebuffer import Framebuffer
+from Backends import Display
+import Capture
+
+
+def lzw_decode(data:bytes, min_code_size:int) -> bytes:
+    clear = 1 << min_code_size
+    end = clear + 1
+    bits = int.from_bytes(data, 'little')
+    position = 0
+    out = bytearray()
+    table = previous = None
+    code_size = min_code_size + 1
+    while True:
+        code = (bits >> position) & ((1 << code_size) - 1)
+        position += code_size
+        if code == clear:
+            table = [bytes((i,)) for i in range(clear)] + [b'', b'']
+            code_size = min_code_size + 1
+            previous = None
+            continue
+        if code == end:
+            return bytes(out)
+        entry = table[code] if code < len(table) else previous + previous[:1]
+        out += entry
+        if previous is not None and len(table) < 4096:
+            table.append(previous + entry[:1])
+        if len(table) == 1 << code_size and code_size < 12:
+            code_size += 1
+        previous = entry
+
+
+@pytest.mark.parametrize('pixels, min_code_size', [
+    (b'\0', 2), (b'\1\1\1\1', 2), (bytes(10_000), 2),
+    (bytes(random.Random(0).randrange(4) for _ in range(50_000)), 2),
+    (bytes(random.Random(1).randrange(256) for _ in range(20_000)), 8),
+])
+def test_lzw_round_trip(pixels, min_code_size):
+    assert lzw_decode(Capture.lzw_encode(pixels, min_code_size), min_code_size) == pixels
+
+
+# (framebuffer, frames it is shown for): lores, a repeat, hires, XO-CHIP colours. 'last'
+# over 65535 goes past the 16 bit delay fields
+def screens(last:int):
+    rng = random.Random(3)
+    framebuffer = Framebuffer()
+    for frames in (1, 3, 1, 2):
+        framebuffer.rows[rng.randrange(32)] ^= rng.getrandbits(64)
+        yield framebuffer, frames
+    framebuffer.set_resolution(128, 64)
+    framebuffer.rows[10] = (1 << 128) - 1
+    yield framebuffer, 5
+    framebuffer.set_planes(2)
+    framebuffer.planes[0][20] = 0xff << 60
+    framebuffer.planes[1][21] = 0xff << 64
+    yield framebuffer, last
+
+
+def capture(writer, last:int = 70_000) -> tuple:
+    file = io.BytesIO()
+    recorder = Capture.Capture(writer, file, scale=2)
+    total = 0
+    for framebuffer, frames in screens(last):
+        for _ in range(frames):
+            recorder.add(framebuffer)
+        total += frames
+        final = recorder._pixels(framebuffer)
+    recorder.close()
+    return file.getvalue(), recorder, final, total
+
+
+def test_gif():
+    data, recorder, last, total = capture(Capture.GifWriter)
+    assert data[:6] == b'GIF89a' and data[-1] == 0x3b
+    width, height, flags = struct.unpack_from('<HHB', data, 6)
+    assert (width, height) == (recorder.width, recorder.height)
+    offset = 13 + 3 * (2 << (flags & 7))
+    canvas = bytearray(width * height)
+    delay = 0
+    while data[offset] != 0x3b:
+        if data[offset] == 0x21:
+            if data[offset + 1] == 0xf9:
+                delay += struct.unpack_from('<H', data, offset + 4)[0]
+            offset += 2
+            while data[offset]:
+                offset += data[offset] + 1
+            offset += 1
+            continue
+        x, y, w, h, _ = struct.unpack_from('<HHHHB', data, offset + 1)
+        min_code_size = data[offset + 10]
+        offset += 11
+        blocks = b''
+        while data[offset]:
+            blocks += data[offset + 1:offset + 1 + data[offset]]
+            offset += data[offset] + 1
+        offset += 1
+        pixels = lzw_decode(blocks, min_code_size)
+        assert (x, w, len(pixels)) == (0, width, w * h)
+        canvas[y * width:(y + h) * width] = pixels
+    assert bytes(canvas) == last
+    assert delay == round(total * 100 / Capture.FRAME_RATE)
+
+
+def test_apng():
+    data, recorder, last, total = capture(Capture.ApngWriter)
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    offset = 8
+    chunks = []
+    while offset < len(data):
+        length, = struct.unpack_from('>I', data, offset)
+        kind = data[offset + 4:offset + 8]
+        body = data[offset + 8:offset + 8 + length]
+        assert struct.unpack_from('>I', data, offset + 8 + length)[0] == zlib.crc32(kind + body)
+        chunks.append((kind, body))
+        offset += length + 12
+    assert chunks[0][0] == b'IHDR' and chunks[-1][0] == b'IEND'
+
+    width, height = struct.unpack_from('>II', chunks[0][1])
+    frames, plays = struct.unpack('>II', dict(chunks)[b'acTL'])
+    canvas = bytearray(width * height)
+    sequence = []
+    seconds = 0
+    controls = 0
+    for kind, body in chunks:
+        if kind == b'fcTL':
+            number, w, h, x, y, numerator, denominator = struct.unpack_from('>IIIIIHH', body)
+            sequence.append(number)
+            seconds += numerator / denominator
+            controls += 1
+        elif kind in (b'IDAT', b'fdAT'):
+            if kind == b'fdAT':
+                sequence.append(struct.unpack_from('>I', body)[0])
+                body = body[4:]
+            rows = zlib.decompress(body)
+            stride = w + 1
+            assert len(rows) == stride * h
+            pixels = b''.join(rows[row + 1:row + stride] for row in range(0, len(rows), stride))
+            canvas[y * width:(y + h) * width] = pixels
+    assert frames == controls and plays == 0
+    assert sequence == list(range(len(sequence)))
+    assert bytes(canvas) == last
+    assert seconds == pytest.approx(total / Capture.FRAME_RATE, abs=1)
+
+
+def test_raw():
+    data, recorder, last, total = capture(Capture.RawWriter, last=3)
+    size = recorder.width * recorder.height * 3
+    assert len(data) == total * size
+    palette = Display.PALETTE
+    assert data[-size:] == b''.join(bytes(palette[index]) for index in last)
@@ -0,0 +1,62 @@
+import pytest
+from Disasm import analyze, listing
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+
+XOCHIP = bytes([
+    0x30, 0x00,                 # 200: skip if V0 == 0, over all 4 bytes of
+    0xf0, 0x00, 0x03, 0x00,     # 202: I = 0300
+    0xf2, 0x01,                 # 206: select plane 2
+    0x50, 0x12,                 # 208: store V0..V1
+    0xf0, 0x02,                 # 20A: load audio pattern
+    0xf0, 0x3a,                 # 20C: pitch = V0
+    0x00, 0xd1,                 # 20E: scroll up 1
+    0x12, 0x10,                 # 210: jump 210
+])
+
+
+def test_xochip_opcodes_are_code():
+    index = analyze(XOCHIP, quirks='xochip')
+    assert index['code'] == [0x200, 0x202, 0x206, 0x208, 0x20a, 0x20c, 0x20e, 0x210]
+    assert index['invalid'] == []
+    assert index['data'] == []
+    assert 0x300 in index['sprites']
+    first = index['blocks'][0]
+    assert first['start'] == 0x200 and first['end'] == 0x202
+    assert first['successors'] == [0x202, 0x206]
+    assert 'F000 0300' in listing(XOCHIP, index)
+
+
+def test_xochip_opcodes_are_not_chip8_code():
+    index = analyze(XOCHIP, quirks='chip8')
+    assert 0x202 in index['invalid']
+
+
+def test_large_xochip_rom_lines_up_with_the_machine():
+    # 5 KB, with a sprite past the old 4 KB limit that only F000 nnnn can reach
+    rom = bytearray(5000)
+    rom[0:8] = b'\x1f\x00\x00\x00\x00\x00\x00\x00'    # 200: jump F00
+    rom[0xd00:0xd06] = b'\xf0\x00\x12\x00\x1f\x04'       # F00: I = 1200, F04: jump F04
+    rom[0x1000:0x1002] = b'\xff\xff'                        # 1200: sprite
+    rom = bytes(rom)
+    with pytest.raises(ValueError):
+        analyze(rom, quirks='chip8')
+
+    index = analyze(rom, quirks='xochip')
+    assert index['code'] == [0x200, 0xf00, 0xf04]
+    assert index['size'] == 5000
+    assert 0x1200 in index['sprites']
+    assert index['data'][-1][1] == 0x200 + 5000
+
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), quirks='xochip', jit=True, seed=0)
+    machine.load(rom)
+    machine.prewarm(index)
+    machine.run(100)
+    assert machine.state.pc == 0xf04 and machine.state.index == 0x1200
+
+
+def test_prewarm_rejects_an_index_for_another_instruction_set():
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), quirks='chip8', seed=0)
+    machine.load(XOCHIP)
+    with pytest.raises(ValueError):
+        machine.prewarm(analyze(XOCHIP, quirks='xochip'))
@@ -0,0 +1,69 @@
+import random
+import pytest
+from Framebuffer import Framebuffer
+import FrameStream
+from FrameStream import Encoder, Decoder, rle_encode, rle_decode
+
+
+@pytest.mark.parametrize('data', [
+    b'', b'\0', b'ab', b'aab', b'aaab', b'\0' * 129, b'\0' * 130, b'\xff' * 1000,
+    bytes(range(256)) * 2, b'ab' * 300 + b'\0' * 300 + b'xyz',
+    bytes(random.Random(1).randrange(4) for _ in range(5000)),
+])
+def test_rle_round_trip(data):
+    assert rle_decode(rle_encode(data)) == data
+
+
+def scribble(framebuffer:Framebuffer, rng:random.Random):
+    for rows in framebuffer.planes:
+        for _ in range(rng.randrange(4)):
+            rows[rng.randrange(framebuffer.height)] ^= rng.getrandbits(framebuffer.width)
+
+
+def test_stream_round_trip():
+    rng = random.Random(0)
+    source = Framebuffer()
+    encoder = Encoder(keyframe_interval=20)
+    decoder = Decoder()
+    for frame in range(200):
+        # lores, hires, then XO-CHIP's two bitplanes, then back
+        if frame == 50:
+            source.set_resolution(128, 64)
+        elif frame == 100:
+            source.set_planes(2)
+        elif frame == 150:
+            source.set_resolution(64, 32)
+            source.set_planes(1)
+        scribble(source, rng)
+        decoder.decode(encoder.encode(source))
+        assert (decoder.framebuffer.width, decoder.framebuffer.height) == (source.width, source.height)
+        assert decoder.framebuffer.planes == source.planes
+
+
+def test_unchanged_screen_is_tiny():
+    source = Framebuffer()
+    source.rows[3] = 0xf0f0
+    encoder = Encoder()
+    assert encoder.encode(source)[0] == FrameStream.KEYFRAME
+    assert len(encoder.encode(source)) == 3
+
+
+def test_lost_packet_waits_for_keyframe():
+    rng = random.Random(2)
+    source = Framebuffer()
+    encoder = Encoder()
+    decoder = Decoder()
+    decoder.decode(encoder.encode(source))
+    scribble(source, rng)
+    encoder.encode(source) # lost
+    scribble(source, rng)
+    with pytest.raises(ValueError):
+        decoder.decode(encoder.encode(source))
+    # deltas are refused until a keyframe arrives
+    with pytest.raises(ValueError):
+        decoder.decode(encoder.encode(source))
+    encoder.force_keyframe()
+    decoder.decode(encoder.encode(source))
+    scribble(source, rng)
+    decoder.decode(encoder.encode(source))
+    assert decoder.framebuffer.planes == source.planes
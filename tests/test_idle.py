@@ -0,0 +1,113 @@
+import pytest
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+from Idle import Idle, is_idle_loop
+
+FRAMES = 40
+
+# (rom, keyboard script, address of the closing jump or None for Fx0A). Each ends up in a
+# loop that only waits, so both runs finish the same however the frames were split.
+WAITS = {
+    'jump to self': (bytes([
+        0x60, 0x05, 0xf0, 0x15,     # 200: V0 = 5, delay = V0
+        0xa0, 0x50, 0xd0, 0x15,     # 204: draw a 0
+        0x12, 0x08,                 # 208: jump 208
+    ]), {}, 0x208),
+    'key poll': (bytes([
+        0x63, 0x05,                 # 200: V3 = 5
+        0xe3, 0x9e,                 # 202: skip if key V3 held
+        0x12, 0x02,                 # 204: jump 202
+        0x74, 0x01,                 # 206: V4 += 1
+        0xa0, 0x55, 0xd0, 0x05,     # 208: draw a 1
+        0x12, 0x0c,                 # 20C: jump 20C
+    ]), {20: [5], 25: []}, 0x204),
+    'key poll not pressed': (bytes([
+        0x63, 0x05,                 # 200: V3 = 5
+        0xe3, 0xa1,                 # 202: skip if key V3 not held
+        0x12, 0x02,                 # 204: jump 202
+        0x74, 0x01,                 # 206: V4 += 1
+        0x12, 0x08,                 # 208: jump 208
+    ]), {0: [5], 15: []}, 0x204),
+    'timer poll': (bytes([
+        0x60, 0x10, 0xf0, 0x15,     # 200: delay = 16
+        0xf1, 0x07,                 # 204: V1 = delay
+        0x31, 0x00,                 # 206: skip if V1 == 0
+        0x12, 0x04,                 # 208: jump 204
+        0x74, 0x01,                 # 20A: V4 += 1
+        0x12, 0x0c,                 # 20C: jump 20C
+    ]), {}, 0x208),
+    'timer poll with 4xnn': (bytes([
+        0x60, 0x14, 0xf0, 0x15,     # 200: delay = 20
+        0xf1, 0x07,                 # 204: V1 = delay
+        0x41, 0x14,                 # 206: skip if V1 != 20
+        0x12, 0x04,                 # 208: jump 204
+        0x74, 0x01,                 # 20A: V4 += 1
+        0x12, 0x0c,                 # 20C: jump 20C
+    ]), {}, 0x208),
+    'key wait': (bytes([
+        0xf2, 0x0a,                 # 200: V2 = next key released
+        0x84, 0x24,                 # 202: V4 += V2
+        0x12, 0x00,                 # 204: jump 200
+    ]), {10: [7], 12: [], 30: [9], 31: []}, None),
+}
+
+
+def machine(rom:bytes, script:dict) -> Machine:
+    machine = Machine(NullDisplay(), ScriptedKeyboard(script), NullBeeper(), seed=0, quirks='legacy')
+    machine.load(rom)
+    return machine
+
+
+# every instruction of every frame executed, the way it ran before waits were skipped
+def run_every_instruction(machine:Machine, frames:int):
+    for _ in range(frames):
+        machine.keyboard.get_events()
+        for _ in range(machine.cycles_per_frame):
+            try:
+                machine.step()
+            except Idle:
+                pass
+            machine.cycles += 1
+        machine.tick()
+
+
+@pytest.mark.parametrize('name', sorted(WAITS))
+def test_skipping_matches_running(name):
+    rom, script, jump = WAITS[name]
+    if jump is not None:
+        assert is_idle_loop(rom.rjust(len(rom) + 0x200, b'\0'), jump, (rom[jump - 0x200] & 0xf) << 8
+                            | rom[jump - 0x200 + 1])
+    skipping = machine(rom, script)
+    for _ in range(FRAMES):
+        skipping.run_frame()
+    running = machine(rom, script)
+    run_every_instruction(running, FRAMES)
+
+    assert skipping.idle_frames > 0
+    assert running.idle_frames == 0
+    assert skipping.cycles == running.cycles
+    assert bytes(skipping.state.registers) == bytes(running.state.registers)
+    assert skipping.state.pc == running.state.pc
+    assert (skipping.state.delay_timer, skipping.state.sound_timer) == \
+           (running.state.delay_timer, running.state.sound_timer)
+    assert skipping.display.framebuffer.rows == running.display.framebuffer.rows
+
+
+def test_loop_doing_work_is_not_idle():
+    rom = bytes([
+        0x60, 0x10, 0xf0, 0x15,     # 200: delay = 16
+        0x70, 0x01,                 # 204: V0 += 1
+        0x12, 0x04,                 # 206: jump 204
+        0xf1, 0x07,                 # 208: V1 = delay
+        0x32, 0x00,                 # 20A: skip if V2 == 0, not the register just read
+        0x12, 0x08,                 # 20C: jump 208
+    ])
+    ram = bytes(0x200) + rom
+    assert not is_idle_loop(ram, 0x206, 0x204)
+    assert not is_idle_loop(ram, 0x20c, 0x208)
+
+    busy = machine(rom, {})
+    for _ in range(FRAMES):
+        busy.run_frame()
+    assert busy.idle_frames == 0
+    assert busy.state.registers[0] == (0x10 + (FRAMES * busy.cycles_per_frame - 2) // 2) & 0xff
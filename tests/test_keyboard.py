@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard, MemoryKeyboard
+from Session import QueueKeyboard
+
+
+class Keys:
+
+    def __init__(self, kind:str):
+        self.queue = asyncio.Queue()
+        self.keyboard = {'scripted': ScriptedKeyboard, 'memory': MemoryKeyboard}.get(kind)
+        self.keyboard = self.keyboard() if self.keyboard else QueueKeyboard(self.queue)
+
+    def press(self, key:int):
+        if isinstance(self.keyboard, QueueKeyboard):
+            self.queue.put_nowait((key, True))
+        elif isinstance(self.keyboard, MemoryKeyboard):
+            self.keyboard.press(key)
+        else:
+            self.keyboard.script[self.keyboard.frame + 1] = [key]
+
+    def release(self, key:int):
+        if isinstance(self.keyboard, QueueKeyboard):
+            self.queue.put_nowait((key, False))
+        elif isinstance(self.keyboard, MemoryKeyboard):
+            self.keyboard.release(key)
+        else:
+            self.keyboard.script[self.keyboard.frame + 1] = []
+
+
+@pytest.mark.parametrize('kind', ['scripted', 'memory', 'queue'])
+def test_old_release_does_not_end_a_key_wait(kind):
+    keys = Keys(kind)
+    machine = Machine(NullDisplay(), keys.keyboard, NullBeeper(), seed=0)
+    machine.load(bytes([0x12, 0x00]))                   # 200: jump 200
+    keys.press(7)
+    machine.run_frame()
+    keys.release(7)
+    for _ in range(200):
+        machine.run_frame()
+    assert keys.keyboard.released == []
+
+    machine.load(bytes([0xf2, 0x0a, 0x12, 0x02]))       # 200: V2 = next key released
+    machine.state.pc = 0x200
+    machine.run_frame()
+    assert machine.state.pc == 0x200 and machine.state.registers[2] == 0
+
+    # a release in the frame the wait runs in still ends it
+    keys.press(3)
+    machine.run_frame()
+    keys.release(3)
+    machine.run_frame()
+    assert machine.state.pc == 0x202 and machine.state.registers[2] == 3
+
+
+def test_pygame_keyboard_forgets_old_releases(monkeypatch):
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    pygame = pytest.importorskip('pygame')
+    from Keyboard import Keyboard
+    keyboard = Keyboard()
+    pygame.event.post(pygame.event.Event(pygame.KEYUP, key=Keyboard.keys[7]))
+    keyboard.get_events()
+    assert keyboard.released == [7]
+    keyboard.get_events()
+    assert keyboard.is_pressed() is False
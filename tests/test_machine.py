@@ -0,0 +1,42 @@
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+
+
+def machine(rom:bytes) -> Machine:
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), seed=0, quirks='legacy')
+    machine.load(rom)
+    return machine
+
+
+def test_fx55_over_decoded_code():
+    m = machine(bytes([
+        0x65, 0x00,             # 200: V5 = 0
+        0x75, 0x01,             # 202: V5 += 1, rewritten into V6 = 2A
+        0x60, 0x66,             # 204: V0 = 66
+        0x61, 0x2a,             # 206: V1 = 2A
+        0xa2, 0x02,             # 208: I = 202
+        0xf1, 0x55,             # 20A: store V0, V1 over 202
+        0x12, 0x02,             # 20C: jump 202
+    ]))
+    m.run(7)
+    assert m.decoded[0x202] is None
+    assert m.state.ram[0x202:0x204] == b'\x66\x2a'
+    m.run(1)
+    assert m.state.registers[5] == 1 and m.state.registers[6] == 0x2a
+
+
+def test_fx33_over_decoded_code():
+    m = machine(bytes([
+        0xa2, 0x0b,             # 200: I = 20B
+        0x60, 0xff,             # 202: V0 = 255
+        0x12, 0x0a,             # 204: jump 20A
+        0xf0, 0x33,             # 206: BCD of V0 over 20B: 02 05 05
+        0x12, 0x0a,             # 208: jump 20A
+        0x63, 0x00,             # 20A: V3 = 0, rewritten into V3 = 2
+        0x12, 0x06,             # 20C: jump 206
+    ]))
+    m.run(4)
+    assert m.decoded[0x20a] is not None and m.state.registers[3] == 0
+    m.run(4)
+    assert m.state.ram[0x20a:0x20e] == b'\x63\x02\x05\x05'
+    assert m.state.pc == 0x20c and m.state.registers[3] == 2
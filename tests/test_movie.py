@@ -0,0 +1,102 @@
+import hashlib
+import pytest
+from Machine import Machine
+from Headless import MemoryKeyboard, NullDisplay, NullBeeper
+import Movie as MovieModule
+from Movie import Movie, MovieRecorder, replay
+from Quirks import PROFILES
+
+
+def test_recorder_drains_live_releases():
+    live = MemoryKeyboard()
+    recorder = MovieRecorder(live)
+    for frame in range(100):
+        live.press(frame % 16)
+        recorder.get_events()
+        live.release(frame % 16)
+        recorder.get_events()
+    assert live.released == []
+    # the last frame's release still reaches the game, from the recording
+    assert recorder.is_pressed() == 99 % 16
+
+
+# waits for a key, then draws its digit and moves along
+KEYS_ROM = bytes([
+    0xf0, 0x0a,                 # 200: V0 = next key released
+    0x81, 0x04,                 # 202: V1 += V0
+    0xf0, 0x29,                 # 204: I = digit V0
+    0xd2, 0x35,                 # 206: draw at V2, V3
+    0x72, 0x05,                 # 208: V2 += 5
+    0xc4, 0xff,                 # 20A: V4 = random
+    0x12, 0x00,                 # 20C: jump 200
+])
+
+
+@pytest.mark.parametrize('quirks', sorted(PROFILES) + [PROFILES['chip8'].replace(wrap=True, vf_reset=False)])
+@pytest.mark.parametrize('seed', [0, 2**64 - 1])
+def test_pack_round_trip(quirks, seed):
+    # frame gaps of one to three varint bytes, no keys and every key
+    script = {0: [], 1: [0], 200: [15], 100_000: list(range(16)), 100_001: []}
+    movie = Movie(seed, hashlib.sha1(KEYS_ROM).digest(), 0xffff, quirks, script, length=100_002)
+    copy = Movie.unpack(movie.pack())
+    assert (copy.seed, copy.rom_hash, copy.ips, copy.quirks, copy.script, copy.length) == \
+           (movie.seed, movie.rom_hash, movie.ips, movie.quirks, movie.script, movie.length)
+
+
+def test_unpack_rejects_other_files():
+    with pytest.raises(ValueError):
+        Movie.unpack(b'GIF89a' + bytes(64))
+
+
+def test_replay_matches_recording():
+    live = MemoryKeyboard()
+    recorder = MovieRecorder(live)
+    machine = Machine(NullDisplay(), recorder, NullBeeper(), seed=1234, quirks='chip8')
+    machine.load(KEYS_ROM)
+    for frame in range(120):
+        if frame % 10 == 3:
+            live.press(frame % 16)
+        elif frame % 10 == 5:
+            live.release((frame - 2) % 16)
+        machine.run_frame()
+    movie = Movie.unpack(recorder.movie(machine, KEYS_ROM).pack())
+
+    replayed, stats = replay(movie, KEYS_ROM)
+    assert replayed.frames == machine.frames
+    assert bytes(replayed.state.registers) == bytes(machine.state.registers)
+    assert replayed.display.framebuffer.rows == machine.display.framebuffer.rows
+    assert machine.state.registers[1] != 0
+
+
+def test_replay_refuses_another_rom():
+    movie = Movie(0, hashlib.sha1(KEYS_ROM).digest(), 700, 'chip8')
+    with pytest.raises(ValueError):
+        replay(movie, KEYS_ROM + b'\0')
+
+
+def test_high_ips_round_trip():
+    live = MemoryKeyboard()
+    recorder = MovieRecorder(live)
+    machine = Machine(NullDisplay(), recorder, NullBeeper(), seed=5, ips=120_000, quirks='chip8')
+    machine.load(KEYS_ROM)
+    live.press(4)
+    machine.run_frame()
+    live.release(4)
+    machine.run_frame()
+    movie = Movie.unpack(recorder.movie(machine, KEYS_ROM).pack())
+    assert movie.ips == 120_000
+    replayed, stats = replay(movie, KEYS_ROM)
+    assert bytes(replayed.state.registers) == bytes(machine.state.registers)
+
+    assert Movie(0, bytes(20), MovieModule.MAX_IPS, 'chip8').pack()
+    with pytest.raises(ValueError):
+        Movie(0, bytes(20), MovieModule.MAX_IPS + 1, 'chip8')
+
+
+def test_unpacks_version_3():
+    movie = Movie(9, bytes(20), 700, 'chip48', {0: [], 5: [1, 2]}, length=10)
+    blob = movie.pack()
+    header = MovieModule.HEADER.unpack_from(blob)
+    old = MovieModule.V3_HEADER.pack(header[0], 3, *header[2:]) + blob[MovieModule.HEADER.size:]
+    copy = Movie.unpack(old)
+    assert (copy.seed, copy.ips, copy.quirks, copy.script, copy.length) == (9, 700, movie.quirks, movie.script, 10)
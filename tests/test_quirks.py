@@ -0,0 +1,110 @@
+import json
+import hashlib
+import pytest
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+import Quirks
+from Quirks import PROFILES, resolve
+
+
+def test_resolve():
+    assert resolve(None) is PROFILES[Quirks.DEFAULT]
+    assert resolve('schip') is PROFILES['schip']
+    custom = PROFILES['chip8'].replace(wrap=True)
+    assert resolve(custom) is custom
+    quirks = resolve({'profile': 'chip48', 'vf_reset': True})
+    assert quirks.name == 'custom' and quirks.vf_reset and quirks.jump_vx
+    assert resolve({'profile': 'chip48'}) is PROFILES['chip48']
+    assert resolve({'wrap': True}) == PROFILES[Quirks.DEFAULT].replace(wrap=True)
+
+
+@pytest.mark.parametrize('quirks', ['cosmac', {'profile': 'chip8', 'colour': True}, {'instructions': 'mega'}])
+def test_resolve_rejects(quirks):
+    with pytest.raises(ValueError):
+        resolve(quirks)
+
+
+def test_replace_and_compare():
+    assert PROFILES['chip8'].replace().name == 'chip8'
+    assert PROFILES['chip8'].replace(wrap=False) == PROFILES['chip8']
+    assert PROFILES['chip8'] != PROFILES['chip48']
+    assert PROFILES['xochip'].memory == 0x10000
+    assert PROFILES['schip'].memory == 0x1000
+
+
+def test_database(tmp_path):
+    rom = bytes([0x12, 0x00])
+    path = tmp_path / 'quirks.json'
+    path.write_text(json.dumps({hashlib.sha1(rom).hexdigest().upper(): {'profile': 'schip', 'wrap': True}}))
+    database = Quirks.load_database(str(path))
+    assert Quirks.for_rom(rom, database) == PROFILES['schip'].replace(wrap=True)
+    assert Quirks.for_rom(rom + b'\0', database, 'chip48') is PROFILES['chip48']
+
+
+def run(rom:bytes, quirks, cycles:int) -> Machine:
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), quirks=quirks, seed=0)
+    machine.load(rom)
+    machine.run(cycles)
+    return machine
+
+
+# one rom per quirk, and what it leaves behind with the quirk off and on
+def test_shift_vy():
+    rom = bytes([0x61, 0x05, 0x60, 0x03, 0x80, 0x16])   # V1 = 5, V0 = 3, V0 = V1 >> 1 or V0 >> 1
+    for quirks in PROFILES.values():
+        assert run(rom, quirks, 3).state.registers[0] == (2 if quirks.shift_vy else 1)
+
+
+def test_jump_vx():
+    rom = bytes([0x62, 0x04, 0xb2, 0x10])               # V2 = 4, jump 210 + V0 or 210 + V2
+    for quirks in PROFILES.values():
+        assert run(rom, quirks, 2).state.pc == (0x214 if quirks.jump_vx else 0x210)
+
+
+def test_vf_reset():
+    rom = bytes([0x6f, 0x07, 0x80, 0x11])               # VF = 7, V0 |= V1
+    for quirks in PROFILES.values():
+        assert run(rom, quirks, 2).state.registers[0xf] == (0 if quirks.vf_reset else 7)
+
+
+def test_memory_increment():
+    rom = bytes([0xa3, 0x00, 0xf2, 0x55, 0xf2, 0x65])   # I = 300, store V0..V2, load them back
+    for quirks in PROFILES.values():
+        step = 0 if quirks.memory_increment is None else 2 + quirks.memory_increment
+        assert run(rom, quirks, 3).state.index == 0x300 + 2 * step
+
+
+def test_display_wait():
+    rom = bytes([0xa0, 0x50, 0xd0, 0x05, 0x7a, 0x01, 0x12, 0x04]) # draw, then count in VA
+    for quirks in PROFILES.values():
+        machine = run(rom, quirks, 0)
+        machine.run_frame()
+        assert (machine.state.registers[0xa] == 0) == quirks.display_wait
+
+
+def test_wrap():
+    rom = bytes([0x60, 0x3e, 0xa0, 0x50, 0xd0, 0x15])   # V0 = 62, draw a 0 at 62, 0
+    for quirks in PROFILES.values():
+        framebuffer = run(rom, quirks, 3).display.framebuffer
+        assert framebuffer.get_pixel(63, 0)
+        assert framebuffer.get_pixel(0, 0) == (1 if quirks.wrap else 0)
+
+
+def test_instructions():
+    rom = bytes([0x00, 0xff])                           # SUPER-CHIP hi-res
+    for quirks in PROFILES.values():
+        if quirks.instructions == 'chip8':
+            with pytest.raises(SyntaxError):
+                run(rom, quirks, 1)
+        else:
+            assert run(rom, quirks, 1).display.framebuffer.width == 128
+
+
+def test_wrap_start():
+    rom = bytes([0x60, 0x42, 0x61, 0x21, 0xa0, 0x50, 0xd0, 0x15])   # draw a 0 at 66, 33
+    for quirks in PROFILES.values():
+        framebuffer = run(rom, quirks, 4).display.framebuffer
+        wraps = quirks.wrap_start or quirks.wrap or quirks.instructions != 'chip8'
+        # the 0's top row is 4 pixels lit, from 2, 1 when the start wraps
+        assert framebuffer.get_pixel(2, 1) == (1 if wraps else 0)
+        assert any(framebuffer.rows) == wraps
@@ -0,0 +1,81 @@
+import pytest
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+import bench
+
+# every block rewrites the instruction at 20C, in the same block, before running it
+SELF_MODIFYING = bytes([
+    0xa2, 0x0c,                 # 200: I = 20C
+    0x60, 0x62,                 # 202: V0 = 62
+    0x81, 0x30,                 # 204: V1 = V3
+    0x73, 0x01,                 # 206: V3 += 1
+    0xf1, 0x55,                 # 208: store V0, V1 at 20C
+    0x64, 0x00,                 # 20A: V4 = 0
+    0x62, 0x00,                 # 20C: V2 = 0, rewritten into V2 = old V3
+    0x12, 0x00,                 # 20E: jump 200
+])
+
+
+def machines(rom:bytes, quirks:str):
+    pair = []
+    for jit in (False, True):
+        machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), seed=0, jit=jit, quirks=quirks)
+        machine.load(rom)
+        pair.append(machine)
+    return pair
+
+
+def assert_same(interpreter, jit):
+    assert bytes(jit.state.registers) == bytes(interpreter.state.registers)
+    assert jit.state.index == interpreter.state.index
+    assert jit.state.pc == interpreter.state.pc
+    assert jit.state.ram == interpreter.state.ram
+    assert jit.display.framebuffer.rows == interpreter.display.framebuffer.rows
+
+
+@pytest.mark.parametrize('quirks', ['legacy', 'chip8', 'schip', 'xochip'])
+@pytest.mark.parametrize('workload', sorted(bench.WORKLOADS))
+def test_matches_interpreter(workload, quirks):
+    interpreter, jit = machines(bench.WORKLOADS[workload], quirks)
+    for _ in range(30):
+        interpreter.run_frame()
+        jit.run_frame()
+        assert_same(interpreter, jit)
+
+
+@pytest.mark.parametrize('quirks', ['legacy', 'chip8'])
+def test_self_modifying_block(quirks):
+    interpreter, jit = machines(SELF_MODIFYING, quirks)
+    jit.recompiler.prewarm([0x200])
+    for _ in range(30):
+        interpreter.run_frame()
+        jit.run_frame()
+        assert_same(interpreter, jit)
+    assert jit.state.registers[2] != 0
+
+
+def test_store_out_of_memory():
+    rom = bytes([0x6a, 0x07, 0xaf, 0xff, 0xf1, 0x55, 0x12, 0x00]) # VA = 7, I = FFF, store V0, V1
+    interpreter, jit = machines(rom, 'chip8')
+    jit.recompiler.prewarm([0x200])
+    for machine in (interpreter, jit):
+        with pytest.raises(OverflowError):
+            machine.run_frame()
+    assert jit.state.registers[0xa] == 7
+    assert jit.state.index == interpreter.state.index
+    assert jit.state.pc == interpreter.state.pc
+
+
+@pytest.mark.parametrize('rom', [
+    bytes([0x6a, 0x07, 0x22, 0x00]),    # VA = 7, call 200: overflows the stack
+    bytes([0x6a, 0x07, 0x00, 0xee]),    # VA = 7, return with nothing to return to
+], ids=['overflow', 'underflow'])
+def test_stack_error_in_block(rom):
+    interpreter, jit = machines(rom, 'chip8')
+    jit.recompiler.prewarm([0x200])
+    for machine in (interpreter, jit):
+        with pytest.raises(IndexError):
+            machine.run(100)
+    assert jit.state.registers[0xa] == 7
+    assert jit.state.pc == interpreter.state.pc == 0x204
+    assert jit.state.sp == interpreter.state.sp
@@ -0,0 +1,58 @@
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+from Rewind import Rewind
+
+# count a while in lo-res, switch to hi-res (00FF) and draw, then back to lo-res (00FE)
+ROM = bytes([
+    0x00, 0xe0,     # 200: clear
+    0x70, 0x01,     # 202: V0 += 1
+    0x30, 0x10,     # 204: skip if V0 == 0x10
+    0x12, 0x02,     # 206: jump 202
+    0x00, 0xff,     # 208: hi-res
+    0xa0, 0x50,     # 20A: I = font
+    0xd0, 0x15,     # 20C: draw 5 rows at V0, V1
+    0x70, 0x01,     # 20E: V0 += 1
+    0x30, 0x30,     # 210: skip if V0 == 0x30
+    0x12, 0x0c,     # 212: jump 20C
+    0x00, 0xfe,     # 214: lo-res
+    0x12, 0x16,     # 216: jump 216
+])
+
+
+def test_rewind_across_resolution_changes():
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), quirks='schip', ips=120, seed=0)
+    machine.load(ROM)
+    rewind = Rewind(machine)
+    images = [machine.snapshot().pack()]
+    widths = set()
+    for _ in range(40):
+        machine.run_frame()
+        rewind.record()
+        images.append(machine.snapshot().pack())
+        widths.add(machine.display.framebuffer.width)
+    assert widths == {64, 128}
+
+    for frame in reversed(range(len(images))):
+        rewind.seek(frame)
+        assert machine.snapshot().pack() == images[frame]
+    while rewind.step_forward():
+        assert machine.snapshot().pack() == images[rewind.frame]
+    assert rewind.frame == len(images) - 1
+
+
+def test_recording_after_rewind_across_a_resolution_change():
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), quirks='schip', ips=120, seed=0)
+    machine.load(ROM)
+    rewind = Rewind(machine)
+    for _ in range(40):
+        machine.run_frame()
+        rewind.record()
+    rewind.seek(5)
+    assert machine.display.framebuffer.width == 64
+    for _ in range(40):
+        machine.run_frame()
+        rewind.record()
+    final = machine.snapshot().pack()
+    rewind.seek(5)
+    rewind.seek(rewind.newest)
+    assert machine.snapshot().pack() == final
@@ -0,0 +1,105 @@
+import os
+import hashlib
+import pytest
+from RomLibrary import RomLibrary, detect, title
+
+PONG = bytes([0x60, 0x01, 0x12, 0x00])
+SCHIP = bytes([0x00, 0xff, 0x00, 0xfe, 0x12, 0x04])
+
+
+def sha1(rom:bytes) -> str:
+    return hashlib.sha1(rom).hexdigest()
+
+
+def write(path, rom:bytes):
+    stat = os.stat(path) if path.exists() else None
+    path.write_bytes(rom)
+    if stat is not None:
+        # a rewrite within the filesystem's timestamp resolution still has to look changed
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def roms(tmp_path):
+    write(tmp_path / 'Pong [Paul Vervalin].ch8', PONG)
+    (tmp_path / 'schip').mkdir()
+    write(tmp_path / 'schip' / 'Scroll_Test (alt).ch8', SCHIP)
+    write(tmp_path / 'notes.txt', b'not a rom')
+    return tmp_path
+
+
+def test_detect_and_title():
+    assert detect(PONG) == 'chip8'
+    assert detect(PONG, '.sc8') == 'schip'
+    assert detect(SCHIP) == 'schip'
+    assert detect(bytes(0x1000)) == 'xochip'
+    assert title('roms/15 Puzzle [Roger Ivie] (alt).ch8') == '15 Puzzle'
+
+
+def test_scan(roms):
+    library = RomLibrary()
+    assert library.scan([roms]) == (2, 2)
+    assert len(library) == 2 and sha1(PONG) in library
+    assert library.entry(sha1(PONG))['title'] == 'Pong'
+    assert library.entry(sha1(SCHIP))['platform'] == 'schip'
+    assert library.quirks(sha1(SCHIP)).name == 'schip'
+    assert bytes(library.rom(sha1(PONG))) == PONG
+
+    # nothing changed, nothing hashed
+    assert library.scan([roms]) == (2, 0)
+
+
+def test_rescan_after_add_change_and_remove(roms):
+    library = RomLibrary()
+    library.scan([roms])
+
+    write(roms / 'copy.ch8', PONG)
+    write(roms / 'new.ch8', PONG + b'\0\0')
+    assert library.scan([roms]) == (4, 2)
+    assert len(library) == 3
+
+    pong = roms / 'Pong [Paul Vervalin].ch8'
+    changed = bytes([0x61, 0x02, 0x12, 0x00])
+    write(pong, changed)
+    assert library.scan([roms]) == (4, 1)
+    # still in the copy
+    assert library.entry(sha1(PONG))['path'] == str(roms / 'copy.ch8')
+    assert bytes(library.rom(sha1(changed))) == changed
+
+    os.remove(roms / 'copy.ch8')
+    os.remove(roms / 'new.ch8')
+    assert library.scan([roms]) == (2, 0)
+    assert sha1(PONG) not in library and sha1(PONG + b'\0\0') not in library
+    assert sha1(changed) in library and sha1(SCHIP) in library
+
+
+def test_rom_changed_under_its_mapping(roms):
+    library = RomLibrary()
+    library.scan([roms])
+    pong = roms / 'Pong [Paul Vervalin].ch8'
+    view = library.rom(sha1(PONG))
+    assert bytes(view) == PONG
+    del view
+
+    changed = bytes([0x61, 0x02, 0x12, 0x00])
+    write(pong, changed)
+    with pytest.raises(ValueError):
+        library.rom(sha1(PONG))
+    assert sha1(PONG) not in library.open_roms
+
+    library.scan([roms])
+    assert bytes(library.rom(sha1(changed))) == changed
+    with pytest.raises(KeyError):
+        library.rom(sha1(PONG))
+
+
+def test_save_and_load(roms, tmp_path):
+    library = RomLibrary()
+    library.scan([roms])
+    index = str(tmp_path / 'roms.json')
+    library.save(index)
+
+    loaded = RomLibrary.load(index)
+    assert loaded.roms == library.roms and loaded.files == library.files
+    assert loaded.scan([roms]) == (2, 0)
+    assert bytes(loaded.rom(sha1(SCHIP))) == SCHIP
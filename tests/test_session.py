@@ -0,0 +1,70 @@
+import asyncio
+from Session import Session
+
+# waits for a key, draws its digit and beeps for 4 frames
+ROM = bytes([
+    0xf2, 0x0a,                 # 200: V2 = next key released
+    0xf2, 0x29,                 # 202: I = digit V2
+    0xd1, 0x15,                 # 204: draw it at 0, 0
+    0x63, 0x04, 0xf3, 0x18,     # 206: sound = 4
+    0x12, 0x0a,                 # 20A: jump 20A
+])
+
+
+def drain(queue:asyncio.Queue) -> list:
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_keys_frames_and_beeps():
+    async def run():
+        session = Session(ROM, realtime=False)
+        events = session.subscribe(100)
+        await session.run(10)
+        assert drain(events) == [('end', 10, None)]
+        assert session.machine.state.pc == 0x200
+
+        session.press(5)
+        session.release(5)
+        await session.run(10)
+        return session, drain(events)
+
+    session, events = asyncio.run(run())
+    framebuffer = session.machine.display.framebuffer
+    assert session.machine.state.registers[2] == 5
+    assert events == [
+        ('frame', 11, framebuffer.width, framebuffer.height, framebuffer.to_bytes()),
+        ('beep', 11, True),
+        ('beep', 14, False),
+        ('end', 20, None),
+    ]
+
+
+def test_stop_ends_the_session():
+    async def run():
+        session = Session(ROM, realtime=False)
+        events = session.subscribe(100)
+        task = asyncio.create_task(session.run())
+        await asyncio.sleep(0)
+        assert session.running
+        session.stop()
+        await task
+        return session, drain(events)
+
+    session, events = asyncio.run(run())
+    assert not session.running
+    assert events == [('end', session.machine.frames, None)]
+
+
+def test_slow_subscriber_keeps_the_newest_events():
+    async def run():
+        session = Session(ROM, realtime=False)
+        events = session.subscribe(2)
+        session.press(1)
+        session.release(1)
+        await session.run(10)
+        return drain(events)
+
+    assert asyncio.run(run()) == [('beep', 4, False), ('end', 10, None)]
@@ -0,0 +1,50 @@
+import pytest
+from Machine import Machine, TIMER_HZ, MAX_CYCLES_PER_FRAME
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+import Snapshot
+
+# draws random digits forever: V0 = rand, I = font digit, draw, jump back
+ROM = bytes([0xc0, 0x0f, 0xf0, 0x29, 0xd0, 0x05, 0x12, 0x00])
+
+
+def machine(**kwargs):
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), **kwargs)
+    machine.load(ROM)
+    return machine
+
+
+@pytest.mark.parametrize('seed, ips', [(0, 1), ((1 << 64) - 1, MAX_CYCLES_PER_FRAME * TIMER_HZ),
+                                       (12345, 700)])
+def test_round_trip_at_field_limits(seed, ips):
+    source = machine(seed=seed, ips=ips)
+    for _ in range(3):
+        source.step()
+    snapshot = source.snapshot()
+    assert vars(Snapshot.Snapshot.unpack(snapshot.pack())) == vars(snapshot)
+
+
+def test_restore_continues_identically():
+    source = machine(seed=7, quirks='xochip')
+    source.run(500)
+    blob = source.snapshot().pack()
+    source.run(2000)
+
+    copy = machine(seed=1, quirks='xochip')
+    copy.restore(Snapshot.Snapshot.unpack(blob))
+    copy.run(2000)
+    assert copy.snapshot().pack() == source.snapshot().pack()
+
+
+def test_version_2_still_unpacks():
+    snapshot = machine(seed=3).snapshot()
+    blob = snapshot.pack()
+    header = Snapshot.HEADER.unpack_from(blob)
+    old = Snapshot.OLD_HEADER.pack(header[0], 2, *header[2:]) + blob[Snapshot.HEADER.size:]
+    assert vars(Snapshot.Snapshot.unpack(old)) == vars(snapshot)
+
+
+@pytest.mark.parametrize('kwargs', [{'seed': -1}, {'seed': 1 << 64},
+                                    {'ips': (MAX_CYCLES_PER_FRAME + 1) * TIMER_HZ}])
+def test_unsnapshottable_machines_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        machine(**kwargs)
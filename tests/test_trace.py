@@ -0,0 +1,89 @@
+import pytest
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+import Trace
+
+ROM = bytes([
+    0x60, 0x00,                 # 200: V0 = 0
+    0xa3, 0x00,                 # 202: I = 300
+    0x70, 0x01,                 # 204: V0 += 1
+    0x81, 0x00,                 # 206: V1 = V0
+    0xf1, 0x55,                 # 208: store V0, V1
+    0x12, 0x04,                 # 20A: jump 204
+])
+
+
+def machine(jit:bool = False):
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), seed=0, jit=jit)
+    machine.load(ROM)
+    return machine
+
+
+def test_file_round_trip(tmp_path):
+    filename = str(tmp_path / 'run.c8t')
+    # a small buffer, so the file is written in several pieces
+    written = Trace.Trace(filename, capacity=7)
+    first = machine()
+    written.attach(first)
+    first.run(500)
+    written.close()
+
+    ring = Trace.Trace(capacity=1000)
+    second = machine()
+    ring.attach(second)
+    second.run(500)
+
+    records = list(Trace.load(filename))
+    assert len(records) == 500
+    assert records == list(ring.records())
+    assert records[0] == (0, 0x200, 0x6000, 0, 0, bytes(16))
+    frame, pc, opcode, index, changed, registers = records[4]
+    assert (pc, opcode, index, changed) == (0x208, 0xf155, 0x300, 0)
+    assert registers[:2] == b'\1\1'
+    assert records[3][4] == 0b10
+
+
+def test_ring_keeps_the_latest():
+    ring = Trace.Trace(capacity=8)
+    traced = machine()
+    ring.attach(traced)
+    traced.run(100)
+    full = Trace.Trace(capacity=1000)
+    traced = machine()
+    full.attach(traced)
+    traced.run(100)
+
+    records = list(ring.records())
+    assert ring.wrapped and 4 <= len(records) <= 8
+    assert records == list(full.records())[-len(records):]
+
+
+def test_start_stop_limit():
+    trace = Trace.Trace(capacity=100, start=0x208, stop=0x204)
+    traced = machine()
+    trace.attach(traced)
+    traced.run(50)
+    assert [record[1] for record in trace.records()] == [0x208, 0x20a, 0x204]
+
+    trace = Trace.Trace(capacity=100, limit=10)
+    traced = machine()
+    trace.attach(traced)
+    traced.run(50)
+    assert len(list(trace.records())) == 10
+
+
+def test_detach_brings_the_recompiler_back():
+    traced = machine(jit=True)
+    trace = Trace.Trace(capacity=100)
+    trace.attach(traced)
+    assert traced.recompiler is None
+    trace.close()
+    assert traced.recompiler is not None
+    traced.run(100)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'movie.c8m'
+    path.write_bytes(b'C8MV' + bytes(64))
+    with pytest.raises(ValueError):
+        Trace.load(str(path))
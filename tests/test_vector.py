@@ -0,0 +1,76 @@
+import pytest
+from Machine import Machine
+from Headless import NullDisplay, NullBeeper, ScriptedKeyboard
+import Quirks
+
+np = pytest.importorskip('numpy')
+from VectorMachine import VectorMachine
+
+# touches every quirk: a sprite over the bottom right corner (wrap), VF after 8xy1
+# (vf_reset), 8xy6 (shift_vy), I after Fx55/Fx65 (memory_increment), Bnnn (jump_vx) and
+# several draws in one frame (display_wait)
+ROM = bytes([
+    0x6a, 0x3c, 0x6b, 0x1e,     # 200: VA = 60, VB = 30
+    0xa0, 0x50, 0xda, 0xb5,     # 204: I = font 0, draw at VA, VB
+    0x6f, 0x07, 0x60, 0x05,     # 208: VF = 7, V0 = 5
+    0x61, 0x03, 0x80, 0x11,     # 20C: V1 = 3, V0 |= V1
+    0x8e, 0xf0, 0x82, 0x16,     # 210: VE = VF, V2 = V1 >> 1 (or V2 >> 1)
+    0xa3, 0x00, 0xf2, 0x55,     # 214: I = 300, store V0..V2
+    0xf2, 0x65, 0xd0, 0x15,     # 218: load V0..V2, draw at V0, V1 from wherever I is now
+    0x60, 0x00, 0x62, 0x02,     # 21C: V0 = 0, V2 = 2
+    0xb2, 0x24,                 # 220: jump 224 + V0, or 224 + V2
+    0x67, 0x01,                 # 222: not reached
+    0x68, 0x01,                 # 224: V8 = 1, skipped by jump_vx
+    0x69, 0x01,                 # 226: V9 = 1
+    0x12, 0x28,                 # 228: jump 228
+])
+
+
+@pytest.mark.parametrize('quirks', ['legacy', 'chip8', 'chip48', Quirks.PROFILES['chip8'].replace(wrap=True)])
+def test_matches_machine(quirks):
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), quirks=quirks, ips=600, seed=0)
+    machine.load(ROM)
+    vector = VectorMachine(3, quirks=quirks, ips=600, seed=0)
+    vector.load(ROM)
+
+    for _ in range(6):
+        machine.run_frame()
+        vector.run_frame()
+        for instance in range(3):
+            assert bytes(vector.registers[instance]) == bytes(machine.state.registers)
+            assert vector.index[instance] == machine.state.index
+            assert vector.pc[instance] == machine.state.pc
+            assert [int(row) for row in vector.screen[instance]] == machine.display.framebuffer.rows
+    assert not vector.halted.any()
+
+
+def test_refuses_other_instruction_sets():
+    with pytest.raises(ValueError):
+        VectorMachine(1, quirks='schip')
+
+
+def test_old_release_does_not_end_a_key_wait():
+    vector = VectorMachine(1, ips=600, seed=0)
+    vector.load(bytes([0xf2, 0x0a, 0x12, 0x02]))        # 200: V2 = next key released
+    keys = np.zeros((1, 16), bool)
+    keys[0, 7] = True
+    vector.set_keys(keys)
+    vector.set_keys(np.zeros((1, 16), bool))
+    vector.pc[0] = 0x202                                # released while not waiting
+    vector.run_frame()
+    vector.pc[0] = 0x200
+    vector.run_frame()
+    assert vector.pc[0] == 0x200 and vector.registers[0, 2] == 0
+
+
+@pytest.mark.parametrize('quirks', ['legacy', 'chip8', 'chip48'])
+def test_wrapped_start_matches_machine(quirks):
+    rom = bytes([0x60, 0x42, 0x61, 0x3f, 0xa0, 0x50, 0xd0, 0x15, 0x12, 0x08])  # draw a 0 at 66, 63
+    machine = Machine(NullDisplay(), ScriptedKeyboard(), NullBeeper(), quirks=quirks, ips=600, seed=0)
+    machine.load(rom)
+    machine.run_frame()
+    vector = VectorMachine(1, quirks=quirks, ips=600, seed=0)
+    vector.load(rom)
+    vector.run_frame()
+    assert [int(row) for row in vector.screen[0]] == machine.display.framebuffer.rows
+    assert any(machine.display.framebuffer.rows) == Quirks.resolve(quirks).wrap_start